@@ -0,0 +1,212 @@
+"""A local TLS stub that speaks HTTP/2 and HTTP/1.1, for comparing the broker's transports.
+
+The protocol is agreed per connection with ALPN, so the same port serves the requests
+transport over HTTP/1.1 and the http2 transport over HTTP/2. Every path answers with a
+small JSON page after the configured latency. Requests are answered concurrently, so
+requests multiplexed on one HTTP/2 connection don't wait for each other. Counts of
+connections, requests, and the most requests in flight on one connection are served
+from /__stats, and reset with a POST to /__reset.
+
+    python -m benchmarks.h2_server --port 8443 --latency-ms 20
+
+It uses a throwaway self-signed certificate made with the openssl command, so point the
+connectors at it with VERIFY_SSL=false.
+"""
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import subprocess
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+import h2.config
+import h2.connection
+import h2.events
+
+
+class StubState:
+    """The stub's settings and what it has served"""
+
+    def __init__(self, latency_ms: float, records: int, record_bytes: int) -> None:
+        self.latency: float = latency_ms / 1000
+        self.body: bytes = json.dumps({
+            'results': [{'id': i, 'value': f'record-{i}', 'padding': 'x' * record_bytes} for i in range(records)],
+            'total': records,
+            'has_more': False,
+        }).encode()
+        self.reset()
+
+    def reset(self) -> None:
+        self.stats: Dict[str, Any] = {'connections': 0, 'requests': 0, 'http2_connections': 0,
+                                      'max_streams_in_flight': 0}
+
+    async def respond(self, path: str) -> Tuple[int, bytes]:
+        """The status and body for a request path"""
+
+        if path.startswith('/__stats'):
+            return 200, json.dumps(self.stats).encode()
+        if path.startswith('/__reset'):
+            self.reset()
+            return 200, b'{}'
+
+        self.stats['requests'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return 200, self.body
+
+
+class H2Connection:
+    """Serves one HTTP/2 connection, answering each stream in its own task"""
+
+    def __init__(self, state: StubState, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.state: StubState = state
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.connection: h2.connection.H2Connection = h2.connection.H2Connection(
+            h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        self.requests: Dict[int, str] = {}
+        self.in_flight: int = 0
+        # Set whenever the peer opens up its flow control window
+        self.window_opened: asyncio.Event = asyncio.Event()
+
+    async def serve(self) -> None:
+        self.connection.initiate_connection()
+        await self.flush()
+
+        tasks: List[asyncio.Task] = []
+        while True:
+            data: bytes = await self.reader.read(65536)
+            if not data:
+                break
+            for event in self.connection.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    self.requests[event.stream_id] = dict(event.headers).get(':path', '/')
+                elif isinstance(event, h2.events.DataReceived):
+                    self.connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    tasks.append(asyncio.ensure_future(self.answer(event.stream_id)))
+                elif isinstance(event, h2.events.WindowUpdated):
+                    self.window_opened.set()
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    break
+            await self.flush()
+
+        for task in tasks:
+            task.cancel()
+
+    async def answer(self, stream_id: int) -> None:
+        self.in_flight += 1
+        self.state.stats['max_streams_in_flight'] = max(self.state.stats['max_streams_in_flight'], self.in_flight)
+        try:
+            status, body = await self.state.respond(self.requests.pop(stream_id))
+        finally:
+            self.in_flight -= 1
+
+        self.connection.send_headers(stream_id, [(':status', str(status)), ('content-type', 'application/json'),
+                                                 ('content-length', str(len(body)))])
+        while body:
+            window: int = min(self.connection.local_flow_control_window(stream_id),
+                              self.connection.max_outbound_frame_size)
+            if window <= 0:
+                self.window_opened.clear()
+                await self.flush()
+                await self.window_opened.wait()
+                continue
+            self.connection.send_data(stream_id, body[:window])
+            body = body[window:]
+        self.connection.end_stream(stream_id)
+        await self.flush()
+
+    async def flush(self) -> None:
+        data: bytes = self.connection.data_to_send()
+        if data:
+            self.writer.write(data)
+            await self.writer.drain()
+
+
+async def serve_http1(state: StubState, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Serve one kept-alive HTTP/1.1 connection, a request at a time"""
+
+    while True:
+        try:
+            head: bytes = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+        lines: List[str] = head.decode('latin-1').split('\r\n')
+        path: str = lines[0].split(' ')[1]
+        headers: Dict[str, str] = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length: int = int(headers.get('content-length') or 0)
+        if length:
+            await reader.readexactly(length)
+
+        status, body = await state.respond(path)
+        writer.write(f'HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await writer.drain()
+
+
+def make_certificate(directory: str) -> Tuple[str, str]:
+    """Create a self-signed certificate for localhost with the openssl command
+
+    Returns:
+        Tuple[str, str]: the certificate and key paths
+    """
+
+    certificate: str = os.path.join(directory, 'cert.pem')
+    key: str = os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key, '-out', certificate,
+                    '-days', '1', '-subj', '/CN=localhost'], check=True, capture_output=True)
+
+    return certificate, key
+
+
+async def serve(host: str, port: int, state: StubState) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        context: ssl.SSLContext = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(*make_certificate(directory))
+        context.set_alpn_protocols(['h2', 'http/1.1'])
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        state.stats['connections'] += 1
+        try:
+            if writer.get_extra_info('ssl_object').selected_alpn_protocol() == 'h2':
+                state.stats['http2_connections'] += 1
+                await H2Connection(state, reader, writer).serve()
+            else:
+                await serve_http1(state, reader, writer)
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    server: asyncio.base_events.Server = await asyncio.start_server(handle, host, port, ssl=context, backlog=1024)
+    host, port = server.sockets[0].getsockname()[:2]
+    # The benchmark reads the address from this first line
+    print(f'https://{host}:{port}', flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='0 picks a free port')
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--records', type=int, default=10)
+    parser.add_argument('--record-bytes', type=int, default=256)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, StubState(args.latency_ms, args.records, args.record_bytes)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
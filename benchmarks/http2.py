@@ -0,0 +1,155 @@
+"""Compare the broker's HTTP transports against the local HTTP/2 stub, offline.
+
+The stub (benchmarks.h2_server) runs in its own process. For each transport set with
+PPP_HTTP_TRANSPORT, many urlscan searches are sent at once from threads, and from
+coroutines through the async connectors. Requests/sec, latency percentiles, and how many
+connections the stub accepted, and of those how many spoke HTTP/2, are reported as JSON.
+
+    python -m benchmarks.http2
+    python -m benchmarks.http2 --requests 1000 --concurrency 64 --latency-ms 50
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import ssl
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List
+from urllib.request import Request, urlopen
+from .throughput import CREDENTIALS, _percentile, _run_async, _run_sync
+
+TRANSPORTS: List[str] = ['requests', 'httpx', 'http2']
+MODES: List[str] = ['threaded', 'async']
+
+# The stub's certificate is self-signed
+_UNVERIFIED: ssl.SSLContext = ssl._create_unverified_context()
+
+
+def _server_call(base_url: str, path: str, method: str = 'GET') -> Dict[str, Any]:
+    with urlopen(Request(f'{base_url}{path}', method=method, data=b'' if method == 'POST' else None),
+                 context=_UNVERIFIED) as response:
+        return json.loads(response.read())
+
+
+def run_scenario(transport: str, mode: str, base_url: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Send `requests` searches with one transport in one mode, and summarise how it went"""
+
+    from ppp_connectors import urlscan
+    from ppp_connectors.broker import close_sessions
+    from ppp_connectors.helpers import reload_config
+
+    os.environ['PPP_HTTP_TRANSPORT'] = transport
+    reload_config()
+    close_sessions()
+    _server_call(base_url, '/__reset', 'POST')
+
+    # A different query each time, so that no two calls are coalesced into one
+    queries: Iterator[int] = itertools.count()
+    call: Callable[[], Any]
+    if mode == 'async':
+        call = lambda: urlscan.async_urlscan_search(f'domain:{next(queries)}.example.com')
+    else:
+        call = lambda: urlscan.urlscan_search(f'domain:{next(queries)}.example.com')
+
+    latencies: List[float] = []
+    counters: Dict[str, int] = {'errors': 0, 'retries': 0}
+
+    started: float = time.perf_counter()
+    if mode == 'async':
+        asyncio.run(_run_async(call, requests, concurrency, latencies, counters))
+    else:
+        _run_sync(call, requests, concurrency, latencies, counters)
+    elapsed: float = time.perf_counter() - started
+
+    close_sessions()
+    server: Dict[str, Any] = _server_call(base_url, '/__stats')
+    latencies.sort()
+
+    return {
+        'transport': transport,
+        'mode': mode,
+        'operations': len(latencies),
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 4),
+        'ops_per_second': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+            'p50': round(_percentile(latencies, 0.50) * 1000, 3),
+            'p90': round(_percentile(latencies, 0.90) * 1000, 3),
+            'p99': round(_percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        'errors': counters['errors'],
+        'server_requests': server['requests'],
+        # Less the connection that fetched these stats
+        'connections_opened': server['connections'] - 1,
+        'http2_connections': server['http2_connections'],
+        'max_streams_in_flight': server['max_streams_in_flight'],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500, help='calls per transport and mode')
+    parser.add_argument('--concurrency', type=int, default=32, help='threads or in-flight coroutines')
+    parser.add_argument('--transport', action='append', choices=TRANSPORTS, help='transport to run, may be repeated')
+    parser.add_argument('--mode', action='append', choices=MODES, help='load to apply, may be repeated')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="the stub's latency per request")
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    server: subprocess.Popen = subprocess.Popen([sys.executable, '-m', 'benchmarks.h2_server',
+                                                 f'--latency-ms={args.latency_ms}'],
+                                                stdout=subprocess.PIPE, text=True)
+
+    try:
+        base_url: str = server.stdout.readline().strip()
+        if not base_url:
+            print('[!] Error: the HTTP/2 stub did not start. It needs h2 and the openssl command', file=sys.stderr)
+            return 1
+
+        os.environ.update(CREDENTIALS)
+        os.environ['PPP_API_BASE_URL'] = base_url
+        os.environ['VERIFY_SSL'] = 'false'
+        os.environ['PPP_CACHE'] = ''
+        os.environ['PPP_RATELIMIT_URLSCAN'] = ''
+        # Enough pooled connections for every thread, so HTTP/1.1 is not held back by the pool
+        os.environ['PPP_POOL_MAXSIZE'] = os.environ.get('PPP_POOL_MAXSIZE') or str(args.concurrency)
+
+        results: List[Dict[str, Any]] = []
+        for transport in args.transport or TRANSPORTS:
+            for mode in args.mode or MODES:
+                # The async connectors always use httpx, so only http2 changes them
+                if mode == 'async' and transport == 'httpx':
+                    continue
+                results.append(run_scenario(transport, mode, base_url, args.requests, args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+
+    output: Dict[str, Any] = {
+        'benchmark': 'http2',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'latency_ms': args.latency_ms,
+        'results': results,
+    }
+
+    rendered: str = json.dumps(output, indent=2)
+    print(rendered)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(rendered + '\n')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Measure how long importing ppp_connectors takes, using `python -X importtime`.
+
+Each statement is timed in a fresh interpreter, several times, and the median cumulative
+import time of the ppp_connectors modules is reported along with the slowest modules
+pulled in. Results are printed as JSON so they can be compared between releases.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --runs 10 --output import_time.json --max-ms 50
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+# The statements timed by default: the bare package, one vendor module, and every module
+STATEMENTS: List[str] = [
+    'import ppp_connectors',
+    'from ppp_connectors import urlscan_search',
+    'import ppp_connectors.flashpoint, ppp_connectors.ipqs, ppp_connectors.spycloud, '
+    'ppp_connectors.twilio, ppp_connectors.urlscan',
+]
+
+# e.g. "import time:       512 |       1890 |   ppp_connectors.broker"
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$')
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Parse the output of -X importtime
+
+    Args:
+        stderr (str): the interpreter's stderr
+
+    Returns:
+        List[Tuple[str, int, int, int]]: (module, self us, cumulative us, nesting depth) per import
+    """
+
+    rows: List[Tuple[str, int, int, int]] = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+
+    return rows
+
+
+def time_statement(statement: str, runs: int) -> Dict[str, Any]:
+    """Time one import statement in fresh interpreters
+
+    Args:
+        statement (str): the Python statement to run
+        runs (int): how many interpreters to start
+
+    Returns:
+        Dict[str, Any]: the median total, the per-run totals, and the slowest modules
+    """
+
+    env: Dict[str, str] = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    totals: List[float] = []
+    modules: Dict[str, List[int]] = {}
+
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                                   capture_output=True, text=True, env=env, check=True)
+        rows = parse_importtime(completed.stderr)
+
+        # Only count the top-level ppp_connectors imports, not the interpreter's own start-up
+        totals.append(sum(cumulative for module, _, cumulative, depth in rows
+                          if depth == 0 and module.split('.')[0] == 'ppp_connectors') / 1000)
+        for module, self_us, _, _ in rows:
+            modules.setdefault(module, []).append(self_us)
+
+    slowest: List[Tuple[str, float]] = sorted(
+        ((module, statistics.median(times) / 1000) for module, times in modules.items()),
+        key=lambda item: item[1], reverse=True)[:15]
+
+    return {
+        'statement': statement,
+        'median_ms': round(statistics.median(totals), 3),
+        'runs_ms': [round(total, 3) for total in totals],
+        'modules_loaded': len(modules),
+        'slowest_modules_ms': {module: round(ms, 3) for module, ms in slowest},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='interpreters to start per statement')
+    parser.add_argument('--statement', action='append', help='statement to time, may be repeated')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--max-ms', type=float,
+                        help='exit with status 1 if `import ppp_connectors` takes longer than this')
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        'benchmark': 'import_time',
+        'python': sys.version.split()[0],
+        'results': [time_statement(statement, args.runs) for statement in args.statement or STATEMENTS],
+    }
+
+    output: str = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+    if args.max_ms is not None:
+        package: Dict[str, Any] = time_statement('import ppp_connectors', args.runs)
+        if package['median_ms'] > args.max_ms:
+            print(f'[!] Error: import ppp_connectors took {package["median_ms"]}ms, '
+                  f'over the {args.max_ms}ms budget', file=sys.stderr)
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
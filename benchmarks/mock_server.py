@@ -0,0 +1,356 @@
+"""A local stub of the vendor APIs, so the connectors can be benchmarked without touching
+real services. Point the connectors at it with PPP_API_BASE_URL.
+
+It answers the SpyCloud, urlscan, Flashpoint, IPQS and Twilio paths the connectors call,
+with configurable latency, payload size, pagination and 429s. JSON GETs carry an ETag,
+and a matching If-None-Match is answered with a 304. Request and connection counts are
+served from /__stats, and reset with a POST to /__reset. /__redirect?to=<path> answers
+with a redirect to the path.
+
+    python -m benchmarks.mock_server --port 8080 --latency-ms 20 --rate-limit-every 50
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+
+@dataclass
+class MockSettings:
+    """How the stub server behaves
+
+    Attributes:
+        latency_ms (float): time spent before answering each request
+        jitter_ms (float): random extra latency, up to this many milliseconds
+        record_bytes (int): padding added to each record, to control payload size
+        page_size (int): records per page when the request doesn't ask for a size
+        total_records (int): records available to every paginated search
+        rate_limit_every (int): answer every Nth request with a 429, 0 to never do so
+        retry_after (float): the Retry-After sent with each 429, in seconds
+        media_bytes (int): the size of the Flashpoint media image
+        scan_ms (float): how long a urlscan submission takes to finish. Its result is a
+            404 until then.
+        key_quota (int): requests each API key may make before it gets 429s, 0 for no quota
+    """
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    record_bytes: int = 256
+    page_size: int = 100
+    total_records: int = 1000
+    rate_limit_every: int = 0
+    retry_after: float = 0.0
+    media_bytes: int = 1024 * 1024
+    scan_ms: float = 0.0
+    key_quota: int = 0
+
+
+class MockVendorServer(ThreadingHTTPServer):
+    """A threaded HTTP server that keeps its settings and counts what it served"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    # The default backlog of 5 drops connections when many clients connect at once
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], settings: MockSettings) -> None:
+        super().__init__(address, MockVendorHandler)
+        self.settings: MockSettings = settings
+        self.padding: str = 'x' * settings.record_bytes
+        self.media: bytes = bytes(range(256)) * (settings.media_bytes // 256) + bytes(settings.media_bytes % 256)
+        self._stats_lock: threading.Lock = threading.Lock()
+        # When each urlscan submission finishes, by UUID
+        self.scans: Dict[str, float] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self.stats: Dict[str, int] = {'requests': 0, 'connections': 0, 'rate_limited': 0, 'not_modified': 0}
+            # Requests made with each API key
+            self.keys: Dict[str, int] = {}
+
+    def count_key(self, key: str) -> int:
+        with self._stats_lock:
+            self.keys[key] = self.keys.get(key, 0) + 1
+            return self.keys[key]
+
+    def count(self, name: str) -> int:
+        with self._stats_lock:
+            self.stats[name] += 1
+            return self.stats[name]
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        # Each accepted socket is one connection, however many requests it carries
+        self.count('connections')
+        super().process_request(request, client_address)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def _offset_page(server: MockVendorServer, offset: int, size: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Build the records from `offset`, and the offset after them"""
+
+    end: int = min(server.settings.total_records, offset + size)
+    records: List[Dict[str, Any]] = [{'id': i, 'value': f'record-{i}', 'padding': server.padding}
+                                     for i in range(offset, end)]
+
+    return records, end
+
+
+# The categories each day of stub Twilio usage has a record for
+USAGE_CATEGORIES: List[str] = ['calls', 'sms', 'phonenumbers']
+
+
+def _usage_days(query: Dict[str, str]) -> List[str]:
+    """Every day from StartDate to EndDate"""
+
+    first: date = date.fromisoformat(query['StartDate'])
+    last: date = date.fromisoformat(query.get('EndDate') or date.today().isoformat())
+    return [(first + timedelta(days=offset)).isoformat() for offset in range((last - first).days + 1)]
+
+
+def _daily_usage_record(days: List[str], index: int) -> Dict[str, Any]:
+    """The index-th record of a daily usage listing, priced from its day and category"""
+
+    day: str = days[index // len(USAGE_CATEGORIES)]
+    category: str = USAGE_CATEGORIES[index % len(USAGE_CATEGORIES)]
+    count: int = int(day[-2:]) + index % len(USAGE_CATEGORIES)
+    return {'category': category, 'description': category, 'start_date': day, 'end_date': day,
+            'count': str(count), 'count_unit': 'units', 'usage': str(count), 'usage_unit': 'units',
+            'price': f'{count * 0.01:.2f}', 'price_unit': 'usd'}
+
+
+class MockVendorHandler(BaseHTTPRequestHandler):
+    """Route each request to the stub for the vendor endpoint it was sent to"""
+
+    # Keep connections alive, like the real APIs do
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are sent separately, so don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+    server: MockVendorServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self._dispatch('GET')
+
+    def do_POST(self) -> None:
+        self._dispatch('POST')
+
+    def _dispatch(self, method: str) -> None:
+        parts = urlsplit(self.path)
+        query: Dict[str, str] = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        length: int = int(self.headers.get('Content-Length') or 0)
+        body: bytes = self.rfile.read(length) if length else b''
+
+        if parts.path == '/__stats':
+            return self._send_json(200, {**self.server.stats, 'keys': self.server.keys,
+                                         'settings': asdict(self.server.settings)})
+        if parts.path == '/__reset':
+            self.server.reset_stats()
+            return self._send_json(200, {})
+        if parts.path == '/__redirect':
+            return self._send(302, b'', 'text/plain', {'Location': query.get('to') or '/'})
+
+        number: int = self.server.count('requests')
+        settings: MockSettings = self.server.settings
+
+        delay: float = settings.latency_ms + random.uniform(0, settings.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+
+        if settings.rate_limit_every and number % settings.rate_limit_every == 0:
+            self.server.count('rate_limited')
+            return self._send_json(429, {'error': 'rate limited'},
+                                   {'Retry-After': str(settings.retry_after)})
+
+        if settings.key_quota:
+            key: str = (self.headers.get('x-api-key') or self.headers.get('API-Key')
+                        or self.headers.get('Authorization') or query.get('key') or '')
+            if self.server.count_key(key) > settings.key_quota:
+                self.server.count('rate_limited')
+                return self._send_json(429, {'error': 'quota exceeded'},
+                                       {'X-Rate-Limit-Reset-After': str(settings.retry_after)})
+
+        for pattern, route_method, handler in ROUTES:
+            match = pattern.fullmatch(parts.path)
+            if match and route_method == method:
+                return handler(self, match, query, body)
+
+        self._send_json(404, {'error': f'no stub for {method} {parts.path}'})
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        content: bytes = json.dumps(payload).encode()
+        if status == 200 and self.command == 'GET':
+            etag: str = f'"{hashlib.sha1(content).hexdigest()[:16]}"'
+            headers = {**(headers or {}), 'ETag': etag}
+            if self.headers.get('If-None-Match') == etag:
+                self.server.count('not_modified')
+                return self._send(304, b'', 'application/json', headers)
+        self._send(status, content, 'application/json', headers)
+
+    def _send(self, status: int, content: bytes, content_type: str,
+              headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    # SpyCloud pages carry a cursor, which here is the offset of the next page
+    def spycloud_search(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        offset: int = int(query.get('cursor') or 0)
+        records, end = _offset_page(self.server, offset, self.server.settings.page_size)
+        cursor: str = str(end) if end < self.server.settings.total_records else ''
+        self._send_json(200, {'cursor': cursor, 'hits': len(records), 'results': records})
+
+    # urlscan pages continue after the `sort` values of the last result
+    def urlscan_search(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        offset: int = int(query['search_after'].split(',')[-1]) + 1 if query.get('search_after') else 0
+        size: int = int(query.get('size') or self.server.settings.page_size)
+        records, end = _offset_page(self.server, offset, size)
+        for record in records:
+            record['sort'] = [1700000000000, record['id']]
+        self._send_json(200, {'results': records, 'total': self.server.settings.total_records,
+                              'has_more': end < self.server.settings.total_records})
+
+    def urlscan_scan(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        uuid: str = f'{random.getrandbits(128):032x}'
+        self.server.scans[uuid] = time.monotonic() + self.server.settings.scan_ms / 1000
+        self._send_json(200, {'message': 'Submission successful', 'uuid': uuid,
+                              'result': f'https://urlscan.io/result/{uuid}/',
+                              'api': f'https://urlscan.io/api/v1/result/{uuid}/'})
+
+    def urlscan_result(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        if time.monotonic() < self.server.scans.get(match.group('uuid'), 0.0):
+            return self._send_json(404, {'message': 'Scan is not finished yet', 'status': 404})
+        self._send_json(200, {'task': {'uuid': match.group('uuid')}, 'page': {'url': 'https://example.com'},
+                              'verdicts': {'overall': {'malicious': False}}, 'padding': self.server.padding})
+
+    # Flashpoint searches page with `from` and `size` in the JSON body
+    def flashpoint_search(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        payload: Dict[str, Any] = json.loads(body or b'{}')
+        size: int = int(payload.get('size') or self.server.settings.page_size)
+        records, _ = _offset_page(self.server, int(payload.get('from') or 0), size)
+        self._send_json(200, {'items': records, 'total': {'value': self.server.settings.total_records}})
+
+    def flashpoint_media_object(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        self._send_json(200, {'id': match.group('id'), 'storage_uri': f'media/{match.group("id")}',
+                              'padding': self.server.padding})
+
+    def flashpoint_media_image(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        media: bytes = self.server.media
+        byte_range = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        if not byte_range:
+            return self._send(200, media, 'application/octet-stream')
+
+        start: int = int(byte_range.group(1))
+        if start >= len(media):
+            return self._send(416, b'', 'application/octet-stream',
+                              {'Content-Range': f'bytes */{len(media)}'})
+        self._send(206, media[start:], 'application/octet-stream',
+                   {'Content-Range': f'bytes {start}-{len(media) - 1}/{len(media)}'})
+
+    def ipqs_url(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        self._send_json(200, {'success': True, 'unsafe': False, 'domain': 'example.com',
+                              'risk_score': random.randint(0, 100), 'padding': self.server.padding})
+
+    def twilio_lookup(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        packages: Dict[str, Any] = {package: {'error_code': None, 'padding': self.server.padding}
+                                    for package in (query.get('Fields') or '').split(',') if package}
+        self._send_json(200, {'phone_number': match.group('number'), 'valid': True,
+                              'country_code': 'US', 'padding': self.server.padding, **packages})
+
+    # Twilio usage pages link to the next one with next_page_uri. Daily records cover
+    # every day from StartDate to EndDate, a record per category each day.
+    def twilio_usage(self, match: Any, query: Dict[str, str], body: bytes) -> None:
+        size: int = int(query.get('PageSize') or self.server.settings.page_size)
+        page: int = int(query.get('Page') or 0)
+        if match.group('subresource') == '/Daily' and query.get('StartDate'):
+            days: List[str] = _usage_days(query)
+            total: int = len(days) * len(USAGE_CATEGORIES)
+            end: int = min(total, (page + 1) * size)
+            records: List[Dict[str, Any]] = [_daily_usage_record(days, i) for i in range(page * size, end)]
+        else:
+            total = self.server.settings.total_records
+            records, end = _offset_page(self.server, page * size, size)
+        next_page_uri: Optional[str] = None
+        if end < total:
+            next_query: str = urlencode({**query, 'Page': page + 1, 'PageSize': size})
+            next_page_uri = f'{urlsplit(self.path).path}?{next_query}'
+        self._send_json(200, {'usage_records': records, 'page': page, 'page_size': size,
+                              'next_page_uri': next_page_uri})
+
+
+# (path pattern, method, handler) for every endpoint the connectors call
+ROUTES: List[Tuple['re.Pattern[str]', str, Callable[..., None]]] = [
+    (re.compile(r'/sip-v1/breach/data/cookie-domains/[^/]+'), 'GET', MockVendorHandler.spycloud_search),
+    (re.compile(r'/sp-v2/breach/catalog'), 'GET', MockVendorHandler.spycloud_search),
+    (re.compile(r'/(sp|investigations)-v2/breach/data/[\w-]+/[^/]+'), 'GET', MockVendorHandler.spycloud_search),
+    (re.compile(r'/api/v1/search/?'), 'GET', MockVendorHandler.urlscan_search),
+    (re.compile(r'/api/v1/scan/?'), 'POST', MockVendorHandler.urlscan_scan),
+    (re.compile(r'/api/v1/result/(?P<uuid>[^/]+)/?'), 'GET', MockVendorHandler.urlscan_result),
+    (re.compile(r'/sources/v2/(communities|media)'), 'POST', MockVendorHandler.flashpoint_search),
+    (re.compile(r'/sources/v2/media/(?P<id>[^/]+)'), 'GET', MockVendorHandler.flashpoint_media_object),
+    (re.compile(r'/sources/v1/media/?'), 'GET', MockVendorHandler.flashpoint_media_image),
+    (re.compile(r'/api/json/url(/.*)?'), 'POST', MockVendorHandler.ipqs_url),
+    (re.compile(r'/v2/PhoneNumbers/(?P<number>[^/]+)'), 'GET', MockVendorHandler.twilio_lookup),
+    (re.compile(r'/2010-04-01/Accounts/[^/]+/Usage/Records(?P<subresource>/\w+)?\.json'), 'GET',
+     MockVendorHandler.twilio_usage),
+]
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add a command line option for every MockSettings field"""
+
+    defaults: MockSettings = MockSettings()
+    parser.add_argument('--latency-ms', type=float, default=defaults.latency_ms)
+    parser.add_argument('--jitter-ms', type=float, default=defaults.jitter_ms)
+    parser.add_argument('--record-bytes', type=int, default=defaults.record_bytes)
+    parser.add_argument('--page-size', type=int, default=defaults.page_size)
+    parser.add_argument('--total-records', type=int, default=defaults.total_records)
+    parser.add_argument('--rate-limit-every', type=int, default=defaults.rate_limit_every)
+    parser.add_argument('--retry-after', type=float, default=defaults.retry_after)
+    parser.add_argument('--media-bytes', type=int, default=defaults.media_bytes)
+    parser.add_argument('--scan-ms', type=float, default=defaults.scan_ms)
+    parser.add_argument('--key-quota', type=int, default=defaults.key_quota)
+
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(**{name: getattr(args, name) for name in asdict(MockSettings())})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='0 picks a free port')
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server: MockVendorServer = MockVendorServer((args.host, args.port), settings_from_args(args))
+    # The benchmark runner reads the address from this first line
+    print(server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""Benchmark make_request and the connectors against the local stub server, offline.
+
+The stub server (benchmarks.mock_server) runs in its own process, and every connector is
+pointed at it with PPP_API_BASE_URL. Each target is called under sequential, threaded and
+async load, and requests/sec, latency percentiles, retries, memory and the number of
+connections the server accepted are reported as JSON.
+
+    python -m benchmarks.throughput
+    python -m benchmarks.throughput --requests 500 --concurrency 32 --latency-ms 10 --output run.json
+    python -m benchmarks.throughput --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.request import Request, urlopen
+from .mock_server import add_settings_arguments, settings_from_args
+
+MODES: List[str] = ['sequential', 'threaded', 'async']
+
+# Dummy credentials, so each connector's required variables are present
+CREDENTIALS: Dict[str, str] = {
+    'FLASHPOINT_API_KEY': 'bench', 'IPQS_API_KEY': 'bench', 'SPYCLOUD_API_ATO_KEY': 'bench',
+    'SPYCLOUD_API_INV_KEY': 'bench', 'SPYCLOUD_API_SIP_KEY': 'bench', 'TWILIO_ACCOUNT_SID': 'ACbench',
+    'TWILIO_API_SID': 'bench', 'TWILIO_API_SECRET': 'bench', 'URLSCAN_API_KEY': 'bench',
+}
+
+
+def build_targets() -> Dict[str, Tuple[Callable[[], Any], Optional[Callable[[], Any]]]]:
+    """The calls to benchmark, by name, as (sync call, async call or None). The iter_ targets
+        consume every page of a search, so one operation is a whole paginated search.
+    """
+
+    from ppp_connectors import broker, async_broker, flashpoint, ipqs, spycloud, twilio, urlscan
+
+    result_url: str = 'https://urlscan.io/api/v1/result/bench'
+
+    return {
+        'make_request': (lambda: broker.make_request('get', result_url),
+                         lambda: async_broker.async_make_request('get', result_url)),
+        'spycloud_sip_cookie_domains': (lambda: spycloud.spycloud_sip_cookie_domains('example.com'),
+                                        lambda: spycloud.async_spycloud_sip_cookie_domains('example.com')),
+        'spycloud_ato_breach_catalog': (lambda: spycloud.spycloud_ato_breach_catalog('example'),
+                                        lambda: spycloud.async_spycloud_ato_breach_catalog('example')),
+        'spycloud_ato_search': (lambda: spycloud.spycloud_ato_search('email', 'user@example.com'),
+                                lambda: spycloud.async_spycloud_ato_search('email', 'user@example.com')),
+        'spycloud_inv_search': (lambda: spycloud.spycloud_inv_search('email', 'user@example.com'),
+                                lambda: spycloud.async_spycloud_inv_search('email', 'user@example.com')),
+        'urlscan_search': (lambda: urlscan.urlscan_search('domain:example.com'),
+                           lambda: urlscan.async_urlscan_search('domain:example.com')),
+        'urlscan_scan': (lambda: urlscan.urlscan_scan('https://example.com'),
+                         lambda: urlscan.async_urlscan_scan('https://example.com')),
+        'urlscan_results': (lambda: urlscan.urlscan_results('bench'),
+                            lambda: urlscan.async_urlscan_results('bench')),
+        'flashpoint_search_communities': (lambda: flashpoint.flashpoint_search_communities('example'),
+                                          lambda: flashpoint.async_flashpoint_search_communities('example')),
+        'flashpoint_search_media': (lambda: flashpoint.flashpoint_search_media('example'),
+                                    lambda: flashpoint.async_flashpoint_search_media('example')),
+        'flashpoint_get_media_object': (lambda: flashpoint.flashpoint_get_media_object('bench'),
+                                        lambda: flashpoint.async_flashpoint_get_media_object('bench')),
+        'flashpoint_get_media_image': (lambda: flashpoint.flashpoint_get_media_image('bench'),
+                                       lambda: flashpoint.async_flashpoint_get_media_image('bench')),
+        'ipqs_malicious_url': (lambda: ipqs.ipqs_malicious_url('https://example.com'),
+                               lambda: ipqs.async_ipqs_malicious_url('https://example.com')),
+        'twilio_lookup': (lambda: twilio.twilio_lookup('+15555550100'),
+                          lambda: twilio.async_twilio_lookup('+15555550100')),
+        'twilio_usage_report': (lambda: twilio.twilio_usage_report('2024-01-01', '2024-01-31'),
+                                lambda: twilio.async_twilio_usage_report('2024-01-01', '2024-01-31')),
+        'iter_spycloud_ato_search': (lambda: sum(1 for _ in spycloud.iter_spycloud_ato_search('email', 'user@example.com')),
+                                     None),
+        'iter_urlscan_search': (lambda: sum(1 for _ in urlscan.iter_urlscan_search('domain:example.com')), None),
+        'iter_flashpoint_search_media': (lambda: sum(1 for _ in flashpoint.iter_flashpoint_search_media('example')),
+                                         None),
+    }
+
+
+def _server_call(base_url: str, path: str, method: str = 'GET') -> Dict[str, Any]:
+    with urlopen(Request(f'{base_url}{path}', method=method, data=b'' if method == 'POST' else None)) as response:
+        return json.loads(response.read())
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index: int = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+_counters_lock: threading.Lock = threading.Lock()
+
+
+def _record(outcome: Any, started: float, latencies: List[float], counters: Dict[str, int]) -> None:
+    """Note one call's latency, and whether it failed or was retried"""
+
+    latency: float = time.perf_counter() - started
+    status: Optional[int] = getattr(outcome, 'status_code', None)
+    retry_stats = getattr(outcome, 'retry_stats', None)
+    with _counters_lock:
+        latencies.append(latency)
+        if isinstance(outcome, BaseException) or (status is not None and status >= 400):
+            counters['errors'] += 1
+        if retry_stats is not None:
+            counters['retries'] += retry_stats.retries
+
+
+def _timed_call(call: Callable[[], Any], latencies: List[float], counters: Dict[str, int]) -> None:
+    started: float = time.perf_counter()
+    try:
+        outcome: Any = call()
+    except Exception as e:
+        outcome = e
+    _record(outcome, started, latencies, counters)
+
+
+def _run_sync(call: Callable[[], Any], requests: int, concurrency: int,
+              latencies: List[float], counters: Dict[str, int]) -> None:
+    if concurrency <= 1:
+        for _ in range(requests):
+            _timed_call(call, latencies, counters)
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(requests):
+            executor.submit(_timed_call, call, latencies, counters)
+
+
+async def _run_async(call: Callable[[], Any], requests: int, concurrency: int,
+                     latencies: List[float], counters: Dict[str, int]) -> None:
+    from ppp_connectors.async_broker import close_client
+
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed() -> None:
+        async with semaphore:
+            started: float = time.perf_counter()
+            try:
+                outcome: Any = await call()
+            except Exception as e:
+                outcome = e
+            _record(outcome, started, latencies, counters)
+
+    try:
+        await asyncio.gather(*(timed() for _ in range(requests)))
+    finally:
+        await close_client()
+
+
+def run_scenario(name: str, mode: str, call: Callable[[], Any], base_url: str, requests: int,
+                 concurrency: int, trace_memory: bool) -> Dict[str, Any]:
+    """Call one target `requests` times in one mode, and summarise how it went"""
+
+    from ppp_connectors.broker import close_sessions
+
+    # Start from cold pools, so the connection count belongs to this scenario alone
+    close_sessions()
+    _server_call(base_url, '/__reset', 'POST')
+
+    latencies: List[float] = []
+    counters: Dict[str, int] = {'errors': 0, 'retries': 0}
+    if trace_memory:
+        tracemalloc.start()
+
+    started: float = time.perf_counter()
+    if mode == 'async':
+        asyncio.run(_run_async(call, requests, concurrency, latencies, counters))
+    else:
+        _run_sync(call, requests, concurrency if mode == 'threaded' else 1, latencies, counters)
+    elapsed: float = time.perf_counter() - started
+
+    traced_peak: Optional[int] = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    server: Dict[str, Any] = _server_call(base_url, '/__stats')
+    latencies.sort()
+
+    return {
+        'target': name,
+        'mode': mode,
+        'operations': len(latencies),
+        'concurrency': concurrency if mode != 'sequential' else 1,
+        'seconds': round(elapsed, 4),
+        'ops_per_second': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+            'p50': round(_percentile(latencies, 0.50) * 1000, 3),
+            'p90': round(_percentile(latencies, 0.90) * 1000, 3),
+            'p99': round(_percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        'errors': counters['errors'],
+        'retries': counters['retries'],
+        'server_requests': server['requests'],
+        'server_rate_limited': server['rate_limited'],
+        # Less the connection that fetched these stats
+        'connections_opened': server['connections'] - 1,
+        'traced_peak_kib': round(traced_peak / 1024, 1) if traced_peak is not None else None,
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1),
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """Find scenarios that got slower than a previous run by more than `tolerance`
+
+    Args:
+        results (List[Dict[str, Any]]): this run's scenario results
+        baseline_path (str): the JSON output of an earlier run
+        tolerance (float): the fraction by which throughput may drop, or p99 latency rise
+
+    Returns:
+        List[str]: a description of each regression, empty if there were none
+    """
+
+    with open(baseline_path) as f:
+        baseline: Dict[Tuple[str, str], Dict[str, Any]] = {
+            (scenario['target'], scenario['mode']): scenario for scenario in json.load(f)['results']}
+
+    regressions: List[str] = []
+    for scenario in results:
+        before: Optional[Dict[str, Any]] = baseline.get((scenario['target'], scenario['mode']))
+        if before is None:
+            continue
+        label: str = f'{scenario["target"]} ({scenario["mode"]})'
+        if scenario['ops_per_second'] < before['ops_per_second'] * (1 - tolerance):
+            regressions.append(f'{label}: {scenario["ops_per_second"]} ops/s, was {before["ops_per_second"]}')
+        if scenario['latency_ms']['p99'] > before['latency_ms']['p99'] * (1 + tolerance):
+            regressions.append(f'{label}: p99 {scenario["latency_ms"]["p99"]}ms, was {before["latency_ms"]["p99"]}ms')
+
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='calls per target and mode')
+    parser.add_argument('--concurrency', type=int, default=16, help='threads or in-flight coroutines')
+    parser.add_argument('--mode', action='append', choices=MODES, help='load to apply, may be repeated')
+    parser.add_argument('--target', action='append', help='target to run, may be repeated. Defaults to all')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='report the peak memory allocated per scenario with tracemalloc (slower)')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--compare', help='a previous JSON output to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed drop in throughput, or rise in p99, when comparing')
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    settings = settings_from_args(args)
+    server_args: List[str] = [f'--{name.replace("_", "-")}={value}' for name, value in vars(settings).items()]
+    server: subprocess.Popen = subprocess.Popen([sys.executable, '-m', 'benchmarks.mock_server', *server_args],
+                                                stdout=subprocess.PIPE, text=True)
+
+    try:
+        base_url: str = server.stdout.readline().strip()
+
+        # Environment variables take precedence over a .env file. Caching would turn the
+        # benchmark into a measure of the cache, coalescing the repeated query into a
+        # handful of requests, and throttling into one of the limit.
+        os.environ.update(CREDENTIALS)
+        os.environ['PPP_API_BASE_URL'] = base_url
+        os.environ['PPP_CACHE'] = ''
+        os.environ['PPP_COALESCE'] = 'false'
+        os.environ.setdefault('PPP_RETRY_BACKOFF', '0.01')
+        os.environ['PPP_POOL_MAXSIZE'] = os.environ.get('PPP_POOL_MAXSIZE') or str(args.concurrency)
+        for vendor in ('FLASHPOINT', 'IPQS', 'SPYCLOUD', 'TWILIO', 'URLSCAN'):
+            os.environ.setdefault(f'PPP_RATELIMIT_{vendor}', '')
+
+        from ppp_connectors.helpers import reload_config
+        reload_config()
+
+        targets = build_targets()
+        modes: List[str] = args.mode or MODES
+        if 'async' in modes and find_spec('httpx') is None:
+            print('[!] httpx is not installed, skipping the async scenarios', file=sys.stderr)
+            modes = [mode for mode in modes if mode != 'async']
+
+        results: List[Dict[str, Any]] = []
+        for name in args.target or list(targets):
+            if name not in targets:
+                print(f'[!] Error: unknown target "{name}". Must be one of {", ".join(targets)}', file=sys.stderr)
+                return 1
+            sync_call, async_call = targets[name]
+            for mode in modes:
+                call: Optional[Callable[[], Any]] = async_call if mode == 'async' else sync_call
+                if call is None:
+                    continue
+                requests: int = args.requests if not name.startswith('iter_') else max(1, args.requests // 20)
+                results.append(run_scenario(name, mode, call, base_url, requests,
+                                            args.concurrency, args.trace_memory))
+    finally:
+        server.terminate()
+        server.wait()
+
+    output: Dict[str, Any] = {
+        'benchmark': 'throughput',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'server': vars(settings),
+        'results': results,
+    }
+
+    rendered: str = json.dumps(output, indent=2)
+    print(rendered)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(rendered + '\n')
+
+    if args.compare:
+        regressions: List[str] = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f'[!] Regression: {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
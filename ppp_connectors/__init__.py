@@ -1,5 +1,87 @@
-__all__ = [
-    'check_required_env_vars',
-    'make_request',
-    'spycloud_sip_cookie_domains'
-]
\ No newline at end of file
+import importlib
+from typing import Any, Dict, List
+
+# Where each public name lives. Nothing below is imported until it is first used, so
+# `import ppp_connectors` stays cheap and only the vendor modules actually called are loaded.
+_LAZY_ATTRIBUTES: Dict[str, str] = {
+    'check_required_env_vars': 'helpers',
+    'get_config': 'helpers',
+    'reload_config': 'helpers',
+    'make_request': 'broker',
+    'async_make_request': 'async_broker',
+    'batch_lookup': 'batch',
+    'async_batch_lookup': 'batch',
+    'register_hook': 'hooks',
+    'unregister_hook': 'hooks',
+    'get_metrics': 'metrics',
+    'priority': 'scheduler',
+    'flashpoint_search_communities': 'flashpoint',
+    'flashpoint_search_media': 'flashpoint',
+    'flashpoint_get_media_object': 'flashpoint',
+    'flashpoint_get_media_image': 'flashpoint',
+    'flashpoint_download_media_image': 'flashpoint',
+    'ipqs_malicious_url': 'ipqs',
+    'spycloud_sip_cookie_domains': 'spycloud',
+    'spycloud_ato_breach_catalog': 'spycloud',
+    'spycloud_ato_search': 'spycloud',
+    'spycloud_inv_search': 'spycloud',
+    'twilio_lookup': 'twilio',
+    'twilio_usage_report': 'twilio',
+    'twilio_usage_daily': 'twilio',
+    'urlscan_search': 'urlscan',
+    'urlscan_scan': 'urlscan',
+    'urlscan_results': 'urlscan',
+    'async_flashpoint_search_communities': 'flashpoint',
+    'async_flashpoint_search_media': 'flashpoint',
+    'async_flashpoint_get_media_object': 'flashpoint',
+    'async_flashpoint_get_media_image': 'flashpoint',
+    'iter_flashpoint_search_communities': 'flashpoint',
+    'iter_flashpoint_search_media': 'flashpoint',
+    'async_ipqs_malicious_url': 'ipqs',
+    'async_spycloud_sip_cookie_domains': 'spycloud',
+    'async_spycloud_ato_breach_catalog': 'spycloud',
+    'async_spycloud_ato_search': 'spycloud',
+    'async_spycloud_inv_search': 'spycloud',
+    'iter_spycloud_ato_search': 'spycloud',
+    'iter_spycloud_inv_search': 'spycloud',
+    'async_twilio_lookup': 'twilio',
+    'async_twilio_usage_report': 'twilio',
+    'async_twilio_usage_daily': 'twilio',
+    'iter_twilio_usage_report': 'twilio',
+    'iter_twilio_usage_daily': 'twilio',
+    'async_urlscan_search': 'urlscan',
+    'async_urlscan_scan': 'urlscan',
+    'async_urlscan_results': 'urlscan',
+    'iter_urlscan_search': 'urlscan',
+    'urlscan_scan_and_wait': 'pipeline',
+    'async_urlscan_scan_and_wait': 'pipeline',
+    'twilio_bulk_lookup': 'phone',
+}
+
+_SUBMODULES: List[str] = [
+    'archive', 'async_broker', 'batch', 'broker', 'cache', 'cli', 'coalesce', 'flashpoint', 'helpers', 'hooks',
+    'ipqs', 'keys', 'metrics', 'pagination', 'phone', 'pipeline', 'prefilter', 'ratelimit', 'registry',
+    'results', 'retry', 'scheduler', 'spycloud', 'streaming', 'transport', 'twilio', 'urlscan', 'usage',
+]
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    """Import the module behind a public name on first access (PEP 562)"""
+
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f'.{_LAZY_ATTRIBUTES[name]}', __name__)
+        value: Any = getattr(module, name)
+        # Cache it so later lookups don't come back through __getattr__
+        globals()[name] = value
+        return value
+
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | set(_SUBMODULES))
@@ -0,0 +1,357 @@
+import asyncio
+import atexit
+import json
+import threading
+import time
+import zlib
+from datetime import timedelta
+from typing import Any, Dict, NamedTuple, Optional, Tuple, TYPE_CHECKING
+import requests
+from requests.structures import CaseInsensitiveDict
+from .cache import TRANSPORT_HEADERS, request_key
+from .helpers import Config, get_config
+
+if TYPE_CHECKING:
+    import httpx
+
+
+env_config: Config = get_config()
+
+# What PPP_ARCHIVE can ask for
+ARCHIVE_MODES: Tuple[str, ...] = ('record', 'replay')
+
+# Commit recorded exchanges in batches, rather than paying for a commit on every request
+_COMMIT_EVERY: int = 100
+
+_archive: Optional['Archive'] = None
+_archive_loaded: bool = False
+_archive_lock: threading.Lock = threading.Lock()
+
+
+class Exchange(NamedTuple):
+    """A recorded response, and how long the vendor took to send it
+
+    Attributes:
+        status_code (int): the HTTP status
+        headers (Dict[str, str]): the response headers, without hop-by-hop ones
+        content (bytes): the decoded body
+        url (str): the final URL
+        elapsed (float): seconds from sending the request to receiving the response headers
+    """
+
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    url: str
+    elapsed: float
+
+    def to_response(self, method: str) -> requests.Response:
+        """Rebuild the requests.Response, with `replayed` set to True
+
+        Args:
+            method (str): the HTTP method of the request
+
+        Returns:
+            requests.Response: the response
+        """
+
+        prepared: requests.PreparedRequest = requests.PreparedRequest()
+        prepared.method = method.upper()
+        prepared.url = self.url
+        prepared.headers = CaseInsensitiveDict()
+        prepared.body = None
+
+        response: requests.Response = requests.Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response._content_consumed = True
+        response.url = self.url
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.elapsed = timedelta(seconds=self.elapsed)
+        response.request = prepared
+        response.replayed = True
+
+        return response
+
+    def to_httpx_response(self, method: str) -> 'httpx.Response':
+        """Rebuild the httpx.Response, with `replayed` set to True
+
+        Args:
+            method (str): the HTTP method of the request
+
+        Returns:
+            httpx.Response: the response
+        """
+
+        import httpx
+
+        response: httpx.Response = httpx.Response(self.status_code,
+                                                  headers=self.headers,
+                                                  content=self.content,
+                                                  request=httpx.Request(method.upper(), self.url))
+        response.replayed = True
+
+        return response
+
+
+class Archive:
+    """Request and response pairs recorded to a SQLite file, so runs can be replayed with
+        no network and no vendor access, e.g. for profiling or regression tests. Bodies
+        are zlib-compressed, and exchanges are indexed by the same key as the response
+        cache, so API keys are never part of it. A request made several times, such as
+        polling for a scan result, replays its responses in the order they were recorded
+        and then keeps returning the last one.
+    """
+
+    def __init__(self, path: str, mode: str = 'replay', speed: float = 1.0) -> None:
+        """
+        Args:
+            path (str): the archive file, created when recording
+            mode (str, optional): `record` or `replay`. Defaults to replay.
+            speed (float, optional): how fast to replay. 1 waits as long as each response
+                originally took, 2 half as long, and 0 doesn't wait at all. Defaults to 1.
+
+        Raises:
+            ValueError: this will raise if the mode is unknown or the speed is negative
+        """
+
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f'Invalid archive mode "{mode}". Must be one of {", ".join(ARCHIVE_MODES)}')
+        if speed < 0:
+            raise ValueError(f'The replay speed must not be negative, got {speed}')
+
+        self.path: str = path
+        self.mode: str = mode
+        self.speed: float = speed
+        self.recorded: int = 0
+        self.replayed: int = 0
+        self.misses: int = 0
+        self._pending: int = 0
+        # How many times each key has been replayed so far
+        self._positions: Dict[str, int] = {}
+        self._lock: threading.Lock = threading.Lock()
+        # Only needed once there is an archive to open
+        import sqlite3
+
+        self._conn: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS exchanges (id INTEGER PRIMARY KEY, key TEXT, method TEXT, '
+                           'url TEXT, status_code INTEGER, headers TEXT, content BLOB, elapsed REAL, '
+                           'recorded_at REAL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS exchanges_key ON exchanges (key, id)')
+        self._conn.commit()
+
+    def __repr__(self) -> str:
+        return f'Archive({self.path}, {self.mode})'
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def record(self, key: str, method: str, url: str, response: Any) -> None:
+        """Add the response to one attempt at a request
+
+        Args:
+            key (str): the request key from cache.request_key
+            method (str): the HTTP method
+            url (str): the vendor URL, before PPP_API_BASE_URL is applied
+            response (Any): a requests.Response or httpx.Response, with its body read
+        """
+
+        headers: Dict[str, str] = {name: value for name, value in response.headers.items()
+                                   if name.lower() not in TRANSPORT_HEADERS}
+        row: Tuple[Any, ...] = (key, method.upper(), url, response.status_code, json.dumps(headers),
+                                zlib.compress(response.content), response.elapsed.total_seconds(), time.time())
+
+        with self._lock:
+            self._conn.execute('INSERT INTO exchanges (key, method, url, status_code, headers, content, elapsed, '
+                               'recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', row)
+            self.recorded += 1
+            self._pending += 1
+            if self._pending >= _COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def replay(self, key: str) -> Optional[Exchange]:
+        """Take the next recorded response to a request
+
+        Args:
+            key (str): the request key from cache.request_key
+
+        Returns:
+            Optional[Exchange]: the exchange, or None if the request was never recorded
+        """
+
+        with self._lock:
+            position: int = self._positions.get(key, 0)
+            row = self._conn.execute('SELECT status_code, headers, content, url, elapsed FROM exchanges '
+                                     'WHERE key = ? ORDER BY id LIMIT 1 OFFSET ?', (key, position)).fetchone()
+            if row is None and position:
+                # Past the last recording, so keep answering with it
+                row = self._conn.execute('SELECT status_code, headers, content, url, elapsed FROM exchanges '
+                                         'WHERE key = ? ORDER BY id DESC LIMIT 1', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._positions[key] = position + 1
+            self.replayed += 1
+
+        return Exchange(row[0], json.loads(row[1]), zlib.decompress(row[2]), row[3], row[4])
+
+    def key(self, method: str, url: str, headers: Optional[Dict[str, str]], params: Optional[Dict[str, Any]],
+            data: Optional[Any], json_body: Optional[Any]) -> str:
+        """The key a request is recorded under: the cache's request key, so credentials are
+            left out and a recording can be replayed with any API key. None-valued query
+            parameters are dropped, as both brokers do, so recordings made by one replay
+            in the other.
+
+        Returns:
+            str: a hex digest identifying the request
+        """
+
+        if params is not None:
+            params = {name: value for name, value in params.items() if value is not None}
+
+        return request_key(method, url, headers, params, data, json_body)
+
+    def response(self, key: str, method: str, url: str) -> requests.Response:
+        """Replay the next response to a request, after its original latency scaled by the speed
+
+        Args:
+            key (str): the key from Archive.key
+            method (str): the HTTP method
+            url (str): the vendor URL, for the error message
+
+        Raises:
+            requests.ConnectionError: this will raise if the request was never recorded, as
+                it would if the vendor could not be reached
+
+        Returns:
+            requests.Response: the recorded response
+        """
+
+        exchange: Optional[Exchange] = self.replay(key)
+        if exchange is None:
+            raise requests.ConnectionError(f'No recorded response to {method.upper()} {url} in {self.path}')
+
+        delay: float = self.delay(exchange)
+        if delay:
+            time.sleep(delay)
+
+        return exchange.to_response(method)
+
+    async def async_response(self, key: str, method: str, url: str) -> 'httpx.Response':
+        """Asynchronous version of response
+
+        Raises:
+            httpx.ConnectError: this will raise if the request was never recorded
+
+        Returns:
+            httpx.Response: the recorded response
+        """
+
+        import httpx
+
+        exchange: Optional[Exchange] = self.replay(key)
+        if exchange is None:
+            raise httpx.ConnectError(f'No recorded response to {method.upper()} {url} in {self.path}',
+                                     request=httpx.Request(method.upper(), url))
+
+        delay: float = self.delay(exchange)
+        if delay:
+            await asyncio.sleep(delay)
+
+        return exchange.to_httpx_response(method)
+
+    def delay(self, exchange: Exchange) -> float:
+        """How long to hold a replayed response back, to reproduce the original timing
+
+        Args:
+            exchange (Exchange): the replayed exchange
+
+        Returns:
+            float: seconds to wait
+        """
+
+        return exchange.elapsed / self.speed if self.speed else 0.0
+
+    def rewind(self) -> None:
+        """Start replaying every request from its first recorded response again"""
+
+        with self._lock:
+            self._positions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts of exchanges recorded, replayed, and requests with no recording
+
+        Returns:
+            Dict[str, Any]: the counters, and the mode
+        """
+
+        with self._lock:
+            return {'mode': self.mode, 'recorded': self.recorded, 'replayed': self.replayed, 'misses': self.misses}
+
+    def close(self) -> None:
+        """Commit anything recorded and close the file"""
+
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def _archive_from_env() -> Optional[Archive]:
+    """Open the archive described by PPP_ARCHIVE, which is record:<path> or replay:<path>.
+        Replays wait as PPP_REPLAY_SPEED says, 1 by default for the original timing.
+    """
+
+    setting: str = env_config.get('PPP_ARCHIVE') or ''
+    if not setting:
+        return None
+
+    mode, _, path = setting.partition(':')
+    if mode not in ARCHIVE_MODES or not path:
+        raise ValueError(f'Invalid PPP_ARCHIVE "{setting}". Expected record:<path> or replay:<path>')
+
+    return Archive(path, mode, float(env_config.get('PPP_REPLAY_SPEED') or 1))
+
+
+def get_archive() -> Optional[Archive]:
+    """Return the archive the brokers record to or replay from, opening it on first use
+
+    Returns:
+        Optional[Archive]: the archive, or None when PPP_ARCHIVE is not set
+    """
+
+    global _archive, _archive_loaded
+
+    if not _archive_loaded:
+        with _archive_lock:
+            if not _archive_loaded:
+                _archive = _archive_from_env()
+                _archive_loaded = True
+
+    return _archive
+
+
+def close_archive() -> None:
+    """Close the archive, saving anything recorded. The next request opens it again from the config."""
+
+    global _archive, _archive_loaded
+
+    with _archive_lock:
+        archive: Optional[Archive] = _archive
+        _archive = None
+        _archive_loaded = False
+
+    if archive is not None:
+        archive.close()
+
+
+env_config.on_reload(close_archive)
+# Recordings are committed in batches, so save the last batch on the way out
+atexit.register(close_archive)
@@ -0,0 +1,296 @@
+import asyncio
+import weakref
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+from requests.auth import HTTPBasicAuth
+from .broker import SUPPORTED_METHODS, env_config, resolve_url
+from .helpers import check_required_env_vars, vendor_for_url
+from .ratelimit import get_limiter
+from .retry import RetryStats, retry_delay
+from .transport import build_client, import_httpx
+
+# As in the broker, the optional subsystems are imported where they are used
+if TYPE_CHECKING:
+    import httpx
+    from .archive import Archive
+    from .cache import CacheEntry
+    from .keys import KeyPool
+    from .prefilter import Prefilter
+
+
+# One shared client, and so one shared connection pool, per running event loop.
+# An httpx.AsyncClient cannot be used across event loops, so it is keyed on the loop.
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]' = weakref.WeakKeyDictionary()
+
+
+def _build_client() -> 'httpx.AsyncClient':
+    """Create an async client with a sized connection pool, connection-level retries,
+        and the proxy and SSL settings from the environment. HTTP/2 is used when
+        PPP_HTTP_TRANSPORT is http2.
+
+    Returns:
+        httpx.AsyncClient: a new, configured client
+    """
+
+    pool_maxsize: int = int(env_config.get('PPP_POOL_MAXSIZE') or 10)
+    async_pool_maxsize: int = int(env_config.get('PPP_ASYNC_POOL_MAXSIZE') or pool_maxsize * 10)
+
+    return build_client(asynchronous=True, max_connections=async_pool_maxsize)
+
+
+def get_client() -> 'httpx.AsyncClient':
+    """Return the shared async client for the running event loop, creating it on first use
+
+    Raises:
+        ImportError: this will raise if httpx is not installed
+
+    Returns:
+        httpx.AsyncClient: the shared client for the running event loop
+    """
+
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _build_client()
+        _clients[loop] = client
+
+    return client
+
+
+def _forget_clients() -> None:
+    """Drop every shared client so the next request builds one from the reloaded config"""
+
+    _clients.clear()
+
+
+env_config.on_reload(_forget_clients)
+
+
+async def close_client() -> None:
+    """Close the shared async client of the running event loop, releasing its connections"""
+
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def async_make_request(
+    method: str,
+    url: str,
+    headers: Dict[str, str] = None,
+    auth: HTTPBasicAuth = None,
+    params: Dict[str, Any] = None,
+    data: Dict[str, Any] = None,
+    json: Dict[str, Any] = None,
+    idempotent: Optional[bool] = None,
+    max_retries: Optional[int] = None,
+    endpoint: Optional[str] = None,
+    key_pool: Optional['KeyPool'] = None,
+    indicator: Optional[str] = None
+) -> 'httpx.Response':
+    """Perform an HTTP request on behalf of a calling coroutine. This is the awaitable
+        counterpart of broker.make_request, and shares one connection pool per event loop.
+        Retries, caching and coalescing follow the same rules as make_request.
+
+    Args:
+        method (str): the HTTP method to use
+        url (str): the API URL to call
+        headers (Dict[str, str], optional): the HTTP headers to use in the request. Defaults to None.
+        auth (HTTPBasicAuth, optional): basic auth credentials for the request. Defaults to None.
+        params (Dict[str, Any], optional): the query parameters to use in the request. Defaults to None.
+        data (Dict[str, Any], optional): the data to use in the request. Defaults to None.
+        json (Dict[str, Any], optional): the json data to use in the request. Defaults to None.
+        idempotent (Optional[bool], optional): whether the request is safe to send twice, e.g.
+            a search sent as a POST. Defaults to None, which decides from the HTTP method.
+        max_retries (Optional[int], optional): the retry budget for this call. Defaults to
+            None, which uses PPP_RETRY_MAX_<METHOD> or PPP_RETRY_MAX.
+        endpoint (Optional[str], optional): the name of the calling connector, used to pick
+            its cache TTL. Defaults to None.
+        key_pool (Optional[KeyPool], optional): the pool to take the API key from on each
+            attempt, as in make_request. Defaults to None.
+        indicator (Optional[str], optional): the URL or domain being looked up, skipped
+            as in make_request when the pre-filter matches it. Defaults to None.
+
+    Raises:
+        ValueError: this will raise if an invalid HTTP method is passed
+
+    Returns:
+        httpx.Response: the HTTP response from the request
+    """
+
+    # Define required environment variables
+    required_vars: List[str] = []
+
+    # Check and ensure that required variables are present, exits if not
+    check_required_env_vars(env_config, required_vars)
+
+    if method.upper() not in SUPPORTED_METHODS:
+        raise ValueError(f'Unsupported HTTP method: {method}')
+
+    from . import hooks
+    from .cache import get_cache, is_cacheable, request_key
+    from .coalesce import coalescing_enabled, single_flight
+
+    # Indicators on the local allowlist are known to be benign, so don't pay to look them up
+    if indicator is not None:
+        from .prefilter import async_skipped_response, get_prefilter
+
+        prefilter: Optional['Prefilter'] = get_prefilter()
+        if prefilter is not None and prefilter.matches(indicator):
+            return async_skipped_response(method, url, indicator)
+
+    # Serve idempotent lookups from the response cache when it is turned on, and share
+    # one in-flight request between concurrent callers making the same lookup
+    cache = get_cache()
+    coalesce: bool = coalescing_enabled()
+    key: Optional[str] = None
+    if (cache is not None or coalesce) and is_cacheable(method, idempotent):
+        key = request_key(method, url, headers, params, data, json)
+
+    # An expired entry with an ETag or Last-Modified is revalidated rather than re-fetched
+    stale: Optional['CacheEntry'] = None
+    if cache is not None and key is not None:
+        entry, stale = cache.lookup(key)
+        if entry is not None:
+            if hooks.enabled:
+                hooks.record_cache_hit(method, url, endpoint, entry.status_code, entry.content)
+            return entry.to_httpx_response(method)
+
+    if coalesce and key is not None:
+        return await single_flight.async_do(key, _async_send_request, method, url, headers, auth, params,
+                                            data, json, idempotent, max_retries, endpoint,
+                                            key if cache is not None else None, key_pool, stale)
+
+    return await _async_send_request(method, url, headers, auth, params, data, json, idempotent,
+                                     max_retries, endpoint, key if cache is not None else None, key_pool,
+                                     stale)
+
+
+async def _async_send_request(method: str,
+                              url: str,
+                              headers: Optional[Dict[str, str]],
+                              auth: Optional[HTTPBasicAuth],
+                              params: Optional[Dict[str, Any]],
+                              data: Optional[Dict[str, Any]],
+                              json: Optional[Dict[str, Any]],
+                              idempotent: Optional[bool],
+                              max_retries: Optional[int],
+                              endpoint: Optional[str],
+                              cache_key: Optional[str],
+                              key_pool: Optional['KeyPool'] = None,
+                              stale: Optional['CacheEntry'] = None) -> 'httpx.Response':
+    """Send a request through the vendor's rate limiter and the loop's shared client,
+        retrying as make_request describes, and store the response when a cache key is given.
+        With a stale entry the request is made conditional, and a 304 is answered from it.
+
+    Returns:
+        httpx.Response: the final HTTP response
+    """
+
+    from . import hooks, scheduler
+    from .archive import get_archive
+    from .cache import get_cache
+
+    httpx = import_httpx()
+    client: httpx.AsyncClient = get_client()
+
+    limiter = get_limiter(url)
+    vendor: str = vendor_for_url(url)
+
+    # requests silently drops None-valued query parameters, httpx does not
+    if params is not None:
+        params = {key: value for key, value in params.items() if value is not None}
+
+    # PPP_ARCHIVE records every attempt, or answers it from a recording without the network
+    archive: Optional['Archive'] = get_archive()
+    archive_key: Optional[str] = (archive.key(method, url, headers, params, data, json)
+                                  if archive is not None else None)
+
+    retries: int = 0
+    backoff: float = 0.0
+    rotations: int = 0
+    # Read once, so a hook registered mid-call can't leave an attempt half instrumented
+    instrumented: bool = hooks.enabled
+    if stale is not None:
+        headers = {**(headers or {}), **stale.validators}
+    send_headers, send_params, send_json = headers, params, json
+
+    while True:
+        if key_pool is not None:
+            api_key: str = key_pool.acquire()
+            send_headers, send_params, send_json = key_pool.apply(api_key, headers, params, json)
+            limiter = key_pool.limiter(api_key) or get_limiter(url)
+
+        try:
+            # Wait for a token from the vendor's rate limiter, if one is configured, in priority order
+            waited: float = await scheduler.async_acquire(limiter, vendor) if limiter is not None else 0.0
+
+            extensions: Optional[Dict[str, Any]] = None
+            if instrumented:
+                event: hooks.RequestEvent = hooks.begin(method, url, endpoint, retries + 1, waited)
+                trace: hooks.AsyncTrace = hooks.AsyncTrace()
+                extensions = {'trace': trace}
+
+            if archive is not None and archive.replaying:
+                response: httpx.Response = await archive.async_response(archive_key, method, url)
+            else:
+                response = await client.request(method.upper(),
+                                                resolve_url(url),
+                                                headers=send_headers,
+                                                auth=httpx.BasicAuth(auth.username, auth.password) if auth else None,
+                                                params=send_params,
+                                                data=data,
+                                                json=send_json,
+                                                extensions=extensions)
+        except BaseException as e:
+            # Hand the key back whatever went wrong, including the call being cancelled
+            # while it waits for a token
+            if key_pool is not None:
+                key_pool.release(api_key)
+            if instrumented and isinstance(e, httpx.HTTPError):
+                hooks.record_error(event, e)
+            raise
+
+        if instrumented:
+            trace.record(event, response)
+
+        if archive is not None and archive.recording:
+            archive.record(archive_key, method, url, response)
+
+        delay: Optional[float] = retry_delay(method, response.status_code, response.headers,
+                                             retries, idempotent, max_retries)
+
+        # Move straight on to another key when this one has run out of quota
+        if key_pool is not None:
+            text: str = response.text if response.status_code == 403 else ''
+            if (key_pool.release(api_key, response.status_code, response.headers, text)
+                    and rotations < len(key_pool) - 1 and key_pool.available()):
+                rotations += 1
+                delay = 0.0
+
+        if delay is None:
+            break
+
+        if instrumented:
+            event.retry_delay = delay
+            hooks.emit('retry', event)
+
+        await asyncio.sleep(delay)
+        retries += 1
+        backoff += delay
+
+    response.retry_stats = RetryStats(retries, backoff)
+
+    if instrumented:
+        hooks.emit('post_response', event)
+
+    if cache_key is not None:
+        if stale is not None and response.status_code == 304:
+            # Nothing has changed, so serve the stored body and keep it for another TTL
+            await response.aclose()
+            response = get_cache().revalidated(cache_key, stale, response, endpoint).to_httpx_response(method)
+            response.retry_stats = RetryStats(retries, backoff)
+        else:
+            get_cache().store(cache_key, response, endpoint)
+
+    return response
@@ -0,0 +1,163 @@
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, \
+    Iterator, NamedTuple, Optional, Set, Union
+
+
+_SENTINEL: object = object()
+
+
+class BatchResult(NamedTuple):
+    """The outcome of a single query in a batch
+
+    Attributes:
+        query (Any): the query that was passed to the connector
+        result (Any): what the connector returned, or None if it raised
+        error (BaseException): the exception the connector raised, or None if it succeeded
+    """
+
+    query: Any
+    result: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        """True when the connector returned without raising"""
+        return self.error is None
+
+
+def _call(connector: Callable[..., Any], query: Any, args: tuple, kwargs: Dict[str, Any]) -> BatchResult:
+    """Call a connector for one query, capturing any exception in the result. Connectors
+        call sys.exit when a required setting is missing, which is captured too, rather
+        than ending a worker thread with a bare SystemExit."""
+
+    try:
+        return BatchResult(query, connector(*args, query, **kwargs))
+    except (Exception, SystemExit) as e:
+        return BatchResult(query, error=e)
+
+
+def batch_lookup(connector: Callable[..., Any],
+                 queries: Iterable[Any],
+                 *args: Any,
+                 concurrency: int = 10,
+                 **kwargs: Any) -> Iterator[BatchResult]:
+    """Run a connector over many queries on a thread pool, yielding results as they complete.
+        The query is passed as the last positional argument, after any extra positional
+        arguments, so `batch_lookup(spycloud_ato_search, emails, 'email')` calls
+        `spycloud_ato_search('email', email)` for each email. At most `concurrency` queries
+        are in flight at once, so `queries` may be a lazy iterable of any size. Keep
+        PPP_POOL_MAXSIZE at or above `concurrency` so every worker gets a kept-alive connection.
+
+    Args:
+        connector (Callable[..., Any]): the connector function to call, e.g. urlscan_search
+        queries (Iterable[Any]): the queries to look up
+        *args (Any): positional arguments placed before the query on every call
+        concurrency (int, optional): the maximum number of calls in flight. Defaults to 10.
+        **kwargs (Any): keyword arguments passed to every call
+
+    Raises:
+        ValueError: this will raise if concurrency is less than 1
+
+    Yields:
+        BatchResult: the query with its result or error, in completion order
+    """
+
+    if concurrency < 1:
+        raise ValueError(f'concurrency must be at least 1, got {concurrency}')
+
+    query_iter: Iterator[Any] = iter(queries)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending: Set[Future] = set()
+
+        # Each call runs in a copy of the caller's context, so e.g. its priority class carries over
+        for query in query_iter:
+            pending.add(executor.submit(copy_context().run, _call, connector, query, args, kwargs))
+            if len(pending) >= concurrency:
+                break
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+                # Top the pool back up for every query that finished
+                query = next(query_iter, _SENTINEL)
+                if query is not _SENTINEL:
+                    pending.add(executor.submit(copy_context().run, _call, connector, query, args, kwargs))
+
+
+async def _async_call(connector: Callable[..., Awaitable[Any]], query: Any, args: tuple,
+                      kwargs: Dict[str, Any]) -> BatchResult:
+    """Await a connector for one query, capturing any exception in the result, including
+        the SystemExit a connector raises when a required setting is missing"""
+
+    try:
+        return BatchResult(query, await connector(*args, query, **kwargs))
+    except (Exception, SystemExit) as e:
+        return BatchResult(query, error=e)
+
+
+async def async_batch_lookup(connector: Callable[..., Awaitable[Any]],
+                             queries: Union[Iterable[Any], AsyncIterable[Any]],
+                             *args: Any,
+                             concurrency: int = 100,
+                             **kwargs: Any) -> AsyncIterator[BatchResult]:
+    """Asynchronous version of batch_lookup for async connectors such as async_urlscan_search.
+        All calls run on the current event loop, with at most `concurrency` in flight.
+
+    Args:
+        connector (Callable[..., Awaitable[Any]]): the async connector function to call
+        queries (Union[Iterable[Any], AsyncIterable[Any]]): the queries to look up
+        *args (Any): positional arguments placed before the query on every call
+        concurrency (int, optional): the maximum number of calls in flight. Defaults to 100.
+        **kwargs (Any): keyword arguments passed to every call
+
+    Raises:
+        ValueError: this will raise if concurrency is less than 1
+
+    Yields:
+        BatchResult: the query with its result or error, in completion order
+    """
+
+    if concurrency < 1:
+        raise ValueError(f'concurrency must be at least 1, got {concurrency}')
+
+    if isinstance(queries, AsyncIterable):
+        query_iter: AsyncIterator[Any] = queries.__aiter__()
+    else:
+        query_iter: AsyncIterator[Any] = _aiter(queries)
+
+    pending: Set[asyncio.Task] = set()
+    exhausted: bool = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    query = await query_iter.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(_async_call(connector, query, args, kwargs)))
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # Only reached with work pending if the caller stopped iterating early
+        for task in pending:
+            task.cancel()
+
+
+async def _aiter(items: Iterable[Any]) -> AsyncIterator[Any]:
+    """Wrap a regular iterable as an async iterator"""
+
+    for item in items:
+        yield item
+
@@ -1,11 +1,154 @@
 import sys
-from typing import Callable, Dict, Any, List
+import threading
+import time
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+from urllib.parse import urlsplit, urlunsplit
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from .helpers import check_required_env_vars, combine_env_configs
+from urllib3.util.retry import Retry
+from .helpers import check_required_env_vars, Config, get_config, vendor_for_url
+from .ratelimit import get_limiter
+from .retry import RetryStats, retry_delay
+from .transport import HttpxTransport, close_transport, get_transport, request_timeout
 
+# The optional subsystems are imported where they are used, so importing the broker
+# doesn't load sqlite3 and the rest for callers that never turn them on
+if TYPE_CHECKING:
+    from .archive import Archive
+    from .cache import CacheEntry
+    from .keys import KeyPool
+    from .prefilter import Prefilter
 
-env_config: Dict[str, Any] = combine_env_configs()
+
+env_config: Config = get_config()
+
+SUPPORTED_METHODS: List[str] = ['GET', 'POST', 'PUT', 'DELETE', 'PATCH']
+
+# One long-lived session per scheme://host, so that connections are pooled and
+# kept alive across calls instead of paying a TCP+TLS handshake on every request
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock: threading.Lock = threading.Lock()
+
+
+def resolve_url(url: str) -> str:
+    """Point a vendor URL at PPP_API_BASE_URL when it is set, keeping the path and
+        query. This lets every connector be exercised against a local stub server.
+
+    Args:
+        url (str): the vendor URL built by a connector
+
+    Returns:
+        str: the URL that should actually be requested
+    """
+
+    base_url: str = env_config.get('PPP_API_BASE_URL') or ''
+    if not base_url:
+        return url
+
+    parts = urlsplit(url)
+    base = urlsplit(base_url)
+
+    return urlunsplit((base.scheme, base.netloc, base.path.rstrip('/') + parts.path,
+                       parts.query, parts.fragment))
+
+
+def _session_key(url: str) -> str:
+    """Build the key used to look up the pooled session for a URL
+
+    Args:
+        url (str): the URL being requested
+
+    Returns:
+        str: the lowercased scheme://host[:port] portion of the URL
+    """
+
+    parts = urlsplit(url)
+
+    return f'{parts.scheme}://{parts.netloc}'.lower()
+
+
+def _build_session() -> requests.Session:
+    """Create a session with a sized connection pool, connection-level retries, and
+        the proxy and SSL settings from the environment applied once
+
+    Returns:
+        requests.Session: a new, configured session
+    """
+
+    pool_connections: int = int(env_config.get('PPP_POOL_CONNECTIONS') or 4)
+    pool_maxsize: int = int(env_config.get('PPP_POOL_MAXSIZE') or 10)
+    connect_retries: int = int(env_config.get('PPP_CONNECT_RETRIES') or 3)
+
+    # Only retry failures to establish a connection here. Nothing has reached the
+    # vendor at that point, so it is safe for every HTTP method. Read errors are raised
+    # as they are, so a read timeout surfaces as requests.ReadTimeout.
+    retry: Retry = Retry(total=connect_retries, connect=connect_retries, read=False, status=0,
+                         other=0, backoff_factor=0.1, raise_on_status=False)
+    from .hooks import TimedHTTPAdapter
+
+    adapter: HTTPAdapter = TimedHTTPAdapter(pool_connections=pool_connections,
+                                            pool_maxsize=pool_maxsize,
+                                            max_retries=retry)
+
+    session: requests.Session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    session.proxies = {
+        'http': env_config['PPP_HTTP_PROXY'] if 'PPP_HTTP_PROXY' in env_config else '',
+        'https': env_config['PPP_HTTPS_PROXY'] if 'PPP_HTTPS_PROXY' in env_config else ''
+    }
+
+    session.verify = False if 'VERIFY_SSL' in env_config and env_config['VERIFY_SSL'].lower() == 'false' else True
+    if session.verify is False:
+        import urllib3
+        urllib3.disable_warnings()
+
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """Return the pooled session for the host of a URL, creating it on first use
+
+    Args:
+        url (str): the URL that is about to be requested
+
+    Returns:
+        requests.Session: the long-lived session for that host
+    """
+
+    key: str = _session_key(url)
+
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _build_session()
+                _sessions[key] = session
+
+    return session
+
+
+def close_sessions() -> None:
+    """Close every pooled session and drop it, along with the httpx transport if one is
+        in use, releasing all kept-alive connections. The next request to a host will
+        build a fresh session.
+    """
+
+    with _sessions_lock:
+        sessions: List[requests.Session] = list(_sessions.values())
+        _sessions.clear()
+
+    for session in sessions:
+        session.close()
+
+    close_transport()
+
+
+# Sessions hold proxy and SSL settings resolved from the config, so rebuild them on reload
+env_config.on_reload(close_sessions)
 
 
 def make_request(
@@ -15,9 +158,18 @@ def make_request(
     auth: HTTPBasicAuth = None,
     params: Dict[str, Any] = None,
     data: Dict[str, Any] = None,
-    json: Dict[str, Any] = None
+    json: Dict[str, Any] = None,
+    idempotent: Optional[bool] = None,
+    max_retries: Optional[int] = None,
+    endpoint: Optional[str] = None,
+    stream: bool = False,
+    key_pool: Optional['KeyPool'] = None,
+    indicator: Optional[str] = None
 ) -> requests.Response:
-    """Perform an HTTP request on behalf of a calling function
+    """Perform an HTTP request on behalf of a calling function. 429s, and 502/503/504s
+        for idempotent requests, are retried with backoff. How much retrying the call
+        needed is attached to the response as `retry_stats`. Identical idempotent lookups
+        made at the same time by several threads share one request and its response.
 
     Args:
         method (str): the HTTP method to use
@@ -26,6 +178,20 @@ def make_request(
         params (Dict[str, Any], optional): the query parameters to use in the request. Defaults to None.
         data (Dict[str, Any], optional): the data to use in the request. Defaults to None.
         json (Dict[str, Any], optional): the json data to use in the request. Defaults to None.
+        idempotent (Optional[bool], optional): whether the request is safe to send twice, e.g.
+            a search sent as a POST. Defaults to None, which decides from the HTTP method.
+        max_retries (Optional[int], optional): the retry budget for this call. Defaults to
+            None, which uses PPP_RETRY_MAX_<METHOD> or PPP_RETRY_MAX.
+        endpoint (Optional[str], optional): the name of the calling connector, used to pick
+            its cache TTL. Defaults to None.
+        stream (bool, optional): leave the body unread so it can be consumed in chunks with
+            iter_content. Streamed responses are never cached. Defaults to False.
+        key_pool (Optional[KeyPool], optional): the pool to take the API key from on each
+            attempt. A key that runs out of quota is benched, and the request is re-sent at
+            once with another key. Defaults to None.
+        indicator (Optional[str], optional): the URL or domain being looked up. When the
+            pre-filter from PPP_PREFILTER matches it, nothing is sent and a synthetic
+            skipped response is returned, see prefilter.skipped_response. Defaults to None.
 
     Raises:
         ValueError: this will raise if an invalid HTTP method is passed
@@ -40,33 +206,177 @@ def make_request(
     # Check and ensure that required variables are present, exits if not
     check_required_env_vars(env_config, required_vars)
 
-    proxies: Dict[str, Any] = {
-        'http': env_config['PPP_HTTP_PROXY'] if 'PPP_HTTP_PROXY' in env_config else '',
-        'https': env_config['PPP_HTTPS_PROXY'] if 'PPP_HTTPS_PROXY' in env_config else ''
-    }
+    if method.upper() not in SUPPORTED_METHODS:
+        raise ValueError(f'Unsupported HTTP method: {method}')
 
-    verify: bool = False if 'VERIFY_SSL' in env_config and env_config['VERIFY_SSL'].lower() == 'false' else True
-    if verify is False:
-        import urllib3
-        urllib3.disable_warnings()
+    from . import hooks
+    from .cache import get_cache, is_cacheable, request_key
+    from .coalesce import coalescing_enabled, single_flight
 
-    method_map: Dict[str, Callable] = {
-        'GET': requests.get,
-        'POST': requests.post,
-        'PUT': requests.put,
-        'DELETE': requests.delete,
-        'PATCH': requests.patch
-    }
+    # Indicators on the local allowlist are known to be benign, so don't pay to look them up
+    if indicator is not None:
+        from .prefilter import get_prefilter, skipped_response
 
-    request_func = method_map.get(method.upper())
-    if not request_func:
-        raise ValueError(f'Unsupported HTTP method: {method}')
+        prefilter: Optional['Prefilter'] = get_prefilter()
+        if prefilter is not None and prefilter.matches(indicator):
+            return skipped_response(url, indicator)
+
+    # Serve idempotent lookups from the response cache when it is turned on, and share
+    # one in-flight request between concurrent callers making the same lookup
+    cache = get_cache()
+    coalesce: bool = coalescing_enabled()
+    key: Optional[str] = None
+    if (cache is not None or coalesce) and not stream and is_cacheable(method, idempotent):
+        key = request_key(method, url, headers, params, data, json)
+
+    # An expired entry with an ETag or Last-Modified is revalidated rather than re-fetched
+    stale: Optional['CacheEntry'] = None
+    if cache is not None and key is not None:
+        entry, stale = cache.lookup(key)
+        if entry is not None:
+            if hooks.enabled:
+                hooks.record_cache_hit(method, url, endpoint, entry.status_code, entry.content)
+            return entry.to_response()
+
+    if coalesce and key is not None:
+        return single_flight.do(key, _send_request, method, url, headers, auth, params, data, json,
+                                idempotent, max_retries, endpoint, stream, key if cache is not None else None,
+                                key_pool, stale)
+
+    return _send_request(method, url, headers, auth, params, data, json, idempotent, max_retries,
+                         endpoint, stream, key if cache is not None else None, key_pool, stale)
+
+
+def _send_request(method: str,
+                  url: str,
+                  headers: Optional[Dict[str, str]],
+                  auth: Optional[HTTPBasicAuth],
+                  params: Optional[Dict[str, Any]],
+                  data: Optional[Dict[str, Any]],
+                  json: Optional[Dict[str, Any]],
+                  idempotent: Optional[bool],
+                  max_retries: Optional[int],
+                  endpoint: Optional[str],
+                  stream: bool,
+                  cache_key: Optional[str],
+                  key_pool: Optional['KeyPool'] = None,
+                  stale: Optional['CacheEntry'] = None) -> requests.Response:
+    """Send a request through the vendor's rate limiter and the pooled session, retrying
+        as make_request describes, and store the response when a cache key is given.
+        With a stale entry the request is made conditional, and a 304 is answered from it.
+
+    Returns:
+        requests.Response: the final HTTP response
+    """
+
+    from . import hooks, scheduler
+    from .archive import get_archive
+    from .cache import get_cache
+
+    limiter = get_limiter(url)
+    vendor: str = vendor_for_url(url)
+    vendor_url: str = url
+    url = resolve_url(url)
+    # PPP_HTTP_TRANSPORT can hand requests to httpx, e.g. to multiplex them over HTTP/2
+    transport: Optional[HttpxTransport] = get_transport()
+    session: Optional[requests.Session] = get_session(url) if transport is None else None
+    # PPP_ARCHIVE records every attempt, or answers it from a recording without the network
+    archive: Optional['Archive'] = get_archive()
+    archive_key: Optional[str] = (archive.key(method, vendor_url, headers, params, data, json)
+                                  if archive is not None else None)
+
+    retries: int = 0
+    backoff: float = 0.0
+    rotations: int = 0
+    # Read once, so a hook registered mid-call can't leave an attempt half instrumented
+    instrumented: bool = hooks.enabled
+    if stale is not None:
+        headers = {**(headers or {}), **stale.validators}
+    send_headers, send_params, send_json = headers, params, json
+
+    while True:
+        if key_pool is not None:
+            api_key: str = key_pool.acquire()
+            send_headers, send_params, send_json = key_pool.apply(api_key, headers, params, json)
+            limiter = key_pool.limiter(api_key) or get_limiter(vendor_url)
+
+        try:
+            # Wait for a token from the vendor's rate limiter, if one is configured, in priority order
+            waited: float = scheduler.acquire(limiter, vendor) if limiter is not None else 0.0
+
+            if instrumented:
+                event: hooks.RequestEvent = hooks.begin(method, vendor_url, endpoint, retries + 1, waited)
+
+            if archive is not None and archive.replaying:
+                response: requests.Response = archive.response(archive_key, method, vendor_url)
+            elif transport is not None:
+                response = transport.request(method.upper(), url, headers=send_headers,
+                                             auth=auth, params=send_params, data=data,
+                                             json=send_json, stream=stream)
+            else:
+                # proxies and verify are passed explicitly as well, otherwise requests lets
+                # environment variables such as REQUESTS_CA_BUNDLE override the session values
+                response = session.request(method.upper(),
+                                           url,
+                                           headers=send_headers,
+                                           auth=auth,
+                                           params=send_params,
+                                           data=data,
+                                           json=send_json,
+                                           proxies=session.proxies,
+                                           verify=session.verify,
+                                           timeout=request_timeout(),
+                                           stream=stream)
+        except BaseException as e:
+            # Hand the key back whatever went wrong, including an interrupt while waiting for a token
+            if key_pool is not None:
+                key_pool.release(api_key)
+            if instrumented and isinstance(e, requests.RequestException):
+                hooks.record_error(event, e)
+            raise
+
+        if instrumented:
+            hooks.record_response(event, response, stream)
+
+        if archive is not None and archive.recording:
+            # A streamed body is read whole, so that it can be archived
+            archive.record(archive_key, method, vendor_url, response)
+
+        delay: Optional[float] = retry_delay(method, response.status_code, response.headers,
+                                             retries, idempotent, max_retries)
+
+        # Move straight on to another key when this one has run out of quota
+        if key_pool is not None:
+            text: str = response.text if response.status_code == 403 else ''
+            if (key_pool.release(api_key, response.status_code, response.headers, text)
+                    and rotations < len(key_pool) - 1 and key_pool.available()):
+                rotations += 1
+                delay = 0.0
+
+        if delay is None:
+            break
+
+        if instrumented:
+            event.retry_delay = delay
+            hooks.emit('retry', event)
+
+        response.close()
+        time.sleep(delay)
+        retries += 1
+        backoff += delay
+
+    response.retry_stats = RetryStats(retries, backoff)
+
+    if instrumented:
+        hooks.emit('post_response', event)
+
+    if cache_key is not None:
+        if stale is not None and response.status_code == 304:
+            # Nothing has changed, so serve the stored body and keep it for another TTL
+            response.close()
+            response = get_cache().revalidated(cache_key, stale, response, endpoint).to_response()
+            response.retry_stats = RetryStats(retries, backoff)
+        else:
+            get_cache().store(cache_key, response, endpoint)
 
-    return request_func(url,
-                        headers=headers,
-                        auth=auth,
-                        params=params,
-                        data=data,
-                        json=json,
-                        proxies=proxies,
-                        verify=verify)
+    return response
@@ -0,0 +1,543 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, NamedTuple, Optional, Set, Tuple, TYPE_CHECKING
+import requests
+from requests.structures import CaseInsensitiveDict
+from .helpers import Config, get_config
+from .retry import RetryStats
+
+if TYPE_CHECKING:
+    import httpx
+
+
+env_config: Config = get_config()
+
+# Credentials are left out of cache keys, so the same lookup made with a different
+# API key is still a hit. Header names are compared lowercased.
+AUTH_HEADERS: Set[str] = {'authorization', 'x-api-key', 'api-key', 'proxy-authorization'}
+AUTH_FIELDS: Set[str] = {'key', 'api_key', 'apikey'}
+
+# Headers that describe how the body travelled rather than what it is. The stored body
+# is already decoded, so replaying these would make clients try to decode it again.
+TRANSPORT_HEADERS: Set[str] = {'connection', 'content-encoding', 'content-length',
+                               'keep-alive', 'transfer-encoding'}
+
+
+class CacheEntry(NamedTuple):
+    """A stored response
+
+    Attributes:
+        status_code (int): the HTTP status code
+        headers (Dict[str, str]): the response headers, without transport headers
+        content (bytes): the decoded response body
+        url (str): the URL the response came from
+        expires (float): the epoch time after which the entry is stale
+    """
+
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    url: str
+    expires: float
+
+    @property
+    def expired(self) -> bool:
+        """True once the entry has outlived its TTL"""
+        return time.time() >= self.expires
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """The conditional request headers that ask the vendor whether the entry is still
+            current, built from its ETag and Last-Modified. Empty if it has neither.
+        """
+
+        headers: CaseInsensitiveDict = CaseInsensitiveDict(self.headers)
+        conditional: Dict[str, str] = {}
+        if 'ETag' in headers:
+            conditional['If-None-Match'] = headers['ETag']
+        if 'Last-Modified' in headers:
+            conditional['If-Modified-Since'] = headers['Last-Modified']
+
+        return conditional
+
+    def to_response(self) -> requests.Response:
+        """Rebuild a requests.Response from the entry
+
+        Returns:
+            requests.Response: a response whose body is the stored content
+        """
+
+        response: requests.Response = requests.Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response.url = self.url
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        # Nothing was sent, so nothing was retried
+        response.retry_stats = RetryStats()
+
+        return response
+
+    def to_httpx_response(self, method: str) -> 'httpx.Response':
+        """Rebuild an httpx.Response from the entry, for the async broker
+
+        Args:
+            method (str): the HTTP method of the request being answered
+
+        Returns:
+            httpx.Response: a response whose body is the stored content
+        """
+
+        import httpx
+
+        response: httpx.Response = httpx.Response(self.status_code,
+                                                  headers=self.headers,
+                                                  content=self.content,
+                                                  request=httpx.Request(method.upper(), self.url))
+        response.from_cache = True
+        response.retry_stats = RetryStats()
+
+        return response
+
+
+def entry_from_response(response: Any, ttl: float) -> CacheEntry:
+    """Capture a requests.Response or httpx.Response as a cache entry
+
+    Args:
+        response (Any): the response to store
+        ttl (float): how many seconds the entry stays fresh
+
+    Returns:
+        CacheEntry: the entry to store
+    """
+
+    headers: Dict[str, str] = {name: value for name, value in response.headers.items()
+                               if name.lower() not in TRANSPORT_HEADERS}
+
+    return CacheEntry(response.status_code, headers, response.content, str(response.url),
+                      time.time() + ttl)
+
+
+def _strip_auth(values: Any) -> Any:
+    """Drop credential fields from a params, data or json mapping"""
+
+    if isinstance(values, dict):
+        return {key: value for key, value in values.items() if str(key).lower() not in AUTH_FIELDS}
+
+    return values
+
+
+def request_key(method: str,
+                url: str,
+                headers: Optional[Dict[str, str]] = None,
+                params: Optional[Dict[str, Any]] = None,
+                data: Optional[Any] = None,
+                json_body: Optional[Any] = None) -> str:
+    """Build the cache key of a request from its method, URL, params and body, with
+        credentials normalised out
+
+    Args:
+        method (str): the HTTP method
+        url (str): the request URL
+        headers (Optional[Dict[str, str]], optional): the request headers. Defaults to None.
+        params (Optional[Dict[str, Any]], optional): the query parameters. Defaults to None.
+        data (Optional[Any], optional): the form data. Defaults to None.
+        json_body (Optional[Any], optional): the json body. Defaults to None.
+
+    Returns:
+        str: a hex digest identifying the request
+    """
+
+    key_material: Dict[str, Any] = {
+        'method': method.upper(),
+        'url': url,
+        'headers': sorted((name.lower(), value) for name, value in (headers or {}).items()
+                          if name.lower() not in AUTH_HEADERS),
+        'params': _strip_auth(params),
+        'data': _strip_auth(data),
+        'json': _strip_auth(json_body),
+    }
+    encoded: bytes = json.dumps(key_material, sort_keys=True, default=str).encode()
+
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class SQLiteCacheBackend:
+    """A persistent cache backend stored in a single SQLite database file"""
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): the database file, created if it does not exist
+        """
+
+        self.path: str = path
+        self._lock: threading.Lock = threading.Lock()
+        # Imported here so that only callers who turn the cache on load sqlite3
+        import sqlite3
+
+        self._conn: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, '
+                           'status_code INTEGER, headers TEXT, content BLOB, url TEXT, expires REAL)')
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the stored entry for a key, fresh or not, or None"""
+        with self._lock:
+            row = self._conn.execute('SELECT status_code, headers, content, url, expires '
+                                     'FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        return CacheEntry(row[0], json.loads(row[1]), bytes(row[2]), row[3], row[4])
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """Store an entry, replacing any existing one"""
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                               (key, entry.status_code, json.dumps(entry.headers), entry.content,
+                                entry.url, entry.expires))
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        """Remove an entry if it exists"""
+        with self._lock:
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+
+
+class DirectoryCacheBackend:
+    """A persistent cache backend storing one file per entry in a directory"""
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): the directory, created if it does not exist
+        """
+
+        self.path: str = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        """The path of the file holding an entry"""
+        return os.path.join(self.path, f'{key}.cache')
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the stored entry for a key, fresh or not, or None"""
+        try:
+            with open(self._file(key), 'rb') as f:
+                meta: Dict[str, Any] = json.loads(f.readline())
+                content: bytes = f.read()
+        except (OSError, ValueError):
+            return None
+
+        return CacheEntry(meta['status_code'], meta['headers'], content, meta['url'], meta['expires'])
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """Store an entry, replacing any existing one"""
+        meta: Dict[str, Any] = {'status_code': entry.status_code, 'headers': entry.headers,
+                                'url': entry.url, 'expires': entry.expires}
+
+        # Write to a temporary file and move it into place, so readers never see half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(json.dumps(meta).encode() + b'\n')
+            f.write(entry.content)
+        os.replace(tmp_path, self._file(key))
+
+    def delete(self, key: str) -> None:
+        """Remove an entry if it exists"""
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        for name in os.listdir(self.path):
+            if name.endswith('.cache'):
+                self.delete(name[:-len('.cache')])
+
+
+class ResponseCache:
+    """A response cache with a bounded in-memory LRU in front of an optional persistent
+        backend. Entries are served for as long as the TTL of the connector that made them.
+        After that, an entry with an ETag or Last-Modified is revalidated with a conditional
+        request, and a 304 keeps its body for another TTL.
+    """
+
+    def __init__(self,
+                 max_entries: int = 1024,
+                 backend: Optional[Any] = None,
+                 default_ttl: float = 3600,
+                 ttls: Optional[Dict[str, float]] = None) -> None:
+        """
+        Args:
+            max_entries (int, optional): how many entries the in-memory LRU holds. Defaults to 1024.
+            backend (Optional[Any], optional): a persistent backend with get, set, delete and
+                clear methods, such as SQLiteCacheBackend. Defaults to None.
+            default_ttl (float, optional): seconds an entry stays fresh. Defaults to 3600.
+            ttls (Optional[Dict[str, float]], optional): per-connector TTLs keyed by connector
+                name, e.g. {'urlscan_search': 300}. A TTL of 0 disables caching. Defaults to None.
+        """
+
+        self.max_entries: int = max_entries
+        self.backend: Optional[Any] = backend
+        self.default_ttl: float = default_ttl
+        self.ttls: Dict[str, float] = dict(ttls or {})
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.revalidations: int = 0
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def ttl_for(self, endpoint: Optional[str]) -> float:
+        """The TTL for a connector, from `ttls`, then PPP_CACHE_TTL_<CONNECTOR>, then the default
+
+        Args:
+            endpoint (Optional[str]): the connector name, e.g. urlscan_search
+
+        Returns:
+            float: seconds an entry made by this connector stays fresh
+        """
+
+        if endpoint:
+            if endpoint in self.ttls:
+                return self.ttls[endpoint]
+            setting: Optional[str] = env_config.get(f'PPP_CACHE_TTL_{endpoint.upper()}')
+            if setting:
+                return float(setting)
+
+        return self.default_ttl
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Look up a fresh entry, checking memory first and then the persistent backend
+
+        Args:
+            key (str): the request key from request_key
+
+        Returns:
+            Optional[CacheEntry]: the entry, or None on a miss
+        """
+
+        return self.lookup(key)[0]
+
+    def lookup(self, key: str) -> Tuple[Optional[CacheEntry], Optional[CacheEntry]]:
+        """Look up an entry, fresh or not, checking memory first and then the persistent
+            backend. An expired entry with an ETag or Last-Modified is handed back for
+            revalidation, since the vendor may confirm that it is still current.
+
+        Args:
+            key (str): the request key from request_key
+
+        Returns:
+            Tuple[Optional[CacheEntry], Optional[CacheEntry]]: the fresh entry, or None on a
+                miss, and on a miss the expired entry to revalidate, if there is one
+        """
+
+        with self._lock:
+            entry: Optional[CacheEntry] = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None and (not entry.expired or entry.validators):
+                self._remember(key, entry)
+
+        with self._lock:
+            if entry is None or entry.expired:
+                self.misses += 1
+                return None, entry if entry is not None and entry.validators else None
+
+            self.hits += 1
+            return entry, None
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """Store an entry in memory and in the persistent backend
+
+        Args:
+            key (str): the request key from request_key
+            entry (CacheEntry): the entry to store
+        """
+
+        self._remember(key, entry)
+        if self.backend is not None:
+            self.backend.set(key, entry)
+
+    def store(self, key: str, response: Any, endpoint: Optional[str] = None) -> None:
+        """Store a successful response, using the TTL of the connector that made it
+
+        Args:
+            key (str): the request key from request_key
+            response (Any): a requests.Response or httpx.Response
+            endpoint (Optional[str], optional): the connector name. Defaults to None.
+        """
+
+        ttl: float = self.ttl_for(endpoint)
+        if ttl > 0 and 200 <= response.status_code < 300 and response.status_code != 206:
+            self.set(key, entry_from_response(response, ttl))
+
+    def revalidated(self, key: str, entry: CacheEntry, response: Any, endpoint: Optional[str] = None) -> CacheEntry:
+        """Renew an expired entry after the vendor answered its conditional request with a
+            304, taking any updated headers from the 304
+
+        Args:
+            key (str): the request key from request_key
+            entry (CacheEntry): the expired entry that was revalidated
+            response (Any): the 304 requests.Response or httpx.Response
+            endpoint (Optional[str], optional): the connector name. Defaults to None.
+
+        Returns:
+            CacheEntry: the renewed entry
+        """
+
+        headers: Dict[str, str] = dict(entry.headers)
+        lowered: Dict[str, str] = {name.lower(): name for name in headers}
+        for name, value in response.headers.items():
+            if name.lower() not in TRANSPORT_HEADERS:
+                headers[lowered.get(name.lower(), name)] = value
+
+        renewed: CacheEntry = entry._replace(headers=headers, expires=time.time() + self.ttl_for(endpoint))
+        self.set(key, renewed)
+        with self._lock:
+            self.revalidations += 1
+
+        return renewed
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        """Put an entry in the in-memory LRU, evicting the least recently used if it is full"""
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry, in memory and in the persistent backend"""
+
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss, eviction and revalidation counters, plus the number of entries held
+            in memory. A miss that was revalidated with a 304 counts as both.
+
+        Returns:
+            Dict[str, int]: the counters
+        """
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'revalidations': self.revalidations, 'entries': len(self._entries)}
+
+
+_cache: Optional[ResponseCache] = None
+_cache_loaded: bool = False
+_cache_set_in_code: bool = False
+_cache_lock: threading.Lock = threading.Lock()
+
+
+def _cache_from_env() -> Optional[ResponseCache]:
+    """Build the cache described by PPP_CACHE, which is one of memory, sqlite:<path> or
+        dir:<path>. Caching stays off when it is not set.
+    """
+
+    setting: str = env_config.get('PPP_CACHE') or ''
+    if not setting:
+        return None
+
+    kind, _, path = setting.partition(':')
+    backends: Dict[str, Any] = {'sqlite': SQLiteCacheBackend, 'dir': DirectoryCacheBackend}
+
+    if kind == 'memory':
+        backend = None
+    elif kind in backends and path:
+        backend = backends[kind](path)
+    else:
+        raise ValueError(f'Invalid PPP_CACHE "{setting}". Expected memory, sqlite:<path> or dir:<path>')
+
+    return ResponseCache(max_entries=int(env_config.get('PPP_CACHE_SIZE') or 1024),
+                         backend=backend,
+                         default_ttl=float(env_config.get('PPP_CACHE_TTL') or 3600))
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Return the cache used by the brokers, building it from PPP_CACHE on first use
+
+    Returns:
+        Optional[ResponseCache]: the cache, or None if caching is off
+    """
+
+    global _cache, _cache_loaded
+
+    if not _cache_loaded:
+        with _cache_lock:
+            if not _cache_loaded:
+                _cache = _cache_from_env()
+                _cache_loaded = True
+
+    return _cache
+
+
+def set_cache(cache: Optional[ResponseCache]) -> None:
+    """Install a cache for the brokers to use, or turn caching off with None
+
+    Args:
+        cache (Optional[ResponseCache]): the cache to use
+    """
+
+    global _cache, _cache_loaded, _cache_set_in_code
+
+    with _cache_lock:
+        _cache = cache
+        _cache_loaded = True
+        _cache_set_in_code = True
+
+
+def _forget_env_cache() -> None:
+    """Rebuild the cache from PPP_CACHE on next use, unless one was installed with set_cache"""
+
+    global _cache, _cache_loaded
+
+    with _cache_lock:
+        if not _cache_set_in_code:
+            _cache = None
+            _cache_loaded = False
+
+
+env_config.on_reload(_forget_env_cache)
+
+
+def is_cacheable(method: str, idempotent: Optional[bool] = None) -> bool:
+    """Only GETs, and POSTs marked idempotent such as searches, are cached
+
+    Args:
+        method (str): the HTTP method
+        idempotent (Optional[bool], optional): whether the caller marked the request idempotent
+
+    Returns:
+        bool: True if responses to this request may be cached
+    """
+
+    if idempotent is not None:
+        return idempotent and method.upper() in ('GET', 'POST')
+
+    return method.upper() == 'GET'
@@ -0,0 +1,417 @@
+"""Run a connector over many indicators from the command line, streaming NDJSON results.
+
+    ppp-connectors spycloud_ato_search email -i emails.txt -o results.ndjson -c 20 --checkpoint job.ckpt
+
+Indicators are read one at a time from a file or stdin, as plain lines, CSV or NDJSON,
+and each result is written as one JSON line as soon as it arrives, so memory use does not
+grow with the size of the input. With --checkpoint, progress is saved as the job runs and
+an interrupted job picks up where it stopped when it is run again.
+"""
+import argparse
+import csv
+import json
+import os
+import signal
+import sys
+import time
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+from .batch import BatchResult, batch_lookup
+from .helpers import get_config, json_loads, reload_config
+from .registry import ENDPOINTS, Endpoint, call, get_endpoint
+
+# Input formats, and the file extensions that select them
+INPUT_FORMATS: Dict[str, Tuple[str, ...]] = {
+    'lines': ('.txt',),
+    'csv': ('.csv',),
+    'ndjson': ('.ndjson', '.jsonl'),
+}
+
+
+class Checkpoint:
+    """The progress of a job. Input records are numbered from 1, and every record up to
+        the watermark is finished, along with those in `done` above it. Results finish
+        out of order, so only `done` grows while a slow record holds the watermark back.
+        The size of the output when the checkpoint was saved is kept, so that results
+        written after it can be dropped, and redone, on resume.
+    """
+
+    def __init__(self, path: str, job: Dict[str, Any]) -> None:
+        """
+        Args:
+            path (str): the checkpoint file, which is read if it exists
+            job (Dict[str, Any]): what identifies the job, e.g. its connector and input.
+                A checkpoint saved by a different job is refused.
+
+        Raises:
+            ValueError: this will raise if the file belongs to a different job
+        """
+
+        self.path: str = path
+        self.job: Dict[str, Any] = job
+        self.watermark: int = 0
+        self.done: Set[int] = set()
+        self.output_offset: Optional[int] = None
+        self.resumed: bool = False
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                state: Dict[str, Any] = json.load(file)
+            if state.get('job') != job:
+                raise ValueError(f'The checkpoint {path} was saved by a different job: {state.get("job")}')
+            self.watermark = state['watermark']
+            self.done = set(state['done'])
+            self.output_offset = state.get('output_offset')
+            self.resumed = True
+
+    def restart(self) -> None:
+        """Forget all progress, e.g. when the output it describes has gone"""
+
+        self.watermark = 0
+        self.done = set()
+        self.output_offset = None
+        self.resumed = False
+
+    def finished(self, number: int) -> bool:
+        return number <= self.watermark or number in self.done
+
+    def mark(self, number: int) -> None:
+        """Record that an input record is finished"""
+
+        self.done.add(number)
+        while self.watermark + 1 in self.done:
+            self.watermark += 1
+            self.done.discard(self.watermark)
+
+    def save(self, output_offset: Optional[int]) -> None:
+        """Write the checkpoint, replacing the previous one in a single step
+
+        Args:
+            output_offset (Optional[int]): the size of the output file, once flushed to disk
+        """
+
+        state: Dict[str, Any] = {'job': self.job, 'watermark': self.watermark, 'done': sorted(self.done),
+                                 'output_offset': output_offset}
+        temporary: str = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+
+def detect_format(path: str) -> str:
+    """Pick the input format from a file's extension, defaulting to plain lines
+
+    Args:
+        path (str): the input path, or - for stdin
+
+    Returns:
+        str: lines, csv or ndjson
+    """
+
+    extension: str = os.path.splitext(path)[1].lower()
+    for name, extensions in INPUT_FORMATS.items():
+        if extension in extensions:
+            return name
+
+    return 'lines'
+
+
+def read_indicators(stream: TextIO, input_format: str, field: Optional[str] = None) -> Iterator[Tuple[int, Any]]:
+    """Read indicators one record at a time. Blank records are read as None, and records
+        that can't be read as a ValueError, so the numbering always matches the input.
+
+    Args:
+        stream (TextIO): the input
+        input_format (str): `lines`, one indicator per line; `csv`, with a header row; or
+            `ndjson`, one JSON string or object per line
+        field (Optional[str], optional): the CSV column or NDJSON key holding the indicator.
+            Defaults to None, which uses the first CSV column, and requires NDJSON lines to
+            be strings.
+
+    Yields:
+        Tuple[int, Any]: the record number, counting from 1, and the indicator
+    """
+
+    if input_format == 'csv':
+        reader = csv.reader(stream)
+        header: List[str] = next(reader, [])
+        if field is not None and field not in header:
+            raise ValueError(f'The CSV input has no "{field}" column. Its columns are {", ".join(header)}')
+        column: int = header.index(field) if field is not None else 0
+        for number, row in enumerate(reader, 1):
+            value: str = row[column].strip() if len(row) > column else ''
+            yield number, value or None
+        return
+
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or input_format == 'lines':
+            yield number, line or None
+            continue
+
+        try:
+            record: Any = json_loads(line)
+        except ValueError as e:
+            yield number, ValueError(f'Invalid JSON on line {number}: {e}')
+            continue
+        if isinstance(record, dict) and field is not None:
+            record = record.get(field)
+        if record is not None and not isinstance(record, (str, int, float)):
+            yield number, ValueError(f'Line {number} has no indicator. Use --field to pick its key')
+            continue
+        yield number, record
+
+
+def format_result(number: int, item: BatchResult) -> bytes:
+    """Turn a lookup's outcome into one NDJSON line
+
+    Args:
+        number (int): the input record number
+        item (BatchResult): the lookup's outcome
+
+    Returns:
+        bytes: the line, with its newline
+    """
+
+    record: Dict[str, Any] = {'line': number, 'query': item.query, 'status': None, 'data': None, 'error': None}
+    if item.error is not None:
+        record['error'] = str(item.error) or type(item.error).__name__
+    else:
+        response: Any = item.result
+        record['status'] = response.status_code
+        try:
+            record['data'] = json_loads(response.content) if response.content else None
+        except ValueError:
+            record['data'] = response.text
+
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str).encode() + b'\n'
+
+
+def parse_param(value: str) -> Tuple[str, Any]:
+    """Parse a KEY=VALUE option. The value is read as JSON when it can be, so numbers and
+        lists keep their type, and as a string otherwise.
+    """
+
+    key, separator, raw = value.partition('=')
+    if not separator or not key:
+        raise argparse.ArgumentTypeError(f'Expected KEY=VALUE, got "{value}"')
+
+    try:
+        return key, json_loads(raw)
+    except ValueError:
+        return key, raw
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='ppp-connectors', description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='Run with --list to see every connector and its arguments.')
+    parser.add_argument('connector', nargs='?', help='the connector to run, e.g. urlscan_search')
+    parser.add_argument('args', nargs='*', help='arguments passed before each indicator, e.g. a search type')
+    parser.add_argument('-i', '--input', default='-', help='the input file, or - for stdin (default)')
+    parser.add_argument('-o', '--output', default='-', help='the output file, or - for stdout (default)')
+    parser.add_argument('-f', '--format', choices=list(INPUT_FORMATS),
+                        help='the input format. Defaults to one picked from the file extension, or lines')
+    parser.add_argument('--field', help='the CSV column or NDJSON key holding the indicator')
+    parser.add_argument('-c', '--concurrency', type=int, default=10, help='lookups in flight (default 10)')
+    parser.add_argument('-p', '--param', type=parse_param, action='append', default=[], metavar='KEY=VALUE',
+                        help='an extra argument for every call, may be repeated')
+    parser.add_argument('--rate-limit', help="the vendor's rate limit, e.g. 5/s, overriding PPP_RATELIMIT_<VENDOR>")
+    parser.add_argument('--cache', help='memory, sqlite:<path> or dir:<path>, overriding PPP_CACHE')
+    parser.add_argument('--checkpoint', help='save progress to this file, and resume from it if it exists')
+    parser.add_argument('--checkpoint-every', type=int, default=1000,
+                        help='results between checkpoint saves (default 1000)')
+    parser.add_argument('--list', action='store_true', help='list the connectors and exit')
+
+    return parser
+
+
+def _list_connectors() -> None:
+    for name, endpoint in ENDPOINTS.items():
+        print(f'{name} {" ".join(endpoint.args)}')
+
+
+class _Interrupts:
+    """Turns SIGINT and SIGTERM into KeyboardInterrupt, except while a result is being
+        written and marked finished. An interrupt then waits until both are done, so the
+        output and the checkpoint never disagree about a record.
+    """
+
+    def __init__(self) -> None:
+        self.deferring: bool = False
+        self.pending: bool = False
+
+    def handle(self, signum: int, frame: Any) -> None:
+        if self.deferring:
+            self.pending = True
+        else:
+            raise KeyboardInterrupt
+
+    def __enter__(self) -> '_Interrupts':
+        self.deferring = True
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.deferring = False
+        if self.pending and exc_info[0] is None:
+            self.pending = False
+            raise KeyboardInterrupt
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point of the ppp-connectors command
+
+    Args:
+        argv (Optional[List[str]], optional): the command line arguments. Defaults to sys.argv.
+
+    Returns:
+        int: the exit status, 0 once every indicator was looked up, even if some failed
+    """
+
+    parser: argparse.ArgumentParser = build_parser()
+    options: argparse.Namespace = parser.parse_args(argv)
+
+    if options.list:
+        _list_connectors()
+        return 0
+    if options.connector is None:
+        parser.error('a connector is required')
+    if options.concurrency < 1 or options.checkpoint_every < 1:
+        parser.error('--concurrency and --checkpoint-every must be at least 1')
+
+    try:
+        endpoint: Endpoint = get_endpoint(options.connector)
+    except ValueError as e:
+        print(f'[!] Error: {e}', file=sys.stderr)
+        return 1
+
+    if len(options.args) >= len(endpoint.args):
+        print(f'[!] Error: {endpoint.name} takes {len(endpoint.args)} arguments, '
+              f'{" ".join(endpoint.args)}, and the last comes from the input', file=sys.stderr)
+        return 1
+
+    # The overrides are applied as environment variables, like every other setting
+    overrides: Dict[str, str] = {}
+    if options.rate_limit:
+        overrides[f'PPP_RATELIMIT_{endpoint.vendor.name}'] = options.rate_limit
+    if options.cache:
+        overrides['PPP_CACHE'] = options.cache
+    if overrides:
+        os.environ.update(overrides)
+        if get_config().loaded:
+            reload_config()
+
+    input_format: str = options.format or detect_format(options.input)
+    params: Dict[str, Any] = dict(options.param)
+    job: Dict[str, Any] = {'connector': endpoint.name, 'args': options.args, 'params': params,
+                           'input': options.input, 'field': options.field}
+
+    checkpoint: Optional[Checkpoint] = None
+    if options.checkpoint:
+        try:
+            checkpoint = Checkpoint(options.checkpoint, job)
+        except ValueError as e:
+            print(f'[!] Error: {e}', file=sys.stderr)
+            return 1
+
+    input_stream: TextIO = sys.stdin if options.input == '-' else open(options.input, newline='', encoding='utf-8')
+    if (checkpoint is not None and checkpoint.resumed and options.output != '-'
+            and (not os.path.exists(options.output)
+                 or os.path.getsize(options.output) < (checkpoint.output_offset or 0))):
+        print(f'[!] The output {options.output} is missing results the checkpoint has, starting over',
+              file=sys.stderr)
+        checkpoint.restart()
+
+    output: BinaryIO
+    # The size of the output up to the last result marked finished. A result written but
+    # not yet marked, or only partly written, lies past it and is dropped on resume.
+    consistent_offset: Optional[int] = None
+    if options.output == '-':
+        output = sys.stdout.buffer
+    elif checkpoint is not None and checkpoint.resumed:
+        # Results written after the last save are redone, so drop them
+        output = open(options.output, 'r+b')
+        output.truncate(checkpoint.output_offset or 0)
+        output.seek(0, os.SEEK_END)
+        consistent_offset = output.tell()
+    else:
+        output = open(options.output, 'wb')
+        consistent_offset = 0
+
+    def save() -> None:
+        output.flush()
+        if output is not sys.stdout.buffer:
+            os.fsync(output.fileno())
+        checkpoint.save(consistent_offset)
+
+    def pending() -> Iterator[Tuple[int, Any]]:
+        for number, indicator in read_indicators(input_stream, input_format, options.field):
+            if checkpoint is not None and checkpoint.finished(number):
+                continue
+            if indicator is None:
+                if checkpoint is not None:
+                    checkpoint.mark(number)
+                continue
+            yield number, indicator
+
+    def lookup(record: Tuple[int, Any]) -> Any:
+        indicator: Any = record[1]
+        if isinstance(indicator, ValueError):
+            raise indicator
+        return call(endpoint.name, *options.args, indicator, **params)
+
+    # Let a scheduler's SIGTERM stop the job as cleanly as Ctrl-C
+    interrupts: _Interrupts = _Interrupts()
+    previous_handlers: Dict[int, Any] = {signum: signal.signal(signum, interrupts.handle)
+                                         for signum in (signal.SIGINT, signal.SIGTERM)}
+
+    started: float = time.monotonic()
+    completed: int = 0
+    failed: int = 0
+    status: int = 0
+    try:
+        for item in batch_lookup(lookup, pending(), concurrency=options.concurrency):
+            number, indicator = item.query
+            if isinstance(indicator, ValueError):
+                indicator = None
+            line: bytes = format_result(number, item._replace(query=indicator))
+            with interrupts:
+                output.write(line)
+                completed += 1
+                if item.error is not None or not item.result.ok:
+                    failed += 1
+                if checkpoint is not None:
+                    checkpoint.mark(number)
+                    if consistent_offset is not None:
+                        consistent_offset += len(line)
+
+            if checkpoint is not None and completed % options.checkpoint_every == 0:
+                save()
+    except KeyboardInterrupt:
+        print('[!] Interrupted, saving progress', file=sys.stderr)
+        status = 130
+    except ValueError as e:
+        print(f'[!] Error: {e}', file=sys.stderr)
+        status = 1
+    finally:
+        # A second Ctrl-C mustn't cut the final save short
+        interrupts.deferring = True
+        if checkpoint is not None:
+            save()
+        output.flush()
+        if output is not sys.stdout.buffer:
+            output.close()
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+
+    # A finished job needs no checkpoint, so running it again starts afresh
+    if checkpoint is not None and status == 0:
+        os.remove(checkpoint.path)
+
+    print(f'[*] {completed} looked up, {failed} failed, in {time.monotonic() - started:.1f}s',
+          file=sys.stderr)
+
+    return status
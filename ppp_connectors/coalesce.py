@@ -0,0 +1,153 @@
+import asyncio
+import copy
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional
+from .helpers import Config, get_config
+
+
+env_config: Config = get_config()
+
+
+class _Call:
+    """A request in flight on some thread, that other threads can wait on"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done: threading.Event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapses concurrent identical requests into one. The first caller with a key
+        makes the request, and everyone who asks for the same key while it is in flight
+        waits for it and gets the same result, or the same exception. Threads share calls
+        made by threads, and coroutines share calls made on the same event loop.
+
+        Each follower is handed its own shallow copy of the leader's response, with the
+        body already read, so changing one caller's response doesn't change the others'.
+    """
+
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        # asyncio tasks can only be awaited on their own loop, so they are kept per loop
+        self._tasks: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Task]]' = \
+            weakref.WeakKeyDictionary()
+        self._stats: Dict[str, int] = {'leaders': 0, 'coalesced': 0}
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Call fn(*args, **kwargs), unless a call with the same key is already in flight
+            on another thread, in which case wait for that one and return its result
+
+        Args:
+            key (str): identifies the request, e.g. from cache.request_key
+            fn (Callable[..., Any]): makes the request
+
+        Returns:
+            Any: the result of the leader's call
+        """
+
+        with self._lock:
+            call: Optional[_Call] = self._calls.get(key)
+            leader: bool = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return _own_copy(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def async_do(self, key: str, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """Await fn(*args, **kwargs), unless a call with the same key is already in flight
+            on this event loop, in which case await that one instead. The request runs as
+            its own task, so a caller being cancelled doesn't cancel it for the others.
+
+        Args:
+            key (str): identifies the request, e.g. from cache.request_key
+            fn (Callable[..., Awaitable[Any]]): makes the request
+
+        Returns:
+            Any: the result of the shared call
+        """
+
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        tasks: Dict[str, asyncio.Task] = self._tasks.setdefault(loop, {})
+
+        task: Optional[asyncio.Task] = tasks.get(key)
+        leader: bool = task is None
+        with self._lock:
+            if leader:
+                self._stats['leaders'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if leader:
+            task = tasks[key] = loop.create_task(fn(*args, **kwargs))
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+
+        result: Any = await asyncio.shield(task)
+        return result if leader else _own_copy(result)
+
+    def stats(self) -> Dict[str, int]:
+        """Return how many calls were made, and how many were served by another's call
+
+        Returns:
+            Dict[str, int]: leaders and coalesced counts
+        """
+
+        with self._lock:
+            return dict(self._stats)
+
+
+def _own_copy(result: Any) -> Any:
+    """Copy a shared result for a follower, including the response headers, which a
+        shallow copy would otherwise share
+
+    Args:
+        result (Any): the leader's result, usually a requests or httpx response
+
+    Returns:
+        Any: the copy
+    """
+
+    duplicate: Any = copy.copy(result)
+    headers: Any = getattr(result, 'headers', None)
+    if headers is not None and hasattr(headers, 'copy'):
+        duplicate.headers = headers.copy()
+
+    return duplicate
+
+
+# Shared by make_request and async_make_request
+single_flight: SingleFlight = SingleFlight()
+
+
+def coalescing_enabled() -> bool:
+    """Whether concurrent identical requests are coalesced. Off unless PPP_COALESCE is true,
+        since followers receive the response to the leader's request, made with the
+        leader's credentials.
+
+    Returns:
+        bool: True if requests should go through single_flight
+    """
+
+    return (env_config.get('PPP_COALESCE') or 'false').lower() == 'true'
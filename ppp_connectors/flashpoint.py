@@ -1,10 +1,8 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Optional
 from requests import Response
 from .broker import make_request
-from .helpers import check_required_env_vars, combine_env_configs
-
-
-env_config: Dict[str, Any] = combine_env_configs()
+from .registry import ENDPOINTS, async_connector, iter_connector
+from .streaming import Destination, DownloadResult, completed_download, resume_offset, stream_to
 
 def flashpoint_search_communities(query: str, **kwargs: Dict[str, Any]) -> Response:
     """Communities Search allows search requests over article and conversation data.
@@ -18,26 +16,7 @@ def flashpoint_search_communities(query: str, **kwargs: Dict[str, Any]) -> Respo
         Response: requests.Response object from the request
     """
 
-    required_vars: List[str] = [
-        'FLASHPOINT_API_KEY'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    method: str = 'post'
-    url: str = 'https://api.flashpoint.io/sources/v2/communities'
-    headers: Dict = {
-        'accept': 'application/json',
-        'content-type': 'application/json',
-        'Authorization': f'Bearer {env_config["FLASHPOINT_API_KEY"]}'
-    }
-    payload: Dict = {
-        'query': query,
-        **kwargs
-    }
-
-    result: Response = make_request(method=method, url=url, headers=headers, json=payload)
+    result: Response = make_request(**ENDPOINTS['flashpoint_search_communities'].request(query, **kwargs))
 
     return result
 
@@ -54,26 +33,7 @@ def flashpoint_search_media(query: str, **kwargs: Dict[str, Any]) -> Response:
         Response: requests.Response object from the request
     """
 
-    required_vars: List[str] = [
-        'FLASHPOINT_API_KEY'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    method: str = 'post'
-    url: str = 'https://api.flashpoint.io/sources/v2/media'
-    headers: Dict = {
-        'accept': 'application/json',
-        'content-type': 'application/json',
-        'Authorization': f'Bearer {env_config["FLASHPOINT_API_KEY"]}'
-    }
-    payload: Dict = {
-        'query': query,
-        **kwargs
-    }
-
-    result: Response = make_request(method=method, url=url, headers=headers, json=payload)
+    result: Response = make_request(**ENDPOINTS['flashpoint_search_media'].request(query, **kwargs))
 
     return result
 
@@ -87,22 +47,7 @@ def flashpoint_get_media_object(id: str) -> Response:
         Response: requests.Response object from the request
     """
 
-    required_vars: List[str] = [
-        'FLASHPOINT_API_KEY'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    method: str = 'get'
-    url: str = f'https://api.flashpoint.io/sources/v2/media/{id}'
-    headers: Dict = {
-        'accept': 'application/json',
-        'content-type': 'application/json',
-        'Authorization': f'Bearer {env_config["FLASHPOINT_API_KEY"]}'
-    }
-
-    result: Response = make_request(method=method, url=url, headers=headers)
+    result: Response = make_request(**ENDPOINTS['flashpoint_get_media_object'].request(id))
 
     return result
 
@@ -116,25 +61,55 @@ def flashpoint_get_media_image(storage_uri: str) -> Response:
         Response: requests.Response object from the request
     """
 
-    required_vars: List[str] = [
-        'FLASHPOINT_API_KEY'
-    ]
+    result: Response = make_request(**ENDPOINTS['flashpoint_get_media_image'].request(storage_uri))
+
+    return result
+
+def flashpoint_download_media_image(storage_uri: str,
+                                    destination: Destination,
+                                    chunk_size: int = 64 * 1024,
+                                    hash_algorithm: Optional[str] = 'sha256',
+                                    resume: bool = False) -> DownloadResult:
+    """Stream the media from a media object by its storage_uri field straight to a file path,
+        file object, or writable buffer, without holding the whole object in memory
+
+    Args:
+        storage_uri (str): the storage_uri field from the media object
+        destination (Destination): a file path, writable binary file object, or writable buffer
+        chunk_size (int, optional): bytes read per chunk. Defaults to 64 KiB.
+        hash_algorithm (Optional[str], optional): a hashlib algorithm to hash the media with
+            while it streams, or None to skip hashing. Defaults to 'sha256'.
+        resume (bool, optional): carry on from the bytes already at a file path or file object
+            with a Range request, instead of downloading from the start. Defaults to False.
+
+    Raises:
+        requests.HTTPError: this will raise if the download comes back with an error status
+
+    Returns:
+        DownloadResult: the status, bytes written, total size, digest, and whether it resumed
+    """
+
+    request: Dict[str, Any] = ENDPOINTS['flashpoint_get_media_image'].request(storage_uri)
+    offset: int = resume_offset(destination) if resume else 0
+    if offset:
+        request['headers'] = {**request['headers'], 'Range': f'bytes={offset}-'}
+
+    result: Response = make_request(**request, stream=True)
 
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
+    # 416 means there is nothing past the offset, i.e. an earlier download already finished
+    if offset and result.status_code == 416:
+        result.close()
+        return completed_download(destination, offset, hash_algorithm, result.status_code)
 
-    method: str = 'get'
-    url: str = f'https://api.flashpoint.io/sources/v1/media/'
-    headers: Dict = {
-        'accept': 'application/json',
-        'content-type': 'application/json',
-        'Authorization': f'Bearer {env_config["FLASHPOINT_API_KEY"]}'
-    }
+    result.raise_for_status()
 
-    params = {
-        "asset_id": storage_uri
-    }
+    return stream_to(result, destination, chunk_size, hash_algorithm, offset)
 
-    result: Response = make_request(method=method, url=url, headers=headers, params=params)
+# The asynchronous and iter_ variants are generated from the endpoint table
+async_flashpoint_search_communities = async_connector(flashpoint_search_communities)
+async_flashpoint_search_media = async_connector(flashpoint_search_media)
+async_flashpoint_get_media_object = async_connector(flashpoint_get_media_object)
+async_flashpoint_get_media_image = async_connector(flashpoint_get_media_image)
 
-    return result
\ No newline at end of file
+iter_flashpoint_search_communities = iter_connector(flashpoint_search_communities)
+iter_flashpoint_search_media = iter_connector(flashpoint_search_media)
@@ -1,29 +1,40 @@
 from datetime import date, datetime
-from dotenv import dotenv_values, find_dotenv
+import json
 import os
+import re
 import sys
-from typing import Dict, Set, List, Any
+import threading
+from types import MappingProxyType
+from typing import Callable, Dict, Iterator, Mapping, Set, List, Any, Optional, Tuple, Union
+from urllib.parse import urlsplit
 
 
-def check_required_env_vars(config: Dict[str, str], required_vars: List[str]) -> None:
+def check_required_env_vars(config: Mapping[str, str], required_vars: List[str]) -> None:
     """Ensure that the env variables required for a function are present either in \
-        the .env file, or in the system's environment variables.
+        the .env file, or in the system's environment variables. Against the shared
+        config, each set of variables is only checked once per load.
 
     Args:
-        config (Dict[str, str]): the env_config variable that contains values from the .env file
+        config (Mapping[str, str]): the env_config variable that contains values from the .env file
         required_vars (List[str]): the env variables required for a function to successfully function
     """
 
-    dotenv_missing_vars: Set[str] = set(required_vars) - set(config.keys())
-    osenv_missing_vars: Set[str] = set(required_vars) - set(os.environ)
-    missing_vars = dotenv_missing_vars | osenv_missing_vars
+    shared: bool = config is env_config
+    key: Tuple[str, ...] = tuple(required_vars)
+    if shared and key in _validated_vars:
+        return
 
-    if dotenv_missing_vars and osenv_missing_vars:
+    missing_vars: List[str] = [var for var in required_vars if var not in config and var not in os.environ]
+
+    if missing_vars:
         print(f'[!] Error: missing required environment variables: {", ".join(missing_vars)}. '
               'Please ensure these are present either in your .env file, or in the '
               'system\'s environment variables.', file=sys.stderr)
         sys.exit(1)
 
+    if shared:
+        _validated_vars.add(key)
+
 def combine_env_configs() -> Dict[str, Any]:
     """Find a .env file if it exists, and combine it with system environment
         variables to form a "combined_config" dictionary of environment variables
@@ -33,12 +44,101 @@ def combine_env_configs() -> Dict[str, Any]:
         system environment variables
     """
 
+    # Imported here so that dotenv is only loaded when the config is first read
+    from dotenv import dotenv_values, find_dotenv
+
     env_config: Dict[str, Any] = dict(dotenv_values(find_dotenv()))
 
     combined_config: Dict[str, Any] = {**env_config, **dict(os.environ)}
 
     return combined_config
 
+class Config(Mapping):
+    """A read-only view of the combined .env file and system environment variables.
+        Nothing is read until the first lookup, and the snapshot taken then is shared by
+        every module until reload() is called.
+    """
+
+    def __init__(self) -> None:
+        self._data: Optional[Mapping[str, Any]] = None
+        self._lock: threading.Lock = threading.Lock()
+        self._reload_callbacks: List[Callable[[], None]] = []
+
+    def _load(self) -> Mapping[str, Any]:
+        """Return the snapshot, taking it on first use"""
+
+        data = self._data
+        if data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = MappingProxyType(combine_env_configs())
+                data = self._data
+
+        return data
+
+    def __getitem__(self, key: str) -> Any:
+        return self._load()[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._load()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._load().get(key, default)
+
+    @property
+    def loaded(self) -> bool:
+        """True once the environment has been read"""
+        return self._data is not None
+
+    def on_reload(self, callback: Callable[[], None]) -> None:
+        """Register a function to call after every reload, e.g. to drop state built from the config
+
+        Args:
+            callback (Callable[[], None]): the function to call
+        """
+
+        self._reload_callbacks.append(callback)
+
+    def reload(self) -> None:
+        """Re-read the .env file and system environment variables, and let every module
+            that built state from the old values know
+        """
+
+        with self._lock:
+            self._data = MappingProxyType(combine_env_configs())
+            _validated_vars.clear()
+
+        for callback in self._reload_callbacks:
+            callback()
+
+# Sets of required variables already found in the shared config
+_validated_vars: Set[Tuple[str, ...]] = set()
+
+# The one config shared by every module in the package
+env_config: Config = Config()
+
+def get_config() -> Config:
+    """Return the shared, lazily loaded config
+
+    Returns:
+        Config: the shared config
+    """
+
+    return env_config
+
+def reload_config() -> None:
+    """Re-read the .env file and system environment variables. Pooled sessions, rate
+        limiters and the environment-configured cache are rebuilt from the new values.
+    """
+
+    env_config.reload()
+
 def validate_date_string(date_str: str) -> bool:
     """Validates that a date string is, well, a valid date string
 
@@ -52,4 +152,84 @@ def validate_date_string(date_str: str) -> bool:
         datetime.strptime(date_str, "%Y-%m-%d")
         return True
     except ValueError:
-        return False
\ No newline at end of file
+        return False
+
+# The vendor each API host belongs to. Used to key per-vendor settings such as rate limits.
+VENDOR_HOSTS: Dict[str, str] = {
+    'api.flashpoint.io': 'FLASHPOINT',
+    'ipqualityscore.com': 'IPQS',
+    'api.spycloud.io': 'SPYCLOUD',
+    'api.twilio.com': 'TWILIO',
+    'lookups.twilio.com': 'TWILIO',
+    'urlscan.io': 'URLSCAN',
+}
+
+def vendor_for_url(url: str) -> str:
+    """Work out which vendor a URL belongs to
+
+    Args:
+        url (str): the vendor URL built by a connector
+
+    Returns:
+        str: the vendor name, e.g. URLSCAN, or the upper-cased host with every
+        non-alphanumeric character replaced by an underscore for unknown hosts
+    """
+
+    host: str = (urlsplit(url).hostname or '').lower()
+
+    if host in VENDOR_HOSTS:
+        return VENDOR_HOSTS[host]
+
+    return re.sub(r'[^A-Z0-9]', '_', host.upper())
+
+
+# The JSON decoder, picked the first time something is decoded: orjson or msgspec if
+# either is installed, the standard library's json otherwise
+_json_loads: Optional[Callable[[Union[bytes, str]], Any]] = None
+_json_backend: Optional[str] = None
+
+def json_backend() -> str:
+    """Return the name of the JSON decoder used by json_loads
+
+    Returns:
+        str: orjson, msgspec or json
+    """
+
+    global _json_backend, _json_loads
+
+    if _json_backend is None:
+        try:
+            import orjson
+            _json_backend, _json_loads = 'orjson', orjson.loads
+        except ImportError:
+            try:
+                import msgspec
+                _json_backend, _json_loads = 'msgspec', msgspec.json.Decoder().decode
+            except ImportError:
+                _json_backend, _json_loads = 'json', json.loads
+
+    return _json_backend
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """Decode a JSON document with the fastest decoder installed. A document that a fast
+        decoder refuses is retried with json, which is more lenient, e.g. about NaN.
+
+    Args:
+        data (Union[bytes, str]): the JSON document
+
+    Raises:
+        ValueError: this will raise if the document is not valid JSON
+
+    Returns:
+        Any: the decoded document
+    """
+
+    if _json_loads is None:
+        json_backend()
+
+    try:
+        return _json_loads(data)
+    except ValueError:
+        if _json_loads is json.loads:
+            raise
+        return json.loads(data)
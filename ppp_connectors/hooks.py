@@ -0,0 +1,312 @@
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from requests.adapters import HTTPAdapter
+from .helpers import vendor_for_url
+from .scheduler import current_priority
+
+
+# The points in a request's life that hooks can be registered for:
+#   pre_request    before each attempt is sent, after any rate limit wait
+#   post_response  once per call, with the final response, including cache hits
+#   retry          after each attempt that is going to be retried
+#   error          when sending an attempt raised, e.g. a connection error
+HOOK_EVENTS: tuple = ('pre_request', 'post_response', 'retry', 'error')
+
+_hooks: Dict[str, List[Callable[['RequestEvent'], None]]] = {event: [] for event in HOOK_EVENTS}
+_hooks_lock: threading.Lock = threading.Lock()
+
+# The brokers check this before doing any instrumentation work, so that requests cost
+# nothing extra while no hooks are registered
+enabled: bool = False
+
+# Connect and TLS times of the connection opened by the current thread's request, if any
+_connection_timings: threading.local = threading.local()
+
+
+class RequestEvent:
+    """What is known about one attempt of a request, passed to every hook
+
+    Attributes:
+        method (str): the HTTP method
+        url (str): the vendor URL, before any PPP_API_BASE_URL rewrite
+        vendor (str): the vendor the URL belongs to, e.g. URLSCAN
+        endpoint (Optional[str]): the connector that made the request, e.g. urlscan_search
+        attempt (int): 1 for the first attempt, 2 for the first retry, and so on
+        status_code (Optional[int]): the response status, once there is one
+        bytes_sent (int): the size of the request body
+        bytes_received (int): the size of the response body
+        duration (float): seconds from sending the attempt until its body was read
+        timings (Dict[str, float]): seconds spent in each phase. `ratelimit` waiting for a
+            token, `connect` opening a connection including DNS, `tls` the TLS handshake,
+            `wait` waiting for the response headers, and `download` reading the body.
+            connect and tls are 0 when a pooled connection was reused.
+        retry_delay (Optional[float]): for retry events, the seconds until the next attempt
+        error (Optional[BaseException]): for error events, the exception raised
+        from_cache (bool): True if the response was served from the response cache
+        priority (str): the priority class the call waited for its rate limit in
+    """
+
+    __slots__ = ('method', 'url', 'vendor', 'endpoint', 'attempt', 'status_code', 'bytes_sent',
+                 'bytes_received', 'duration', 'timings', 'retry_delay', 'error', 'from_cache',
+                 'priority', 'started')
+
+    def __init__(self, method: str, url: str, endpoint: Optional[str] = None, attempt: int = 1) -> None:
+        self.method: str = method.upper()
+        self.url: str = url
+        self.vendor: str = vendor_for_url(url)
+        self.endpoint: Optional[str] = endpoint
+        self.attempt: int = attempt
+        self.status_code: Optional[int] = None
+        self.bytes_sent: int = 0
+        self.bytes_received: int = 0
+        self.duration: float = 0.0
+        self.timings: Dict[str, float] = {}
+        self.retry_delay: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self.from_cache: bool = False
+        self.priority: str = current_priority()
+        self.started: float = time.perf_counter()
+
+    def __repr__(self) -> str:
+        return (f'RequestEvent({self.method} {self.url}, endpoint={self.endpoint}, '
+                f'attempt={self.attempt}, status_code={self.status_code})')
+
+
+def register_hook(event: str, callback: Callable[[RequestEvent], None]) -> Callable[[RequestEvent], None]:
+    """Call `callback` with a RequestEvent every time `event` happens. Hooks run on the
+        thread or event loop making the request, so they should be quick.
+
+    Args:
+        event (str): one of HOOK_EVENTS
+        callback (Callable[[RequestEvent], None]): the hook
+
+    Raises:
+        ValueError: this will raise if the event is not one of HOOK_EVENTS
+
+    Returns:
+        Callable[[RequestEvent], None]: the callback, so this can be used as a decorator
+    """
+
+    global enabled
+
+    if event not in HOOK_EVENTS:
+        raise ValueError(f'Unknown hook event "{event}". Must be one of {", ".join(HOOK_EVENTS)}')
+
+    with _hooks_lock:
+        # Copy on write, so emit() never needs the lock
+        _hooks[event] = [*_hooks[event], callback]
+        enabled = True
+
+    return callback
+
+
+def unregister_hook(event: str, callback: Callable[[RequestEvent], None]) -> None:
+    """Stop calling a hook registered with register_hook
+
+    Args:
+        event (str): the event it was registered for
+        callback (Callable[[RequestEvent], None]): the hook
+    """
+
+    global enabled
+
+    with _hooks_lock:
+        _hooks[event] = [hook for hook in _hooks.get(event, []) if hook != callback]
+        enabled = any(_hooks.values())
+
+
+def clear_hooks() -> None:
+    """Unregister every hook"""
+
+    global enabled
+
+    with _hooks_lock:
+        for event in HOOK_EVENTS:
+            _hooks[event] = []
+        enabled = False
+
+
+def emit(event: str, request_event: RequestEvent) -> None:
+    """Call the hooks registered for an event. A failing hook is reported and skipped,
+        it never fails the request.
+
+    Args:
+        event (str): one of HOOK_EVENTS
+        request_event (RequestEvent): what to pass to each hook
+    """
+
+    for hook in _hooks[event]:
+        try:
+            hook(request_event)
+        except Exception as e:
+            print(f'[!] Warning: {event} hook {hook!r} failed: {e!r}', file=sys.stderr)
+
+
+def begin(method: str, url: str, endpoint: Optional[str], attempt: int, ratelimit_wait: float) -> RequestEvent:
+    """Start the event for an attempt that is about to be sent, and emit pre_request
+
+    Args:
+        method (str): the HTTP method
+        url (str): the vendor URL
+        endpoint (Optional[str]): the connector making the request
+        attempt (int): the attempt number, starting at 1
+        ratelimit_wait (float): seconds spent waiting on the vendor's rate limiter
+
+    Returns:
+        RequestEvent: the event to complete once the attempt has a response
+    """
+
+    _connection_timings.connect = 0.0
+    _connection_timings.tls = 0.0
+
+    request_event: RequestEvent = RequestEvent(method, url, endpoint, attempt)
+    request_event.timings['ratelimit'] = ratelimit_wait
+    emit('pre_request', request_event)
+
+    return request_event
+
+
+def _body_size(body: Any) -> int:
+    return len(body) if isinstance(body, (bytes, str)) else 0
+
+
+def record_response(request_event: RequestEvent, response: Any, stream: bool = False) -> None:
+    """Fill an event in from the requests.Response its attempt returned. The time to the
+        response headers comes from response.elapsed, and connect and TLS times from the
+        instrumented connection that carried the request.
+
+    Args:
+        request_event (RequestEvent): the event from begin()
+        response (requests.Response): the response
+        stream (bool, optional): whether the body was left unread. Defaults to False.
+    """
+
+    duration: float = time.perf_counter() - request_event.started
+    headers_after: float = response.elapsed.total_seconds()
+    connect: float = getattr(_connection_timings, 'connect', 0.0)
+    tls: float = getattr(_connection_timings, 'tls', 0.0)
+
+    request_event.status_code = response.status_code
+    request_event.bytes_sent = _body_size(response.request.body)
+    request_event.bytes_received = (int(response.headers.get('Content-Length') or 0) if stream
+                                    else len(response.content))
+    request_event.duration = duration
+    request_event.timings.update(connect=connect, tls=tls,
+                                 wait=max(0.0, headers_after - connect - tls),
+                                 download=max(0.0, duration - headers_after))
+
+
+def record_error(request_event: RequestEvent, error: BaseException) -> None:
+    """Fill an event in for an attempt that raised, and emit error
+
+    Args:
+        request_event (RequestEvent): the event from begin()
+        error (BaseException): the exception raised
+    """
+
+    request_event.error = error
+    request_event.duration = time.perf_counter() - request_event.started
+    emit('error', request_event)
+
+
+def record_cache_hit(method: str, url: str, endpoint: Optional[str], status_code: int, content: bytes) -> None:
+    """Emit post_response for a call answered from the response cache
+
+    Args:
+        method (str): the HTTP method
+        url (str): the vendor URL
+        endpoint (Optional[str]): the connector making the request
+        status_code (int): the cached status code
+        content (bytes): the cached body
+    """
+
+    request_event: RequestEvent = RequestEvent(method, url, endpoint, 0)
+    request_event.status_code = status_code
+    request_event.bytes_received = len(content)
+    request_event.from_cache = True
+    emit('post_response', request_event)
+
+
+class AsyncTrace:
+    """Collects httpcore's trace events for one httpx request, to time its phases.
+        Passed to httpx as the `trace` request extension.
+    """
+
+    __slots__ = ('marks',)
+
+    def __init__(self) -> None:
+        self.marks: Dict[str, float] = {}
+
+    async def __call__(self, name: str, info: Dict[str, Any]) -> None:
+        # e.g. connection.connect_tcp.started, http11.receive_response_body.complete
+        self.marks[name.split('.', 1)[-1]] = time.perf_counter()
+
+    def span(self, phase: str) -> float:
+        started: Optional[float] = self.marks.get(f'{phase}.started')
+        completed: Optional[float] = self.marks.get(f'{phase}.complete')
+        return completed - started if started is not None and completed is not None else 0.0
+
+    def record(self, request_event: RequestEvent, response: Any) -> None:
+        """Fill an event in from the httpx.Response its attempt returned
+
+        Args:
+            request_event (RequestEvent): the event from begin()
+            response (httpx.Response): the response, with its body read
+        """
+
+        sent: Optional[float] = self.marks.get('send_request_headers.started')
+        headers_done: Optional[float] = self.marks.get('receive_response_headers.complete')
+
+        request_event.status_code = response.status_code
+        request_event.bytes_sent = _body_size(response.request.content)
+        request_event.bytes_received = len(response.content)
+        request_event.duration = time.perf_counter() - request_event.started
+        request_event.timings.update(connect=self.span('connect_tcp'), tls=self.span('start_tls'),
+                                     wait=headers_done - sent if sent and headers_done else 0.0,
+                                     download=self.span('receive_response_body'))
+
+
+class _TimedConnectionMixin:
+    """Times how long a new connection takes to open, for the request that opened it"""
+
+    def _new_conn(self) -> Any:
+        started: float = time.perf_counter()
+        conn: Any = super()._new_conn()
+        _connection_timings.connect = time.perf_counter() - started
+        return conn
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+
+    def connect(self) -> None:
+        # connect() opens the socket with _new_conn() and then does the TLS handshake
+        started: float = time.perf_counter()
+        super().connect()
+        _connection_timings.tls = max(0.0, time.perf_counter() - started - _connection_timings.connect)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """An HTTPAdapter whose connections record their connect and TLS times. This only
+        costs a couple of clock reads per new connection, so it is always installed.
+    """
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
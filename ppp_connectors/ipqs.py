@@ -1,10 +1,8 @@
-from typing import Dict, Any, List
+from typing import Dict, Any
 from requests import Response
-from urllib.parse import quote
 from .broker import make_request
-from .helpers import check_required_env_vars, combine_env_configs
+from .registry import ENDPOINTS, async_connector
 
-env_config: Dict[str, Any] = combine_env_configs()
 
 def ipqs_malicious_url(query: str, **kwargs: Dict[str, Any]) -> Response:
     """IPQualityScore's Malicious URL Scanner API scans links in real-time
@@ -20,24 +18,9 @@ def ipqs_malicious_url(query: str, **kwargs: Dict[str, Any]) -> Response:
         Response: requests.Response json response from the request
     """
 
-    # Define required environment variables
-    required_vars: List[str] = [
-        'IPQS_API_KEY'
-    ]
+    result: Response = make_request(**ENDPOINTS['ipqs_malicious_url'].request(query, **kwargs))
 
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
+    return result
 
-    method: str = 'post'
-    url: str = f'https://ipqualityscore.com/api/json/url'
-    headers: Dict = {'accept': 'application/json'}
-    encoded_query: str = quote(query)
-    params: Dict = {
-        'key': env_config['IPQS_API_KEY'],
-        'url': encoded_query,
-        **kwargs
-    }
-
-    result: Response = make_request(method=method, url=url, headers=headers, json=params)
-
-    return result
\ No newline at end of file
+# The asynchronous variant is generated from the endpoint table
+async_ipqs_malicious_url = async_connector(ipqs_malicious_url)
@@ -0,0 +1,302 @@
+import re
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from .helpers import Config, get_config
+from .ratelimit import TokenBucket, parse_rate_limit, rate_limit_setting
+from .retry import RESET_HEADERS, parse_reset_header
+
+
+env_config: Config = get_config()
+
+# How keys are picked from a pool, set with PPP_KEY_STRATEGY
+KEY_STRATEGIES: Tuple[str, ...] = ('round_robin', 'least_used')
+
+# A 403 whose body matches this is a spent quota rather than a bad key
+_QUOTA_MESSAGE: 're.Pattern[str]' = re.compile(r'quota|limit|exceeded', re.IGNORECASE)
+
+_pools: Dict[str, Optional['KeyPool']] = {}
+_pools_lock: threading.Lock = threading.Lock()
+
+
+def split_keys(value: str) -> List[str]:
+    """Split a comma-separated list of API keys, dropping blanks and repeats
+
+    Args:
+        value (str): the setting, e.g. key1,key2
+
+    Returns:
+        List[str]: the keys, in the order given
+    """
+
+    keys: List[str] = []
+    for key in value.split(','):
+        key = key.strip()
+        if key and key not in keys:
+            keys.append(key)
+
+    return keys
+
+
+def mask_key(key: str) -> str:
+    """Shorten a key so it can be shown in stats and logs without giving it away
+
+    Args:
+        key (str): the API key
+
+    Returns:
+        str: the first and last four characters of the key
+    """
+
+    return f'{key[:4]}...{key[-4:]}' if len(key) > 12 else '...'
+
+
+def quota_exhausted(status_code: int, text: str = '') -> bool:
+    """Decide whether a response means the key that sent it has run out of quota
+
+    Args:
+        status_code (int): the status code of the response
+        text (str, optional): the response body, checked for a quota message on a 403. Defaults to ''.
+
+    Returns:
+        bool: True for a 429, or a 403 that mentions a quota or limit
+    """
+
+    return status_code == 429 or (status_code == 403 and _QUOTA_MESSAGE.search(text) is not None)
+
+
+class KeyPool:
+    """Several API keys for one credential, handed out round-robin or to the key with the
+        fewest requests in flight. A key that runs out of quota is benched, and skipped
+        until its reset time, while the other keys carry on. Each key gets its own token
+        bucket at the vendor's rate limit, so throughput grows with the number of keys.
+    """
+
+    def __init__(self,
+                 env_var: str,
+                 keys: List[str],
+                 scheme: str,
+                 name: Optional[str] = None,
+                 vendor: Optional[str] = None,
+                 strategy: str = 'round_robin') -> None:
+        """
+        Args:
+            env_var (str): the environment variable the keys were read from
+            keys (List[str]): the keys
+            scheme (str): `header`, `bearer` or `field`, as in registry.Auth
+            name (Optional[str], optional): the header or field name. Defaults to None.
+            vendor (Optional[str], optional): the vendor whose rate limit each key gets.
+                Defaults to None, for no per-key limit.
+            strategy (str, optional): `round_robin` or `least_used`. Defaults to round_robin.
+
+        Raises:
+            ValueError: this will raise if there are no keys, or the scheme or strategy is unknown
+        """
+
+        if not keys:
+            raise ValueError(f'{env_var} holds no keys')
+        if scheme not in ('header', 'bearer', 'field'):
+            raise ValueError(f'Keys can only be rotated for header, bearer and field auth, not {scheme}')
+        if strategy not in KEY_STRATEGIES:
+            raise ValueError(f'Invalid key strategy "{strategy}". Must be one of {", ".join(KEY_STRATEGIES)}')
+
+        self.env_var: str = env_var
+        self.keys: List[str] = list(keys)
+        self.scheme: str = scheme
+        self.name: Optional[str] = name
+        self.strategy: str = strategy
+
+        self._index: Dict[str, int] = {key: index for index, key in enumerate(self.keys)}
+        self._uses: List[int] = [0] * len(self.keys)
+        self._in_flight: List[int] = [0] * len(self.keys)
+        self._benched: List[float] = [0.0] * len(self.keys)
+        self._next: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+        setting: str = rate_limit_setting(vendor) if vendor else ''
+        self._limiters: List[Optional[TokenBucket]] = [
+            TokenBucket(*parse_rate_limit(setting)) if setting else None for _ in self.keys]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __repr__(self) -> str:
+        return f'KeyPool({self.env_var}: {len(self.keys)} keys, {self.strategy})'
+
+    def acquire(self) -> str:
+        """Pick the key for the next request. When every key is benched, the one that
+            comes back soonest is used, and the vendor's reset headers decide the wait.
+
+        Returns:
+            str: the key
+        """
+
+        with self._lock:
+            now: float = time.monotonic()
+            available: List[int] = [index for index in range(len(self.keys)) if self._benched[index] <= now]
+
+            if not available:
+                index: int = min(range(len(self.keys)), key=self._benched.__getitem__)
+            elif self.strategy == 'least_used':
+                index = min(available, key=lambda i: (self._in_flight[i], self._uses[i]))
+            else:
+                # The first key not benched, counting from the one after the last used
+                index = min(available, key=lambda i: (i - self._next) % len(self.keys))
+                self._next = index + 1
+
+            self._uses[index] += 1
+            self._in_flight[index] += 1
+
+            return self.keys[index]
+
+    def release(self, key: str, status_code: Optional[int] = None, headers: Optional[Mapping[str, str]] = None,
+                text: str = '') -> bool:
+        """Hand a key back once its request has finished, benching it if the response
+            says its quota is spent. It is benched until the response's reset header,
+            or for PPP_KEY_BENCH seconds, 60 by default, when there is none.
+
+        Args:
+            key (str): the key acquired for the request
+            status_code (Optional[int], optional): the response status, or None if the
+                request raised. Defaults to None.
+            headers (Optional[Mapping[str, str]], optional): the response headers. Defaults to None.
+            text (str, optional): the response body, only needed for a 403. Defaults to ''.
+
+        Returns:
+            bool: True if the key was benched
+        """
+
+        exhausted: bool = status_code is not None and quota_exhausted(status_code, text)
+        reset: Optional[float] = None
+        if exhausted:
+            for header in RESET_HEADERS:
+                if headers is not None and header in headers:
+                    reset = parse_reset_header(headers[header])
+                    if reset is not None:
+                        break
+            if reset is None:
+                reset = float(env_config.get('PPP_KEY_BENCH') or 60)
+
+        with self._lock:
+            index: int = self._index[key]
+            self._in_flight[index] -= 1
+            if exhausted:
+                self._benched[index] = max(self._benched[index], time.monotonic() + reset)
+
+        return exhausted
+
+    def available(self) -> int:
+        """The number of keys not benched
+
+        Returns:
+            int: how many keys can be used right now
+        """
+
+        now: float = time.monotonic()
+        with self._lock:
+            return sum(1 for until in self._benched if until <= now)
+
+    def limiter(self, key: str) -> Optional[TokenBucket]:
+        """The token bucket of a key
+
+        Args:
+            key (str): the key
+
+        Returns:
+            Optional[TokenBucket]: the key's bucket, or None if the vendor has no rate limit
+        """
+
+        return self._limiters[self._index[key]]
+
+    def apply(self,
+              key: str,
+              headers: Optional[Dict[str, str]],
+              params: Optional[Dict[str, Any]],
+              json: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, str]], Optional[Dict[str, Any]],
+                                                       Optional[Dict[str, Any]]]:
+        """Add a key to a request. A field is added to the JSON body when the request has
+            one, and to the query parameters otherwise. The arguments are not modified.
+
+        Args:
+            key (str): the key
+            headers (Optional[Dict[str, str]]): the request headers
+            params (Optional[Dict[str, Any]]): the query parameters
+            json (Optional[Dict[str, Any]]): the json body
+
+        Returns:
+            Tuple[Optional[Dict[str, str]], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+                the headers, query parameters and json body to send
+        """
+
+        if self.scheme == 'header':
+            headers = {**(headers or {}), self.name: key}
+        elif self.scheme == 'bearer':
+            headers = {**(headers or {}), 'Authorization': f'Bearer {key}'}
+        elif json is not None:
+            json = {**json, self.name: key}
+        else:
+            params = {**(params or {}), self.name: key}
+
+        return headers, params, json
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Report how each key has been used, with the keys masked
+
+        Returns:
+            List[Dict[str, Any]]: for each key, its masked value, requests sent, requests
+                in flight, and seconds until it comes off the bench
+        """
+
+        now: float = time.monotonic()
+        with self._lock:
+            return [{'key': mask_key(key), 'uses': self._uses[index], 'in_flight': self._in_flight[index],
+                     'benched_for': max(0.0, self._benched[index] - now)}
+                    for index, key in enumerate(self.keys)]
+
+
+def get_key_pool(env_var: str, scheme: str, name: Optional[str] = None,
+                 vendor: Optional[str] = None) -> Optional[KeyPool]:
+    """Return the shared pool of the keys in an environment variable, e.g.
+        URLSCAN_API_KEY=key1,key2. Endpoints using the same variable share one pool.
+
+    Args:
+        env_var (str): the environment variable holding the keys
+        scheme (str): `header`, `bearer` or `field`, as in registry.Auth
+        name (Optional[str], optional): the header or field name. Defaults to None.
+        vendor (Optional[str], optional): the vendor whose rate limit each key gets. Defaults to None.
+
+    Returns:
+        Optional[KeyPool]: the pool, or None if the variable holds a single key
+    """
+
+    if env_var in _pools:
+        return _pools[env_var]
+
+    with _pools_lock:
+        if env_var not in _pools:
+            keys: List[str] = split_keys(env_config.get(env_var) or '')
+            strategy: str = (env_config.get('PPP_KEY_STRATEGY') or 'round_robin').lower()
+            _pools[env_var] = KeyPool(env_var, keys, scheme, name, vendor, strategy) if len(keys) > 1 else None
+
+        return _pools[env_var]
+
+
+def key_pools() -> Dict[str, KeyPool]:
+    """Return every pool created so far, e.g. to report their stats
+
+    Returns:
+        Dict[str, KeyPool]: the pools, by environment variable
+    """
+
+    with _pools_lock:
+        return {env_var: pool for env_var, pool in _pools.items() if pool is not None}
+
+
+def reset_key_pools() -> None:
+    """Forget every pool, so keys are read from the environment again"""
+
+    with _pools_lock:
+        _pools.clear()
+
+
+env_config.on_reload(reset_key_pools)
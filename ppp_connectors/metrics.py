@@ -0,0 +1,341 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from .hooks import RequestEvent, register_hook, unregister_hook
+from .scheduler import scheduler_stats
+
+
+# Latency histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The phases of RequestEvent.timings that get their own histogram
+PHASES: Tuple[str, ...] = ('ratelimit', 'connect', 'tls', 'wait', 'download')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_metrics: Optional['MetricsCollector'] = None
+_metrics_lock: threading.Lock = threading.Lock()
+
+
+class Histogram:
+    """A fixed-bucket histogram of observed values"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets: Tuple[float, ...] = buckets
+        # One count per bucket, plus one for values above the largest bound
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """The count of values at or below each bound, ending with +Inf"""
+
+        total: int = 0
+        result: List[Tuple[str, int]] = []
+        for bound, count in zip([*map(str, self.buckets), '+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+class MetricsCollector:
+    """Aggregates request events into counters and latency histograms, labelled by vendor
+        and endpoint, alongside the scheduler's queue depths. Install it to start collecting:
+
+        metrics = MetricsCollector().install()
+        ...
+        print(metrics.prometheus())
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """
+        Args:
+            buckets (Tuple[float, ...], optional): histogram bucket bounds in seconds.
+                Defaults to DEFAULT_BUCKETS.
+        """
+
+        self.buckets: Tuple[float, ...] = buckets
+        self._lock: threading.Lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+
+    def _inc(self, name: str, labels: Labels, value: float = 1) -> None:
+        series: Dict[Labels, float] = self._counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def _observe(self, name: str, labels: Labels, value: float) -> None:
+        series: Dict[Labels, Histogram] = self._histograms.setdefault(name, {})
+        histogram: Optional[Histogram] = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def on_post_response(self, event: RequestEvent) -> None:
+        endpoint: Labels = (('vendor', event.vendor), ('endpoint', event.endpoint or 'other'))
+        with self._lock:
+            self._inc('ppp_requests_total', (*endpoint, ('method', event.method),
+                                             ('status', str(event.status_code)),
+                                             ('cache', 'hit' if event.from_cache else 'miss')))
+            self._inc('ppp_response_bytes_total', endpoint, event.bytes_received)
+            if event.from_cache:
+                return
+            self._inc('ppp_request_bytes_total', endpoint, event.bytes_sent)
+            self._observe('ppp_request_duration_seconds', endpoint, event.duration)
+            self._observe('ppp_scheduler_wait_seconds', (('vendor', event.vendor), ('priority', event.priority)),
+                          event.timings.get('ratelimit', 0.0))
+            for phase in PHASES:
+                if phase in event.timings:
+                    self._observe('ppp_request_phase_seconds', (('vendor', event.vendor), ('phase', phase)),
+                                  event.timings[phase])
+
+    def on_retry(self, event: RequestEvent) -> None:
+        with self._lock:
+            self._inc('ppp_retries_total', (('vendor', event.vendor), ('endpoint', event.endpoint or 'other'),
+                                            ('status', str(event.status_code))))
+            self._inc('ppp_retry_backoff_seconds_total', (('vendor', event.vendor),), event.retry_delay or 0.0)
+
+    def on_error(self, event: RequestEvent) -> None:
+        with self._lock:
+            self._inc('ppp_errors_total', (('vendor', event.vendor), ('endpoint', event.endpoint or 'other'),
+                                           ('error', type(event.error).__name__)))
+
+    def install(self) -> 'MetricsCollector':
+        """Register the collector's hooks, so every request is counted from now on
+
+        Returns:
+            MetricsCollector: the collector itself
+        """
+
+        register_hook('post_response', self.on_post_response)
+        register_hook('retry', self.on_retry)
+        register_hook('error', self.on_error)
+
+        return self
+
+    def uninstall(self) -> None:
+        """Unregister the collector's hooks. What it collected so far is kept."""
+
+        unregister_hook('post_response', self.on_post_response)
+        unregister_hook('retry', self.on_retry)
+        unregister_hook('error', self.on_error)
+
+    def reset(self) -> None:
+        """Forget everything collected so far"""
+
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a copy of everything collected, e.g. for logging as JSON
+
+        Returns:
+            Dict[str, Any]: counters, histograms and gauges by metric name, each a list of
+                series with their labels
+        """
+
+        with self._lock:
+            counters: Dict[str, List[Dict[str, Any]]] = {
+                name: [{'labels': dict(labels), 'value': value} for labels, value in series.items()]
+                for name, series in self._counters.items()}
+            histograms: Dict[str, List[Dict[str, Any]]] = {
+                name: [{'labels': dict(labels), 'count': histogram.count, 'sum': histogram.sum,
+                        'buckets': dict(histogram.cumulative())} for labels, histogram in series.items()]
+                for name, series in self._histograms.items()}
+
+        return {'counters': counters, 'histograms': histograms, 'gauges': {'ppp_scheduler_queue_depth': [
+            {'labels': dict(labels), 'value': value} for labels, value in _queue_depths()]}}
+
+    def prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format
+
+        Returns:
+            str: the metrics, ready to be served to a Prometheus scrape
+        """
+
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in series.items():
+                    lines.append(f'{name}{_render_labels(labels)} {value}')
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in series.items():
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{_render_labels((*labels, ("le", bound)))} {count}')
+                    lines.append(f'{name}_sum{_render_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{_render_labels(labels)} {histogram.count}')
+
+        depths: List[Tuple[Labels, int]] = _queue_depths()
+        if depths:
+            lines.append('# TYPE ppp_scheduler_queue_depth gauge')
+            for labels, value in depths:
+                lines.append(f'ppp_scheduler_queue_depth{_render_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _queue_depths() -> List[Tuple[Labels, int]]:
+    """How many calls are waiting in the scheduler right now, by vendor and priority class"""
+
+    return [((('vendor', vendor), ('priority', name)), counters['queued'])
+            for vendor, classes in sorted(scheduler_stats().items())
+            for name, counters in classes.items()]
+
+
+def _render_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped: List[str] = []
+    for key, value in labels:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def get_metrics() -> MetricsCollector:
+    """Return the process-wide metrics collector, installing it on first use
+
+    Returns:
+        MetricsCollector: the shared, installed collector
+    """
+
+    global _metrics
+
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsCollector().install()
+
+    return _metrics
+
+
+def serve_prometheus(port: int = 9464,
+                     host: str = '127.0.0.1',
+                     collector: Optional[MetricsCollector] = None) -> ThreadingHTTPServer:
+    """Serve a collector's metrics for Prometheus to scrape, from a background thread
+
+    Args:
+        port (int, optional): the port to listen on. Defaults to 9464.
+        host (str, optional): the address to listen on. Defaults to 127.0.0.1.
+        collector (Optional[MetricsCollector], optional): the collector to serve. Defaults
+            to the process-wide one from get_metrics().
+
+    Returns:
+        ThreadingHTTPServer: the running server. Call shutdown() on it to stop serving.
+    """
+
+    source: MetricsCollector = collector or get_metrics()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            body: bytes = source.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='ppp-metrics', daemon=True).start()
+
+    return server
+
+
+class OpenTelemetryExporter:
+    """Records request events with OpenTelemetry instruments, for whatever metrics
+        pipeline the application has configured. Needs the opentelemetry-api package.
+
+        OpenTelemetryExporter().install()
+    """
+
+    def __init__(self, meter_provider: Any = None) -> None:
+        """
+        Args:
+            meter_provider (Any, optional): the MeterProvider to create instruments with.
+                Defaults to the globally configured one.
+
+        Raises:
+            ImportError: this will raise if opentelemetry-api is not installed
+        """
+
+        try:
+            from opentelemetry import metrics
+            from opentelemetry.metrics import Observation
+        except ImportError:
+            raise ImportError('The OpenTelemetry exporter requires opentelemetry-api. '
+                              'Install it with `pip install ppp-connectors[otel]`') from None
+
+        meter: Any = (meter_provider or metrics.get_meter_provider()).get_meter('ppp_connectors')
+        self._requests: Any = meter.create_counter('ppp.requests', unit='{request}',
+                                                   description='Calls completed, by status')
+        self._retries: Any = meter.create_counter('ppp.retries', unit='{retry}',
+                                                  description='Attempts that were retried')
+        self._errors: Any = meter.create_counter('ppp.errors', unit='{error}',
+                                                 description='Attempts that raised')
+        self._bytes: Any = meter.create_counter('ppp.response.size', unit='By',
+                                                description='Response bytes received')
+        self._duration: Any = meter.create_histogram('ppp.request.duration', unit='s',
+                                                     description='Time to the end of the response body')
+        self._phases: Any = meter.create_histogram('ppp.request.phase.duration', unit='s',
+                                                   description='Time spent in each phase of a request')
+        self._scheduler_wait: Any = meter.create_histogram('ppp.scheduler.wait', unit='s',
+                                                           description='Time waiting for a rate limit token')
+        meter.create_observable_gauge(
+            'ppp.scheduler.queue_depth', unit='{request}', description='Calls waiting for a rate limit token',
+            callbacks=[lambda options: [Observation(value, dict(labels)) for labels, value in _queue_depths()]])
+
+    def on_post_response(self, event: RequestEvent) -> None:
+        attributes: Dict[str, str] = {'vendor': event.vendor, 'endpoint': event.endpoint or 'other'}
+        self._requests.add(1, {**attributes, 'method': event.method, 'status': str(event.status_code),
+                               'cache': 'hit' if event.from_cache else 'miss'})
+        self._bytes.add(event.bytes_received, attributes)
+        if event.from_cache:
+            return
+        self._duration.record(event.duration, attributes)
+        self._scheduler_wait.record(event.timings.get('ratelimit', 0.0),
+                                    {'vendor': event.vendor, 'priority': event.priority})
+        for phase in PHASES:
+            if phase in event.timings:
+                self._phases.record(event.timings[phase], {'vendor': event.vendor, 'phase': phase})
+
+    def on_retry(self, event: RequestEvent) -> None:
+        self._retries.add(1, {'vendor': event.vendor, 'endpoint': event.endpoint or 'other',
+                              'status': str(event.status_code)})
+
+    def on_error(self, event: RequestEvent) -> None:
+        self._errors.add(1, {'vendor': event.vendor, 'endpoint': event.endpoint or 'other',
+                             'error': type(event.error).__name__})
+
+    def install(self) -> 'OpenTelemetryExporter':
+        """Register the exporter's hooks
+
+        Returns:
+            OpenTelemetryExporter: the exporter itself
+        """
+
+        register_hook('post_response', self.on_post_response)
+        register_hook('retry', self.on_retry)
+        register_hook('error', self.on_error)
+
+        return self
+
+    def uninstall(self) -> None:
+        """Unregister the exporter's hooks"""
+
+        unregister_hook('post_response', self.on_post_response)
+        unregister_hook('retry', self.on_retry)
+        unregister_hook('error', self.on_error)
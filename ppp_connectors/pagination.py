@@ -0,0 +1,145 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+from requests import Response
+from .helpers import json_loads
+
+
+# A page fetcher takes the token for the page to fetch (None for the first page) and
+# returns the response. A page parser takes that page's decoded JSON and returns its
+# records, plus the token for the next page, or None when there are no more pages.
+PageFetcher = Callable[[Optional[Any]], Response]
+PageParser = Callable[[Dict[str, Any]], Tuple[List[Any], Optional[Any]]]
+
+
+def _load_page(fetch_page: PageFetcher, parse_page: PageParser,
+               token: Optional[Any]) -> Tuple[List[Any], Optional[Any]]:
+    """Fetch and parse one page, raising on an HTTP error status"""
+
+    response: Response = fetch_page(token)
+    response.raise_for_status()
+    page: Dict[str, Any] = json_loads(response.content)
+
+    return parse_page(page)
+
+
+def paginate(fetch_page: PageFetcher, parse_page: PageParser, prefetch: bool = False) -> Iterator[Any]:
+    """Follow a vendor's pagination scheme, yielding records one at a time. Only the
+        current page is held in memory, plus the next one when prefetching, so memory
+        stays flat however many records there are.
+
+    Args:
+        fetch_page (PageFetcher): fetches the page for a token, None being the first page
+        parse_page (PageParser): returns a page's records and the next page's token
+        prefetch (bool, optional): download the next page on a background thread while the
+            current one is being consumed. Defaults to False.
+
+    Raises:
+        requests.HTTPError: this will raise if any page comes back with an error status
+
+    Yields:
+        Any: each record, in order
+    """
+
+    if not prefetch:
+        token: Optional[Any] = None
+        while True:
+            records, token = _load_page(fetch_page, parse_page, token)
+            yield from records
+            if token is None or not records:
+                return
+
+    executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ppp-prefetch')
+    try:
+        future: Future = executor.submit(copy_context().run, _load_page, fetch_page, parse_page, None)
+        while True:
+            records, token = future.result()
+            if token is None or not records:
+                yield from records
+                return
+
+            future = executor.submit(copy_context().run, _load_page, fetch_page, parse_page, token)
+            yield from records
+    finally:
+        # Don't wait on a page nobody is going to read if the caller stopped early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def spycloud_cursor_page(page: Dict[str, Any]) -> Tuple[List[Any], Optional[Any]]:
+    """Parse a SpyCloud page, which carries a `cursor` for the next page
+
+    Args:
+        page (Dict[str, Any]): the decoded page
+
+    Returns:
+        Tuple[List[Any], Optional[Any]]: the page's results and the next cursor
+    """
+
+    return page.get('results') or [], page.get('cursor') or None
+
+
+def urlscan_search_after_page(page: Dict[str, Any]) -> Tuple[List[Any], Optional[Any]]:
+    """Parse a urlscan search page. The next page starts after the `sort` values of the
+        last result, and `has_more` says whether there is one.
+
+    Args:
+        page (Dict[str, Any]): the decoded page
+
+    Returns:
+        Tuple[List[Any], Optional[Any]]: the page's results and the next search_after value
+    """
+
+    results: List[Any] = page.get('results') or []
+    if not results or not page.get('has_more') or not results[-1].get('sort'):
+        return results, None
+
+    return results, ','.join(str(value) for value in results[-1]['sort'])
+
+
+def twilio_next_page_uri_page(page: Dict[str, Any]) -> Tuple[List[Any], Optional[Any]]:
+    """Parse a Twilio list page, which links to the next one with `next_page_uri`. The
+        token is every query parameter of that URI, Page and PageToken included.
+
+    Args:
+        page (Dict[str, Any]): the decoded page
+
+    Returns:
+        Tuple[List[Any], Optional[Any]]: the page's usage records and the next page's parameters
+    """
+
+    records: List[Any] = page.get('usage_records') or []
+    next_page_uri: Optional[str] = page.get('next_page_uri')
+    if not next_page_uri:
+        return records, None
+
+    return records, dict(parse_qsl(urlsplit(next_page_uri).query))
+
+
+def flashpoint_offset_parser(size: int, start: int = 0) -> PageParser:
+    """Build a parser for Flashpoint's from/size pagination. The token is the `from`
+        offset of the next page.
+
+    Args:
+        size (int): the page size requested
+        start (int, optional): the offset of the first page. Defaults to 0.
+
+    Returns:
+        PageParser: a parser that tracks the offset from page to page
+    """
+
+    offset: List[int] = [start]
+
+    def parse(page: Dict[str, Any]) -> Tuple[List[Any], Optional[Any]]:
+        items: List[Any] = page.get('items') or page.get('results') or []
+        total: Any = page.get('total')
+        if isinstance(total, dict):
+            total = total.get('value')
+
+        offset[0] += len(items)
+        if len(items) < size or (isinstance(total, int) and offset[0] >= total):
+            return items, None
+
+        return items, offset[0]
+
+    return parse
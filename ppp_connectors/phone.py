@@ -0,0 +1,274 @@
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from .batch import batch_lookup
+from .cache import CacheEntry, ResponseCache, get_cache, request_key
+from .helpers import Config, get_config
+from .registry import TWILIO_DATA_PACKAGES
+from .twilio import twilio_lookup
+
+
+env_config: Config = get_config()
+
+# The free fields every lookup returns, e.g. valid and national_format, are kept as one
+# more package under this name
+BASIC_PACKAGE: str = 'basic'
+
+# How long each package stays fresh, in seconds, unless PPP_CACHE_TTL_TWILIO_LOOKUP_<PACKAGE>
+# says otherwise. Packages that track live state, such as a recent SIM swap, go stale quickly.
+# Packages not listed use PPP_CACHE_TTL.
+PACKAGE_TTLS: Dict[str, float] = {
+    BASIC_PACKAGE: 30 * 86400,
+    'line_type_intelligence': 30 * 86400,
+    'caller_name': 7 * 86400,
+    'reassigned_number': 86400,
+    'identity_match': 86400,
+    'phone_number_quality_score': 86400,
+    'sim_swap': 3600,
+    'call_forwarding': 3600,
+    'line_status': 3600,
+    'sms_pumping_risk': 3600,
+}
+
+# An extension after the number, e.g. `x123` or `ext. 123`
+_EXTENSION: 're.Pattern[str]' = re.compile(r'\s*(?:ext\.?|x|#)\s*\d+\s*$', re.IGNORECASE)
+
+# Holds packages when PPP_CACHE is off, so repeat bulk lookups still don't pay twice
+_package_cache: Optional[ResponseCache] = None
+_package_cache_lock: threading.Lock = threading.Lock()
+
+
+class PhoneLookup(NamedTuple):
+    """The outcome of a bulk lookup for one phone number
+
+    Attributes:
+        phone_number (Optional[str]): the number in E.164 format, or None if it could not be normalised
+        inputs (Tuple[str, ...]): every input that normalised to this number
+        data (Optional[Dict[str, Any]]): the basic fields and the requested packages, as the
+            Lookup API returns them, or None if the lookup failed
+        error (Optional[BaseException]): the exception raised, if any
+        cached (Tuple[str, ...]): the packages served from the cache
+        fetched (Tuple[str, ...]): the packages bought from Twilio
+    """
+
+    phone_number: Optional[str]
+    inputs: Tuple[str, ...]
+    data: Optional[Dict[str, Any]] = None
+    error: Optional[BaseException] = None
+    cached: Tuple[str, ...] = ()
+    fetched: Tuple[str, ...] = ()
+
+    @property
+    def ok(self) -> bool:
+        """True when every requested package was found"""
+        return self.error is None
+
+
+def normalize_phone_number(phone_number: str, default_country_code: Optional[str] = None) -> str:
+    """Normalise a phone number to E.164, e.g. `(415) 555-0100` to `+14155550100`.
+        Numbers starting with + or 00 keep their country code. Other numbers are taken to
+        be national, lose a leading trunk 0, and get the default country code, unless they
+        already start with it and are too long to be national.
+
+    Args:
+        phone_number (str): the number, in any common format
+        default_country_code (Optional[str], optional): the country calling code for national
+            numbers. Defaults to None, which uses PPP_TWILIO_COUNTRY_CODE or 1.
+
+    Raises:
+        ValueError: this will raise if the number can't be a valid E.164 number
+
+    Returns:
+        str: the number in E.164 format
+    """
+
+    country_code: str = (default_country_code or env_config.get('PPP_TWILIO_COUNTRY_CODE') or '1').lstrip('+')
+    text: str = _EXTENSION.sub('', phone_number.strip())
+    digits: str = re.sub(r'\D', '', text)
+
+    if text.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif not (digits.startswith(country_code) and len(digits) > 10):
+        digits = country_code + digits.lstrip('0')
+
+    # E.164 allows at most 15 digits, and no country code starts with 0
+    if not 8 <= len(digits) <= 15 or digits.startswith('0'):
+        raise ValueError(f'"{phone_number}" is not a valid phone number')
+
+    return f'+{digits}'
+
+
+def package_ttl(cache: ResponseCache, package: str) -> float:
+    """The TTL of a data package: PPP_CACHE_TTL_TWILIO_LOOKUP_<PACKAGE> when it is set,
+        then PACKAGE_TTLS, then the cache's default
+
+    Args:
+        cache (ResponseCache): the cache the package is stored in
+        package (str): the package name, or `basic`
+
+    Returns:
+        float: seconds the package stays fresh
+    """
+
+    name: str = f'twilio_lookup_{package}'
+    if name in cache.ttls or env_config.get(f'PPP_CACHE_TTL_{name.upper()}'):
+        return cache.ttl_for(name)
+
+    return PACKAGE_TTLS.get(package, cache.default_ttl)
+
+
+def _package_key(phone_number: str, package: str) -> str:
+    """The cache key of one package for one number, kept apart from the broker's response keys"""
+    return request_key('GET', f'twilio-lookup-package:{phone_number}', params={'package': package})
+
+
+def _get_package_cache() -> ResponseCache:
+    """The broker's cache when PPP_CACHE is on, and otherwise an in-memory one of our own"""
+
+    global _package_cache
+
+    cache: Optional[ResponseCache] = get_cache()
+    if cache is not None:
+        return cache
+
+    with _package_cache_lock:
+        if _package_cache is None:
+            _package_cache = ResponseCache(default_ttl=float(env_config.get('PPP_CACHE_TTL') or 3600))
+
+        return _package_cache
+
+
+def _reset_package_cache() -> None:
+    global _package_cache
+
+    with _package_cache_lock:
+        _package_cache = None
+
+
+env_config.on_reload(_reset_package_cache)
+
+
+def _fetch_packages(job: Tuple[str, Tuple[str, ...]]) -> Dict[str, Any]:
+    """Look up one number with only the packages it is missing"""
+
+    phone_number, packages = job
+    response = twilio_lookup(phone_number, [package for package in packages if package != BASIC_PACKAGE])
+    response.raise_for_status()
+
+    return response.json()
+
+
+def _split_packages(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Split a Lookup response into its packages, with the free fields as `basic`"""
+
+    packages: Dict[str, Any] = {BASIC_PACKAGE: {}}
+    for field, value in data.items():
+        if field in TWILIO_DATA_PACKAGES:
+            packages[field] = value
+        else:
+            packages[BASIC_PACKAGE][field] = value
+
+    return packages
+
+
+def _assemble(phone_number: str, inputs: List[str], held: Dict[str, Any], packages: List[str],
+              fetched: Tuple[str, ...]) -> PhoneLookup:
+    """Merge a number's packages back into the shape of a Lookup response"""
+
+    data: Dict[str, Any] = dict(held.get(BASIC_PACKAGE) or {})
+    for package in packages[1:]:
+        data[package] = held.get(package)
+
+    return PhoneLookup(phone_number, tuple(inputs), data,
+                       cached=tuple(package for package in packages if package not in fetched),
+                       fetched=fetched)
+
+
+def twilio_bulk_lookup(phone_numbers: Iterable[str],
+                       data_packages: Optional[List[str]] = None,
+                       concurrency: int = 10,
+                       default_country_code: Optional[str] = None) -> Iterator[PhoneLookup]:
+    """Look up many phone numbers, buying each data package for a number only once while
+        it is fresh. Numbers are normalised to E.164 and looked up once however often
+        they appear. Every package is cached apart from the others with its own TTL, see
+        package_ttl, so asking for sim_swap on a number whose line_type_intelligence is
+        already held only buys sim_swap. The numbers still missing packages are looked up
+        concurrently. The cache is the PPP_CACHE one when it is on, and an in-memory one
+        otherwise.
+
+    Args:
+        phone_numbers (Iterable[str]): the numbers to look up, in any common format
+        data_packages (Optional[List[str]], optional): the packages to return for every
+            number, as in twilio_lookup. Defaults to None, for the free basic fields only.
+        concurrency (int, optional): the maximum number of lookups in flight. Defaults to 10.
+        default_country_code (Optional[str], optional): the country calling code for national
+            numbers. Defaults to None, which uses PPP_TWILIO_COUNTRY_CODE or 1.
+
+    Raises:
+        ValueError: this will raise if a data package is not valid
+
+    Yields:
+        PhoneLookup: the outcome for each distinct number. Numbers answered from the cache
+            come first, then fetched numbers in completion order, then invalid inputs.
+    """
+
+    requested: List[str] = list(dict.fromkeys(data_packages or []))
+    invalid: List[str] = [package for package in requested if package not in TWILIO_DATA_PACKAGES]
+    if invalid:
+        raise ValueError(f'"{", ".join(invalid)}" are not valid data packages. Valid packages '
+                         f'include {", ".join(sorted(TWILIO_DATA_PACKAGES))}')
+    packages: List[str] = [BASIC_PACKAGE] + requested
+
+    # Group the inputs by the number they normalise to, keeping their order
+    inputs: Dict[str, List[str]] = {}
+    failed: List[PhoneLookup] = []
+    for phone_number in phone_numbers:
+        try:
+            inputs.setdefault(normalize_phone_number(phone_number, default_country_code), []).append(phone_number)
+        except ValueError as e:
+            failed.append(PhoneLookup(None, (phone_number,), error=e))
+
+    cache: ResponseCache = _get_package_cache()
+    held: Dict[str, Dict[str, Any]] = {}
+    jobs: List[Tuple[str, Tuple[str, ...]]] = []
+    for phone_number in inputs:
+        held[phone_number] = {}
+        for package in packages:
+            entry: Optional[CacheEntry] = cache.get(_package_key(phone_number, package))
+            if entry is not None:
+                held[phone_number][package] = json.loads(entry.content)
+
+        missing: Tuple[str, ...] = tuple(package for package in packages if package not in held[phone_number])
+        if missing:
+            jobs.append((phone_number, missing))
+        else:
+            yield _assemble(phone_number, inputs[phone_number], held[phone_number], packages, ())
+
+    for outcome in batch_lookup(_fetch_packages, jobs, concurrency=concurrency):
+        phone_number, missing = outcome.query
+        if not outcome.ok:
+            yield PhoneLookup(phone_number, tuple(inputs[phone_number]), error=outcome.error,
+                              cached=tuple(held[phone_number]))
+            continue
+
+        # The basic fields come with every lookup, so refresh them even when they were held
+        fetched: Dict[str, Any] = _split_packages(outcome.result)
+        for package, value in fetched.items():
+            if package not in packages:
+                continue
+            ttl: float = package_ttl(cache, package)
+            if ttl > 0:
+                cache.set(_package_key(phone_number, package),
+                          CacheEntry(200, {'Content-Type': 'application/json'}, json.dumps(value).encode(),
+                                     f'https://lookups.twilio.com/v2/PhoneNumbers/{phone_number}',
+                                     time.time() + ttl))
+            held[phone_number][package] = value
+
+        yield _assemble(phone_number, inputs[phone_number], held[phone_number], packages, missing)
+
+    yield from failed
+
@@ -0,0 +1,235 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, \
+    Tuple, Union, TYPE_CHECKING
+from .async_broker import close_client
+from .batch import _aiter
+from .urlscan import async_urlscan_results, async_urlscan_scan
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class ScanResult(NamedTuple):
+    """The outcome of one URL sent through the scan pipeline
+
+    Attributes:
+        url (str): the URL that was submitted
+        status (str): `done` when the result is ready, `failed` when the submission or a
+            poll was refused or raised, `timeout` when the result never became ready, or
+            `skipped` when the pre-filter matched the URL and nothing was submitted
+        uuid (Optional[str]): the scan's UUID, once it was accepted
+        response (Optional[httpx.Response]): the result, or the response that failed
+        error (Optional[BaseException]): the exception raised, if any
+        polls (int): how many times the result was polled
+        seconds (float): the time from submission to the outcome
+    """
+
+    url: str
+    status: str
+    uuid: Optional[str] = None
+    response: Optional['httpx.Response'] = None
+    error: Optional[BaseException] = None
+    polls: int = 0
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """True when the scan finished and its result was fetched"""
+        return self.status == 'done'
+
+    def json(self) -> Any:
+        """Return the decoded result
+
+        Returns:
+            Any: the scan result
+        """
+
+        return self.response.json()
+
+
+class _Scan:
+    """A submitted scan waiting for its result"""
+
+    __slots__ = ('url', 'uuid', 'submitted', 'interval', 'polls')
+
+    def __init__(self, url: str, uuid: str, submitted: float, interval: float) -> None:
+        self.url: str = url
+        self.uuid: str = uuid
+        self.submitted: float = submitted
+        self.interval: float = interval
+        self.polls: int = 0
+
+
+async def async_urlscan_scan_and_wait(urls: Union[Iterable[str], AsyncIterable[str]],
+                                      max_in_flight: int = 100,
+                                      first_poll: float = 10.0,
+                                      poll_interval: float = 2.0,
+                                      max_poll_interval: float = 30.0,
+                                      backoff: float = 1.5,
+                                      timeout: float = 300.0,
+                                      poll_concurrency: int = 10,
+                                      **kwargs: Any) -> AsyncIterator[ScanResult]:
+    """Submit many URLs to urlscan.io and yield each scan's result as soon as it is ready.
+        Submissions go through the urlscan rate limiter, set with PPP_RATELIMIT_URLSCAN.
+        Waiting scans are kept on one schedule, ordered by when each is next due to be
+        polled, so hundreds of scans can wait at once without a task or thread each.
+        A scan is polled `first_poll` seconds after it is accepted, and again while its
+        result is a 404, with the interval growing by `backoff` up to `max_poll_interval`.
+
+    Args:
+        urls (Union[Iterable[str], AsyncIterable[str]]): the URLs to scan, which may be lazy
+        max_in_flight (int, optional): the most scans submitted but not finished. Defaults to 100.
+        first_poll (float, optional): seconds from submission to the first poll. Defaults to 10.
+        poll_interval (float, optional): seconds between the first and second poll. Defaults to 2.
+        max_poll_interval (float, optional): the longest wait between polls. Defaults to 30.
+        backoff (float, optional): what each wait between polls is multiplied by. Defaults to 1.5.
+        timeout (float, optional): seconds after submission to give up on a scan. Defaults to 300.
+        poll_concurrency (int, optional): the most polls sent at once. Defaults to 10.
+        **kwargs (Any): passed to every urlscan_scan, e.g. visibility='unlisted'
+
+    Raises:
+        ValueError: this will raise if max_in_flight or poll_concurrency is less than 1
+
+    Yields:
+        ScanResult: each URL's outcome, in the order they finish
+    """
+
+    if max_in_flight < 1 or poll_concurrency < 1:
+        raise ValueError(f'max_in_flight and poll_concurrency must be at least 1, '
+                         f'got {max_in_flight} and {poll_concurrency}')
+
+    url_iter: AsyncIterator[str] = urls.__aiter__() if isinstance(urls, AsyncIterable) else _aiter(urls)
+    exhausted: bool = False
+    in_flight: int = 0
+
+    # Waiting scans, by when they are next due to be polled. The counter breaks ties.
+    schedule: List[Tuple[float, int, _Scan]] = []
+    counter: Iterator[int] = itertools.count()
+
+    submitting: Dict[asyncio.Task, Tuple[str, float]] = {}
+    polling: Dict[asyncio.Task, _Scan] = {}
+
+    try:
+        while True:
+            while not exhausted and in_flight < max_in_flight:
+                try:
+                    url: str = await url_iter.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                submitting[asyncio.ensure_future(async_urlscan_scan(url, **kwargs))] = (url, time.monotonic())
+                in_flight += 1
+
+            now: float = time.monotonic()
+            while schedule and schedule[0][0] <= now and len(polling) < poll_concurrency:
+                scan: _Scan = heapq.heappop(schedule)[2]
+                scan.polls += 1
+                polling[asyncio.ensure_future(async_urlscan_results(scan.uuid))] = scan
+
+            if not submitting and not polling:
+                if not schedule:
+                    break
+                await asyncio.sleep(max(0.0, schedule[0][0] - time.monotonic()))
+                continue
+
+            # Wake for the first request to finish, or when the next poll is due if one can be sent
+            wake: Optional[float] = None
+            if schedule and len(polling) < poll_concurrency:
+                wake = max(0.0, schedule[0][0] - time.monotonic())
+            done, _ = await asyncio.wait([*submitting, *polling], timeout=wake,
+                                         return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                now = time.monotonic()
+
+                if task in submitting:
+                    url, submitted = submitting.pop(task)
+                    if task.exception() is not None:
+                        in_flight -= 1
+                        yield ScanResult(url, 'failed', error=task.exception(), seconds=now - submitted)
+                        continue
+
+                    response: httpx.Response = task.result()
+                    if getattr(response, 'skipped', False):
+                        in_flight -= 1
+                        yield ScanResult(url, 'skipped', response=response, seconds=now - submitted)
+                        continue
+
+                    uuid: Optional[str] = response.json().get('uuid') if response.status_code == 200 else None
+                    if uuid is None:
+                        in_flight -= 1
+                        yield ScanResult(url, 'failed', response=response, seconds=now - submitted)
+                        continue
+
+                    scan = _Scan(url, uuid, submitted, poll_interval)
+                    heapq.heappush(schedule, (now + first_poll, next(counter), scan))
+                    continue
+
+                scan = polling.pop(task)
+                outcome: Optional[ScanResult] = None
+                if task.exception() is not None:
+                    outcome = ScanResult(scan.url, 'failed', scan.uuid, error=task.exception(),
+                                         polls=scan.polls, seconds=now - scan.submitted)
+                elif task.result().status_code == 200:
+                    outcome = ScanResult(scan.url, 'done', scan.uuid, task.result(),
+                                         polls=scan.polls, seconds=now - scan.submitted)
+                elif task.result().status_code != 404:
+                    outcome = ScanResult(scan.url, 'failed', scan.uuid, task.result(),
+                                         polls=scan.polls, seconds=now - scan.submitted)
+                elif now + scan.interval - scan.submitted > timeout:
+                    outcome = ScanResult(scan.url, 'timeout', scan.uuid, task.result(),
+                                         polls=scan.polls, seconds=now - scan.submitted)
+                else:
+                    # Still running, so poll again later and a little less often
+                    heapq.heappush(schedule, (now + scan.interval, next(counter), scan))
+                    scan.interval = min(max_poll_interval, scan.interval * backoff)
+
+                if outcome is not None:
+                    in_flight -= 1
+                    yield outcome
+    finally:
+        # Only reached with work pending if the caller stopped iterating early
+        for task in [*submitting, *polling]:
+            task.cancel()
+
+
+def urlscan_scan_and_wait(urls: Iterable[str], **kwargs: Any) -> Iterator[ScanResult]:
+    """Synchronous driver for async_urlscan_scan_and_wait, taking the same arguments. The
+        pipeline runs on a private event loop in the calling thread, which advances
+        whenever the next result is asked for.
+
+    Raises:
+        RuntimeError: this will raise if called from a running event loop, where
+            async_urlscan_scan_and_wait should be used instead
+
+    Yields:
+        ScanResult: each URL's outcome, in the order they finish
+    """
+
+    loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+    results: AsyncIterator[ScanResult] = async_urlscan_scan_and_wait(urls, **kwargs)
+
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.run_until_complete(_cancel_remaining())
+        loop.close()
+
+
+async def _cancel_remaining() -> None:
+    """Cancel and wait out the loop's other tasks, e.g. polls shared with other callers
+        through coalescing, then close the loop's client, as asyncio.run does on exit"""
+
+    remaining: Set[asyncio.Task] = asyncio.all_tasks() - {asyncio.current_task()}
+    for task in remaining:
+        task.cancel()
+    await asyncio.gather(*remaining, return_exceptions=True)
+    await close_client()
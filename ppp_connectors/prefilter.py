@@ -0,0 +1,359 @@
+import hashlib
+import json
+import math
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TYPE_CHECKING
+from urllib.parse import urlsplit
+import requests
+from .cache import CacheEntry
+from .helpers import Config, get_config
+
+if TYPE_CHECKING:
+    import httpx
+
+
+env_config: Config = get_config()
+
+_prefilter: Optional['Prefilter'] = None
+_prefilter_loaded: bool = False
+_prefilter_set_in_code: bool = False
+_prefilter_lock: threading.Lock = threading.Lock()
+
+
+def normalize_indicator(indicator: str) -> str:
+    """Reduce a URL or domain to the lowercase host that allowlists are matched on, e.g.
+        `https://WWW.Example.com:8443/path` to `www.example.com`. A cookie domain's leading
+        dot and a wildcard's `*.` are dropped.
+
+    Args:
+        indicator (str): a URL, domain, cookie domain or IP address
+
+    Returns:
+        str: the host, or an empty string if there is none
+    """
+
+    text: str = indicator.strip().lower()
+    if '://' in text:
+        text = urlsplit(text).hostname or ''
+    else:
+        text = text.split('/', 1)[0]
+        # Drop a port, but leave IPv6 addresses alone, taking a bracketed one out of its
+        # brackets as urlsplit does, e.g. `[::1]:443` to `::1`
+        if text.startswith('['):
+            text = text[1:].split(']', 1)[0]
+        elif text.count(':') == 1:
+            text = text.split(':', 1)[0]
+
+    if text.startswith('*.'):
+        text = text[2:]
+
+    return text.strip('.')
+
+
+def domain_suffixes(host: str) -> Iterator[str]:
+    """The host itself, then each parent domain, e.g. `a.b.example.com`, `b.example.com`,
+        `example.com` and `com`
+
+    Args:
+        host (str): a normalised host
+
+    Yields:
+        str: each suffix, longest first
+    """
+
+    yield host
+    position: int = host.find('.')
+    while position != -1:
+        yield host[position + 1:]
+        position = host.find('.', position + 1)
+
+
+class BloomFilter:
+    """A fixed-size set of strings that answers membership in a few bits per entry. It
+        never misses an entry that was added, but may report one that wasn't with about
+        the chosen error rate, e.g. 1.8 MB holds a million entries at 0.1%.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        """
+        Args:
+            capacity (int): how many entries the filter is sized for
+            error_rate (float, optional): the false positive rate at capacity. Defaults to 0.001.
+
+        Raises:
+            ValueError: this will raise if the error rate is not between 0 and 1
+        """
+
+        if not 0 < error_rate < 1:
+            raise ValueError(f'error_rate must be between 0 and 1, got {error_rate}')
+
+        capacity = max(capacity, 1)
+        self.bits: int = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes: int = max(1, round(self.bits / capacity * math.log(2)))
+        self.count: int = 0
+        self._array: bytearray = bytearray((self.bits + 7) // 8)
+        self._range: range = range(self.hashes)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __repr__(self) -> str:
+        return f'BloomFilter({self.count} entries, {len(self._array)} bytes, {self.hashes} hashes)'
+
+    def _positions(self, value: str) -> List[int]:
+        """The bits for a value, by double hashing one 128-bit digest"""
+
+        digest: int = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=16).digest(), 'little')
+        first: int = digest >> 64
+        second: int = (digest & 0xFFFFFFFFFFFFFFFF) | 1
+        bits: int = self.bits
+
+        return [(first + i * second) % bits for i in self._range]
+
+    def add(self, value: str) -> None:
+        """Add a value
+
+        Args:
+            value (str): the value
+        """
+
+        array: bytearray = self._array
+        for position in self._positions(value):
+            array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        array: bytearray = self._array
+        for position in self._positions(value):
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        """The memory held by the bit array"""
+        return len(self._array)
+
+
+class Prefilter:
+    """A local allowlist checked before a lookup is sent, so indicators known to be benign,
+        such as your own domains or a top-sites list, don't cost an API call. A domain
+        matches when it, or any domain it belongs to, is listed, so listing example.com
+        also covers www.example.com. Entries are held in a set, or in a BloomFilter to
+        keep millions of them in a few megabytes at the cost of rare false matches.
+    """
+
+    def __init__(self, entries: Iterable[str], bloom: bool = False, capacity: Optional[int] = None,
+                 error_rate: float = 0.001) -> None:
+        """
+        Args:
+            entries (Iterable[str]): the domains, URLs or IP addresses to skip
+            bloom (bool, optional): hold the entries in a BloomFilter. Defaults to False.
+            capacity (Optional[int], optional): the number of entries to size the Bloom filter
+                for. Defaults to None, which counts them first.
+            error_rate (float, optional): the Bloom filter's false positive rate. Defaults to 0.001.
+        """
+
+        self.bloom: bool = bloom
+        self.entries: Any
+        if bloom:
+            if capacity is None:
+                entries = list(entries)
+                capacity = len(entries)
+            self.entries = BloomFilter(capacity, error_rate)
+        else:
+            self.entries = set()
+
+        for entry in entries:
+            host: str = normalize_indicator(entry)
+            if host:
+                self.entries.add(host)
+
+        self.checks: int = 0
+        self.hits: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __repr__(self) -> str:
+        return f'Prefilter({len(self)} entries, {"bloom" if self.bloom else "set"})'
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str], bloom: bool = False, error_rate: float = 0.001) -> 'Prefilter':
+        """Load allowlists with one entry per line. Blank lines and `#` comments are
+            skipped, and in CSV lines such as a top-sites list's `rank,domain` the last
+            field is used. For a Bloom filter the files are read twice, once to count the
+            entries, so they never all have to be held in memory.
+
+        Args:
+            paths (Iterable[str]): the files to load
+            bloom (bool, optional): hold the entries in a BloomFilter. Defaults to False.
+            error_rate (float, optional): the Bloom filter's false positive rate. Defaults to 0.001.
+
+        Returns:
+            Prefilter: the pre-filter
+        """
+
+        paths = list(paths)
+        capacity: Optional[int] = sum(1 for _ in _read_entries(paths)) if bloom else None
+
+        return cls(_read_entries(paths), bloom=bloom, capacity=capacity, error_rate=error_rate)
+
+    def matches(self, indicator: str) -> bool:
+        """Check whether a lookup can be skipped, counting the check towards the hit rate
+
+        Args:
+            indicator (str): the URL, domain or IP address about to be looked up
+
+        Returns:
+            bool: True if the indicator or a domain it belongs to is listed
+        """
+
+        host: str = normalize_indicator(indicator)
+        entries: Any = self.entries
+        if not host:
+            hit: bool = False
+        elif ':' in host or host.replace('.', '').isdigit():
+            # IP addresses only match exactly
+            hit = host in entries
+        else:
+            hit = any(suffix in entries for suffix in domain_suffixes(host))
+
+        with self._lock:
+            self.checks += 1
+            if hit:
+                self.hits += 1
+
+        return hit
+
+    def stats(self) -> Dict[str, Any]:
+        """Check and hit counters, the hit rate, and how much the entries hold
+
+        Returns:
+            Dict[str, Any]: the counters
+        """
+
+        with self._lock:
+            checks, hits = self.checks, self.hits
+
+        return {'checks': checks, 'hits': hits, 'hit_rate': hits / checks if checks else 0.0,
+                'entries': len(self), 'kind': 'bloom' if self.bloom else 'set',
+                'bytes': self.entries.nbytes if self.bloom else None}
+
+
+def _read_entries(paths: List[str]) -> Iterator[str]:
+    """Yield every entry in allowlist files"""
+
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    yield line.rsplit(',', 1)[-1].strip()
+
+
+def _prefilter_from_env() -> Optional[Prefilter]:
+    """Build the pre-filter from the comma-separated allowlists in PPP_PREFILTER, with a
+        Bloom filter when PPP_PREFILTER_BLOOM is true. It stays off when PPP_PREFILTER is not set.
+    """
+
+    setting: str = env_config.get('PPP_PREFILTER') or ''
+    paths: List[str] = [path.strip() for path in setting.split(',') if path.strip()]
+    if not paths:
+        return None
+
+    bloom: bool = (env_config.get('PPP_PREFILTER_BLOOM') or 'false').lower() == 'true'
+    error_rate: float = float(env_config.get('PPP_PREFILTER_ERROR_RATE') or 0.001)
+
+    return Prefilter.from_files(paths, bloom=bloom, error_rate=error_rate)
+
+
+def get_prefilter() -> Optional[Prefilter]:
+    """Return the pre-filter used by the brokers, loading it from PPP_PREFILTER on first use
+
+    Returns:
+        Optional[Prefilter]: the pre-filter, or None if it is off
+    """
+
+    global _prefilter, _prefilter_loaded
+
+    if not _prefilter_loaded:
+        with _prefilter_lock:
+            if not _prefilter_loaded:
+                _prefilter = _prefilter_from_env()
+                _prefilter_loaded = True
+
+    return _prefilter
+
+
+def set_prefilter(prefilter: Optional[Prefilter]) -> None:
+    """Install a pre-filter for the brokers to use, or turn it off with None
+
+    Args:
+        prefilter (Optional[Prefilter]): the pre-filter to use
+    """
+
+    global _prefilter, _prefilter_loaded, _prefilter_set_in_code
+
+    with _prefilter_lock:
+        _prefilter = prefilter
+        _prefilter_loaded = True
+        _prefilter_set_in_code = True
+
+
+def _forget_env_prefilter() -> None:
+    """Reload the pre-filter from PPP_PREFILTER on next use, unless one was installed with set_prefilter"""
+
+    global _prefilter, _prefilter_loaded
+
+    with _prefilter_lock:
+        if not _prefilter_set_in_code:
+            _prefilter = None
+            _prefilter_loaded = False
+
+
+env_config.on_reload(_forget_env_prefilter)
+
+
+def _skipped_entry(url: str, indicator: str) -> CacheEntry:
+    body: bytes = json.dumps({'skipped': True, 'reason': 'prefilter', 'indicator': indicator}).encode()
+    return CacheEntry(200, {'Content-Type': 'application/json'}, body, url, 0.0)
+
+
+def skipped_response(url: str, indicator: str) -> requests.Response:
+    """The synthetic result of a lookup the pre-filter skipped: a 200 whose JSON body is
+        {"skipped": true, "reason": "prefilter", "indicator": ...}, with `skipped` set to True
+
+    Args:
+        url (str): the URL the lookup would have been sent to
+        indicator (str): the indicator that matched
+
+    Returns:
+        requests.Response: the response
+    """
+
+    response: requests.Response = _skipped_entry(url, indicator).to_response()
+    response.from_cache = False
+    response.skipped = True
+
+    return response
+
+
+def async_skipped_response(method: str, url: str, indicator: str) -> 'httpx.Response':
+    """The httpx counterpart of skipped_response
+
+    Args:
+        method (str): the HTTP method of the lookup
+        url (str): the URL the lookup would have been sent to
+        indicator (str): the indicator that matched
+
+    Returns:
+        httpx.Response: the response
+    """
+
+    response: httpx.Response = _skipped_entry(url, indicator).to_httpx_response(method)
+    response.from_cache = False
+    response.skipped = True
+
+    return response
@@ -0,0 +1,186 @@
+import asyncio
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from .helpers import Config, get_config, vendor_for_url
+
+
+env_config: Config = get_config()
+
+# Seconds in each unit accepted by PPP_RATELIMIT_<VENDOR>, e.g. 5/s, 300/m, 1000/h, 20/10
+_PERIODS: Dict[str, float] = {'s': 1.0, 'm': 60.0, 'h': 3600.0, 'd': 86400.0}
+
+_limiters: Dict[str, Optional['TokenBucket']] = {}
+_limiters_lock: threading.Lock = threading.Lock()
+
+
+class TokenBucket:
+    """A thread-safe token bucket that can be waited on from threads and from coroutines.
+
+    Callers reserve a token up front and then sleep until it is theirs, so the lock is
+    only held for the arithmetic and is never held across a sleep or an await. Waiters
+    are served in the order they arrive.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        """
+        Args:
+            rate (float): tokens added per second
+            capacity (float, optional): the most tokens that can be banked, i.e. the largest
+                burst allowed. Defaults to one second's worth of tokens, and at least 1.
+        """
+
+        if rate <= 0:
+            raise ValueError(f'rate must be greater than 0, got {rate}')
+
+        self.rate: float = float(rate)
+        self.capacity: float = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens: float = self.capacity
+        self._updated: float = time.monotonic()
+        self._lock: threading.Lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, going into debt if none are available
+
+        Returns:
+            float: the number of seconds the caller must wait before using the token
+        """
+
+        with self._lock:
+            now: float = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self) -> float:
+        """Take a token only if one is available now, never going into debt
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds until one will be available
+        """
+
+        with self._lock:
+            now: float = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> float:
+        """Block the current thread until a token is available
+
+        Returns:
+            float: the number of seconds spent waiting
+        """
+
+        wait: float = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+    async def async_acquire(self) -> float:
+        """Suspend the current coroutine until a token is available
+
+        Returns:
+            float: the number of seconds spent waiting
+        """
+
+        wait: float = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        return wait
+
+
+def parse_rate_limit(value: str) -> Tuple[float, Optional[float]]:
+    """Parse a rate limit setting of the form <count>/<period>[:<burst>]. The period is
+        s, m, h, d, or a number of seconds, e.g. 5/s, 300/m, 20/10:5
+
+    Args:
+        value (str): the setting to parse
+
+    Raises:
+        ValueError: this will raise if the setting is not in the expected format
+
+    Returns:
+        Tuple[float, Optional[float]]: the rate in requests per second, and the burst size if given
+    """
+
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?|[smhd])\s*(?::\s*(\d+))?\s*',
+                         value.lower())
+    if not match:
+        raise ValueError(f'Invalid rate limit "{value}". Expected <count>/<period>[:<burst>], '
+                         f'e.g. 5/s, 300/m or 20/10:5')
+
+    count, period, burst = match.groups()
+    seconds: float = _PERIODS[period] if period in _PERIODS else float(period)
+
+    return float(count) / seconds, float(burst) if burst else None
+
+
+def rate_limit_setting(vendor: str) -> str:
+    """The rate limit for a vendor, from PPP_RATELIMIT_<VENDOR>
+
+    Args:
+        vendor (str): the vendor name, e.g. URLSCAN
+
+    Returns:
+        str: the setting, e.g. 2/s, or an empty string if the vendor has no limit
+    """
+
+    return env_config.get(f'PPP_RATELIMIT_{vendor}') or ''
+
+
+def get_limiter(url: str) -> Optional[TokenBucket]:
+    """Return the token bucket for the vendor a URL belongs to. Limits are read from
+        PPP_RATELIMIT_<VENDOR>, e.g. PPP_RATELIMIT_URLSCAN=2/s, the first time each
+        vendor is seen.
+
+    Args:
+        url (str): the vendor URL about to be requested
+
+    Returns:
+        Optional[TokenBucket]: the vendor's bucket, or None if it has no limit configured
+    """
+
+    vendor: str = vendor_for_url(url)
+
+    if vendor in _limiters:
+        return _limiters[vendor]
+
+    with _limiters_lock:
+        if vendor not in _limiters:
+            setting: str = rate_limit_setting(vendor)
+            _limiters[vendor] = TokenBucket(*parse_rate_limit(setting)) if setting else None
+
+        return _limiters[vendor]
+
+
+def set_rate_limit(vendor: str, rate: Optional[float], capacity: Optional[float] = None) -> None:
+    """Set or remove the rate limit for a vendor at runtime, overriding the environment
+
+    Args:
+        vendor (str): the vendor name, e.g. URLSCAN
+        rate (Optional[float]): requests per second, or None to remove the limit
+        capacity (Optional[float], optional): the burst size. Defaults to None.
+    """
+
+    with _limiters_lock:
+        _limiters[vendor.upper()] = TokenBucket(rate, capacity) if rate else None
+
+
+def reset_limiters() -> None:
+    """Forget every vendor's bucket, so limits are read from the environment again"""
+
+    with _limiters_lock:
+        _limiters.clear()
+
+
+env_config.on_reload(reset_limiters)
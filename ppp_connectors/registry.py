@@ -0,0 +1,576 @@
+import functools
+import inspect
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+from urllib.parse import quote
+from requests import Response
+from requests.auth import HTTPBasicAuth
+from .async_broker import async_make_request
+from .broker import make_request
+from .helpers import check_required_env_vars, Config, get_config, validate_date_string
+from .keys import KeyPool, get_key_pool
+from .pagination import (PageParser, flashpoint_offset_parser, paginate, spycloud_cursor_page,
+                         twilio_next_page_uri_page, urlscan_search_after_page)
+
+if TYPE_CHECKING:
+    import httpx
+
+
+env_config: Config = get_config()
+
+
+class Auth(NamedTuple):
+    """How an endpoint authenticates
+
+    Attributes:
+        scheme (str): `header` sends the first variable in the `name` header, `bearer` sends it
+            as a bearer token, `field` sends it as the `name` query parameter or body field,
+            and `basic` uses the two variables as username and password
+        env_vars (Tuple[str, ...]): the environment variables holding the credentials. For
+            every scheme but basic, the variable may hold several comma-separated keys, which
+            are rotated through a keys.KeyPool
+        name (Optional[str], optional): the header or field name, for the header and field schemes
+    """
+
+    scheme: str
+    env_vars: Tuple[str, ...]
+    name: Optional[str] = None
+
+
+class Vendor(NamedTuple):
+    """A vendor and the settings its endpoints share
+
+    Attributes:
+        name (str): the vendor name, as used in PPP_RATELIMIT_<VENDOR>
+        headers (Dict[str, str]): headers sent with every request to the vendor
+        auth (Optional[Auth], optional): the default authentication for its endpoints
+    """
+
+    name: str
+    headers: Dict[str, str]
+    auth: Optional[Auth] = None
+
+
+# Pagination styles: (the argument the page token is sent as, the page parser factory)
+PAGINATION: Dict[str, Tuple[str, Callable[[Dict[str, Any]], PageParser]]] = {
+    'cursor': ('cursor', lambda kwargs: spycloud_cursor_page),
+    'search_after': ('search_after', lambda kwargs: urlscan_search_after_page),
+    'offset': ('from', lambda kwargs: flashpoint_offset_parser(int(kwargs['size']), int(kwargs['from']))),
+    'next_page_uri': ('Page', lambda kwargs: twilio_next_page_uri_page),
+}
+
+
+class _Prepared(NamedTuple):
+    """The parts of an endpoint's requests that only change when the config is reloaded"""
+
+    url: str
+    request: Dict[str, Any]
+    fields: Dict[str, str]
+
+
+class Endpoint:
+    """One vendor API endpoint, declared once and turned into make_request arguments on
+        each call. Headers, credentials and the URL template are worked out on the first
+        call after each config load, and where each argument goes when the endpoint is
+        declared, so a call only has to slot its values in.
+    """
+
+    def __init__(self,
+                 name: str,
+                 vendor: Vendor,
+                 method: str,
+                 url: str,
+                 args: Tuple[str, ...] = (),
+                 fields: Optional[Dict[str, str]] = None,
+                 defaults: Optional[Dict[str, Any]] = None,
+                 choices: Optional[Dict[str, Dict[str, str]]] = None,
+                 body: Optional[str] = None,
+                 auth: Optional[Auth] = None,
+                 headers: Optional[Dict[str, str]] = None,
+                 idempotent: Optional[bool] = None,
+                 pagination: Optional[str] = None,
+                 page_defaults: Optional[Dict[str, Any]] = None,
+                 prepare: Optional[Callable[..., Tuple[Any, ...]]] = None,
+                 prefilter: Optional[str] = None) -> None:
+        """
+        Args:
+            name (str): the connector name, e.g. spycloud_ato_search
+            vendor (Vendor): the vendor the endpoint belongs to
+            method (str): the HTTP method
+            url (str): the URL template. {placeholders} are filled from the arguments, or
+                from environment variables of the same name.
+            args (Tuple[str, ...], optional): the connector's positional arguments, in order
+            fields (Optional[Dict[str, str]], optional): the query parameter or body field
+                each argument not in the URL is sent as, when it is named differently
+            defaults (Optional[Dict[str, Any]], optional): default values of optional arguments
+            choices (Optional[Dict[str, Dict[str, str]]], optional): for arguments limited to
+                a set of values, the URL segment each value maps to
+            body (Optional[str], optional): `params` or `json`. Defaults to json for POSTs and
+                params otherwise.
+            auth (Optional[Auth], optional): overrides the vendor's authentication
+            headers (Optional[Dict[str, str]], optional): headers added to the vendor's
+            idempotent (Optional[bool], optional): marks a POST as safe to retry and cache
+            pagination (Optional[str], optional): the PAGINATION style of the endpoint
+            page_defaults (Optional[Dict[str, Any]], optional): paging arguments used when
+                iterating, unless the caller passes them
+            prepare (Optional[Callable[..., Tuple[Any, ...]]], optional): takes the argument
+                values in order, validates them, and returns them as they should be sent
+            prefilter (Optional[str], optional): the argument holding the URL or domain that
+                the pre-filter checks before the lookup is sent
+        """
+
+        self.name: str = name
+        self.vendor: Vendor = vendor
+        self.method: str = method.upper()
+        self.url: str = url
+        self.args: Tuple[str, ...] = args
+        self.fields: Dict[str, str] = fields or {}
+        self.defaults: Dict[str, Any] = defaults or {}
+        self.choices: Dict[str, Dict[str, str]] = choices or {}
+        self.body: str = body or ('json' if self.method == 'POST' else 'params')
+        self.auth: Optional[Auth] = auth or vendor.auth
+        self.headers: Dict[str, str] = {**vendor.headers, **(headers or {})}
+        self.idempotent: Optional[bool] = idempotent
+        self.pagination: Optional[str] = pagination
+        self.page_defaults: Dict[str, Any] = page_defaults or {}
+        self.prepare: Optional[Callable[..., Tuple[Any, ...]]] = prepare
+        self.prefilter: Optional[str] = prefilter
+
+        # Placeholders not named after an argument are filled from the environment
+        placeholders: List[str] = [part.split('}')[0] for part in url.split('{')[1:]]
+        self.url_args: Tuple[str, ...] = tuple(name for name in placeholders if name in args)
+        self.env_vars: Tuple[str, ...] = tuple(name for name in placeholders if name not in args)
+        self.required_vars: List[str] = [*self.env_vars, *(self.auth.env_vars if self.auth else ())]
+
+        # Where each argument goes, by position: into the URL, or into the parameters or
+        # body under its field name
+        self._url_positions: Tuple[int, ...] = tuple(args.index(name) for name in self.url_args)
+        self._url_takes_all: bool = self._url_positions == tuple(range(len(args)))
+        self._body_positions: Tuple[Tuple[int, str], ...] = tuple(
+            (position, self.fields.get(name, name)) for position, name in enumerate(args)
+            if name not in self.url_args)
+        self._choice_positions: Tuple[Tuple[int, str, Dict[str, str]], ...] = tuple(
+            (args.index(name), name, values) for name, values in self.choices.items())
+        self._prefilter_position: Optional[int] = args.index(prefilter) if prefilter else None
+
+        self._prepared: Optional[_Prepared] = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'Endpoint({self.name}: {self.method} {self.url})'
+
+    def _prepare(self) -> _Prepared:
+        """Check the endpoint's environment variables and build its static parts"""
+
+        # Check and ensure that required variables are present, exits if not
+        check_required_env_vars(env_config, self.required_vars)
+
+        # Turned into a %-style template, which is much quicker to fill than str.format
+        url: str = self.url.replace('%', '%%')
+        for name in self.url_args:
+            url = url.replace(f'{{{name}}}', '%s', 1)
+        for var in self.env_vars:
+            url = url.replace(f'{{{var}}}', env_config[var].replace('%', '%%'))
+
+        headers: Dict[str, str] = dict(self.headers)
+        auth: Optional[HTTPBasicAuth] = None
+        fields: Dict[str, str] = {}
+        # A variable holding several keys is a pool, and the broker picks a key per attempt
+        key_pool: Optional[KeyPool] = None
+        if self.auth is not None and self.auth.scheme != 'basic':
+            key_pool = get_key_pool(self.auth.env_vars[0], self.auth.scheme, self.auth.name, self.vendor.name)
+        if self.auth is not None and key_pool is None:
+            credentials: List[str] = [env_config[var] for var in self.auth.env_vars]
+            if self.auth.scheme == 'header':
+                headers[self.auth.name] = credentials[0]
+            elif self.auth.scheme == 'bearer':
+                headers['Authorization'] = f'Bearer {credentials[0]}'
+            elif self.auth.scheme == 'field':
+                fields[self.auth.name] = credentials[0]
+            elif self.auth.scheme == 'basic':
+                auth = HTTPBasicAuth(*credentials)
+
+        request: Dict[str, Any] = {'method': self.method, 'endpoint': self.name}
+        if headers:
+            request['headers'] = headers
+        if auth is not None:
+            request['auth'] = auth
+        if self.idempotent is not None:
+            request['idempotent'] = self.idempotent
+        if key_pool is not None:
+            request['key_pool'] = key_pool
+
+        return _Prepared(url, request, fields)
+
+    def bind(self, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
+        """Match a call's arguments to the endpoint's, like the connector's signature would
+
+        Raises:
+            TypeError: this will raise if too many arguments are passed, or one is missing
+
+        Returns:
+            Tuple[Tuple[Any, ...], Dict[str, Any]]: the argument values in order, and the
+                extra keyword arguments to pass on to the vendor
+        """
+
+        if len(args) > len(self.args):
+            raise TypeError(f'{self.name}() takes {len(self.args)} positional arguments but {len(args)} were given')
+
+        values: List[Any] = list(args)
+        kwargs = dict(kwargs)
+        for name in self.args[len(args):]:
+            if name in kwargs:
+                values.append(kwargs.pop(name))
+            elif name in self.defaults:
+                values.append(self.defaults[name])
+            else:
+                raise TypeError(f'{self.name}() missing required argument: {name}')
+
+        return tuple(values), kwargs
+
+    def request(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        """Build the keyword arguments for make_request or async_make_request
+
+        Returns:
+            Dict[str, Any]: the method, URL, headers, auth, parameters or body, the
+                retry and cache settings of the endpoint, its key pool if it has one, and
+                the indicator for the pre-filter if it checks one
+        """
+
+        prepared: Optional[_Prepared] = self._prepared
+        if prepared is None:
+            with self._lock:
+                if self._prepared is None:
+                    self._prepared = self._prepare()
+                prepared = self._prepared
+
+        if kwargs or len(args) != len(self.args):
+            args, kwargs = self.bind(args, kwargs)
+
+        # Taken before prepare, which may encode it
+        request: Dict[str, Any] = prepared.request
+        if self._prefilter_position is not None:
+            request = {**request, 'indicator': args[self._prefilter_position]}
+
+        if self.prepare is not None:
+            args = self.prepare(*args)
+
+        if self._choice_positions:
+            values: List[Any] = list(args)
+            # Completely exit if they supply a value outside of an argument's choices
+            for position, name, choices in self._choice_positions:
+                if values[position] not in choices:
+                    print(f'[!] Error: "{values[position]}" is not a valid {name.replace("_", " ")}. '
+                          f'Must be one of {", ".join(choices)}', file=sys.stderr)
+                    sys.exit(1)
+                values[position] = choices[values[position]]
+            args = tuple(values)
+
+        if self._url_takes_all:
+            url: str = prepared.url % args
+        elif self._url_positions:
+            url = prepared.url % tuple([args[position] for position in self._url_positions])
+        else:
+            url = prepared.url
+
+        payload: Dict[str, Any] = {**prepared.fields}
+        for position, field in self._body_positions:
+            payload[field] = args[position]
+        if kwargs:
+            payload.update(kwargs)
+
+        if payload or self.body == 'params':
+            return {**request, 'url': url, self.body: payload}
+
+        return {**request, 'url': url}
+
+    def reset(self) -> None:
+        """Forget the prepared headers and URL, so they are rebuilt from the config"""
+
+        self._prepared = None
+
+
+def _twilio_lookup_fields(phone_number: str, data_packages: list) -> Tuple[str, str]:
+    # Valid set of data packages for Twilio. Compare the ones that the user passed in
+    # to ensure that they've passed valid ones. Exit immediately if they didn't.
+    if not TWILIO_DATA_PACKAGES.issuperset(data_packages):
+        invalid_packages: set = set(data_packages) - TWILIO_DATA_PACKAGES
+        print(f'[!] Error: "{", ".join(invalid_packages)}" are not valid data packages. Valid '
+              f'packages include {", ".join(TWILIO_DATA_PACKAGES)}', file=sys.stderr)
+        sys.exit(1)
+
+    return phone_number, ','.join(data_packages)
+
+
+def _twilio_usage_dates(start_date: str, end_date: Optional[str]) -> Tuple[str, str]:
+    if end_date is None:
+        end_date = datetime.now().strftime("%Y-%m-%d")
+
+    if not validate_date_string(start_date) or not validate_date_string(end_date):
+        print(f'[!] Error: One of your start date {start_date} or end date {end_date} '
+              'does not match the format YYYY-MM-DD')
+        sys.exit()
+
+    return start_date, end_date
+
+
+def _ipqs_quote_url(query: str) -> Tuple[str]:
+    return quote(query),
+
+
+TWILIO_DATA_PACKAGES: set = {'caller_name', 'sim_swap', 'call_forwarding', 'line_status',
+                             'line_type_intelligence', 'identity_match', 'reassigned_number',
+                             'sms_pumping_risk', 'phone_number_quality_score', 'pre_fill'}
+
+SPYCLOUD_ATO_SEARCH_TYPES: Dict[str, str] = {
+    'domain': 'domains',
+    'email': 'emails',
+    'ip': 'ips',
+    'username': 'usernames',
+    'phone-number': 'phone-numbers',
+}
+
+SPYCLOUD_INV_SEARCH_TYPES: Dict[str, str] = {
+    'domain': 'domains',
+    'email': 'emails',
+    'ip': 'ips',
+    'infected-machine-id': 'infected-machine-ids',
+    'log-id': 'log-ids',
+    'password': 'passwords',
+    'username': 'usernames',
+    'email-username': 'email-usernames',
+    'phone-number': 'phone-numbers',
+    'social-handle': 'social-handles',
+    'bank-number': 'bank-numbers',
+    'cc-number': 'cc-numbers',
+    'drivers-license': 'drivers-licenses',
+    'national-id': 'national-ids',
+    'passport-number': 'passport-numbers',
+    'ssn': 'social-security-numbers',
+}
+
+FLASHPOINT: Vendor = Vendor('FLASHPOINT', {'accept': 'application/json', 'content-type': 'application/json'},
+                            Auth('bearer', ('FLASHPOINT_API_KEY',)))
+IPQS: Vendor = Vendor('IPQS', {'accept': 'application/json'}, Auth('field', ('IPQS_API_KEY',), 'key'))
+SPYCLOUD: Vendor = Vendor('SPYCLOUD', {'accept': 'application/json'})
+TWILIO: Vendor = Vendor('TWILIO', {}, Auth('basic', ('TWILIO_API_SID', 'TWILIO_API_SECRET')))
+URLSCAN: Vendor = Vendor('URLSCAN', {'accept': 'application/json'}, Auth('header', ('URLSCAN_API_KEY',), 'API-Key'))
+
+VENDORS: Dict[str, Vendor] = {vendor.name: vendor for vendor in (FLASHPOINT, IPQS, SPYCLOUD, TWILIO, URLSCAN)}
+
+# Every endpoint the connectors call. The searches sent as POSTs are safe to retry.
+ENDPOINTS: Dict[str, Endpoint] = {endpoint.name: endpoint for endpoint in (
+    Endpoint('flashpoint_search_communities', FLASHPOINT, 'POST',
+             'https://api.flashpoint.io/sources/v2/communities', args=('query',),
+             idempotent=True, pagination='offset', page_defaults={'from': 0, 'size': 100}),
+    Endpoint('flashpoint_search_media', FLASHPOINT, 'POST',
+             'https://api.flashpoint.io/sources/v2/media', args=('query',),
+             idempotent=True, pagination='offset', page_defaults={'from': 0, 'size': 100}),
+    Endpoint('flashpoint_get_media_object', FLASHPOINT, 'GET',
+             'https://api.flashpoint.io/sources/v2/media/{id}', args=('id',)),
+    Endpoint('flashpoint_get_media_image', FLASHPOINT, 'GET',
+             'https://api.flashpoint.io/sources/v1/media/', args=('storage_uri',),
+             fields={'storage_uri': 'asset_id'}),
+    Endpoint('ipqs_malicious_url', IPQS, 'POST', 'https://ipqualityscore.com/api/json/url',
+             args=('query',), fields={'query': 'url'}, idempotent=True, prepare=_ipqs_quote_url,
+             prefilter='query'),
+    Endpoint('spycloud_sip_cookie_domains', SPYCLOUD, 'GET',
+             'https://api.spycloud.io/sip-v1/breach/data/cookie-domains/{cookie_domains}',
+             args=('cookie_domains',), auth=Auth('header', ('SPYCLOUD_API_SIP_KEY',), 'x-api-key'),
+             prefilter='cookie_domains'),
+    Endpoint('spycloud_ato_breach_catalog', SPYCLOUD, 'GET', 'https://api.spycloud.io/sp-v2/breach/catalog',
+             args=('query',), auth=Auth('header', ('SPYCLOUD_API_ATO_KEY',), 'x-api-key')),
+    Endpoint('spycloud_ato_search', SPYCLOUD, 'GET',
+             'https://api.spycloud.io/sp-v2/breach/data/{search_type}/{query}', args=('search_type', 'query'),
+             choices={'search_type': SPYCLOUD_ATO_SEARCH_TYPES},
+             auth=Auth('header', ('SPYCLOUD_API_ATO_KEY',), 'x-api-key'), pagination='cursor'),
+    Endpoint('spycloud_inv_search', SPYCLOUD, 'GET',
+             'https://api.spycloud.io/investigations-v2/breach/data/{search_type}/{query}',
+             args=('search_type', 'query'), choices={'search_type': SPYCLOUD_INV_SEARCH_TYPES},
+             auth=Auth('header', ('SPYCLOUD_API_INV_KEY',), 'x-api-key'), pagination='cursor'),
+    Endpoint('twilio_lookup', TWILIO, 'GET', 'https://lookups.twilio.com/v2/PhoneNumbers/{phone_number}',
+             args=('phone_number', 'data_packages'), defaults={'data_packages': []},
+             fields={'data_packages': 'Fields'}, prepare=_twilio_lookup_fields),
+    Endpoint('twilio_usage_report', TWILIO, 'GET',
+             'https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Usage/Records.json',
+             args=('start_date', 'end_date'), defaults={'end_date': None},
+             fields={'start_date': 'StartDate', 'end_date': 'EndDate'}, prepare=_twilio_usage_dates,
+             pagination='next_page_uri', page_defaults={'PageSize': 1000}),
+    Endpoint('twilio_usage_daily', TWILIO, 'GET',
+             'https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Usage/Records/Daily.json',
+             args=('start_date', 'end_date'), defaults={'end_date': None},
+             fields={'start_date': 'StartDate', 'end_date': 'EndDate'}, prepare=_twilio_usage_dates,
+             pagination='next_page_uri', page_defaults={'PageSize': 1000}),
+    Endpoint('urlscan_search', URLSCAN, 'GET', 'https://urlscan.io/api/v1/search/',
+             args=('query',), fields={'query': 'q'}, pagination='search_after'),
+    Endpoint('urlscan_scan', URLSCAN, 'POST', 'https://urlscan.io/api/v1/scan',
+             args=('query',), fields={'query': 'url'}, prefilter='query'),
+    Endpoint('urlscan_results', URLSCAN, 'GET', 'https://urlscan.io/api/v1/result/{uuid}', args=('uuid',)),
+)}
+
+
+def _reset_endpoints() -> None:
+    """Rebuild every endpoint's headers and URL from the reloaded config"""
+
+    for endpoint in ENDPOINTS.values():
+        endpoint.reset()
+
+
+env_config.on_reload(_reset_endpoints)
+
+
+def get_endpoint(name: str) -> Endpoint:
+    """Look up an endpoint by connector name
+
+    Args:
+        name (str): the connector name, e.g. urlscan_search
+
+    Raises:
+        ValueError: this will raise if there is no such endpoint
+
+    Returns:
+        Endpoint: the endpoint
+    """
+
+    try:
+        return ENDPOINTS[name]
+    except KeyError:
+        raise ValueError(f'Unknown endpoint "{name}". Must be one of {", ".join(ENDPOINTS)}') from None
+
+
+def call(name: str, *args: Any, **kwargs: Any) -> Response:
+    """Call any endpoint by name, e.g. call('urlscan_search', 'domain:example.com')
+
+    Args:
+        name (str): the connector name
+
+    Returns:
+        Response: requests.Response object from the request
+    """
+
+    return make_request(**get_endpoint(name).request(*args, **kwargs))
+
+
+async def async_call(name: str, *args: Any, **kwargs: Any) -> 'httpx.Response':
+    """Asynchronous version of call, taking the same arguments
+
+    Returns:
+        httpx.Response: httpx.Response object from the request
+    """
+
+    return await async_make_request(**get_endpoint(name).request(*args, **kwargs))
+
+
+def iterate(name: str, *args: Any, prefetch: bool = False, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+    """Iterate over every result of a paginated endpoint, following its pagination style
+
+    Args:
+        name (str): the connector name
+        prefetch (bool, optional): download the next page while the current one is being
+            consumed. Defaults to False.
+
+    Raises:
+        ValueError: this will raise if the endpoint is not paginated
+        requests.HTTPError: this will raise if any page comes back with an error status
+
+    Returns:
+        Iterator[Dict[str, Any]]: each result, one at a time
+    """
+
+    endpoint: Endpoint = get_endpoint(name)
+    if endpoint.pagination is None:
+        raise ValueError(f'{name} is not paginated')
+
+    token_arg, parser = PAGINATION[endpoint.pagination]
+    kwargs = {**endpoint.page_defaults, **kwargs}
+    first_token: Any = kwargs.get(token_arg)
+
+    def fetch_page(token: Any) -> Response:
+        # A token such as Twilio's next_page_uri carries every parameter of the next page
+        if isinstance(token, dict):
+            return call(name, *args, **{**kwargs, **token})
+        page_kwargs: Dict[str, Any] = {**kwargs, token_arg: token if token is not None else first_token}
+        if page_kwargs[token_arg] is None:
+            del page_kwargs[token_arg]
+        return call(name, *args, **page_kwargs)
+
+    return paginate(fetch_page, parser(kwargs), prefetch)
+
+
+def async_connector(function: Callable[..., Response]) -> Callable[..., Any]:
+    """Generate the asynchronous variant of a connector from its endpoint. The variant
+        takes the same arguments and returns an httpx.Response.
+
+    Args:
+        function (Callable[..., Response]): the synchronous connector, named after its endpoint
+
+    Returns:
+        Callable[..., Any]: the coroutine function
+    """
+
+    endpoint: Endpoint = get_endpoint(function.__name__)
+
+    @functools.wraps(function)
+    async def connector(*args: Any, **kwargs: Any) -> 'httpx.Response':
+        return await async_make_request(**endpoint.request(*args, **kwargs))
+
+    connector.__name__ = connector.__qualname__ = f'async_{function.__name__}'
+    connector.__signature__ = inspect.signature(function).replace(return_annotation='httpx.Response')
+    connector.__doc__ = f"""Asynchronous version of {function.__name__}, taking the same arguments
+
+    Returns:
+        httpx.Response: httpx.Response object from the request
+    """
+
+    return connector
+
+
+def iter_connector(function: Callable[..., Response]) -> Callable[..., Iterator[Dict[str, Any]]]:
+    """Generate the iter_ variant of a paginated connector, which yields every result
+        across all pages. It takes the connector's arguments plus `prefetch`.
+
+    Args:
+        function (Callable[..., Response]): the synchronous connector, named after its endpoint
+
+    Returns:
+        Callable[..., Iterator[Dict[str, Any]]]: the generator function
+    """
+
+    name: str = function.__name__
+    endpoint: Endpoint = get_endpoint(name)
+    token_arg: str = PAGINATION[endpoint.pagination][0]
+    arity: int = len(endpoint.args)
+
+    @functools.wraps(function)
+    def connector(*args: Any, prefetch: bool = False, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        # prefetch follows the connector's own arguments, and may be passed positionally
+        if len(args) > arity:
+            args, prefetch = args[:arity], args[arity]
+        return iterate(name, *args, prefetch=prefetch, **kwargs)
+
+    connector.__name__ = connector.__qualname__ = f'iter_{name}'
+    signature: inspect.Signature = inspect.signature(function)
+    parameters: List[inspect.Parameter] = list(signature.parameters.values())
+    prefetch: inspect.Parameter = inspect.Parameter('prefetch', inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                                                    default=False, annotation=bool)
+    parameters.insert(len(parameters) - 1 if parameters[-1].kind == inspect.Parameter.VAR_KEYWORD
+                      else len(parameters), prefetch)
+    connector.__signature__ = signature.replace(parameters=parameters,
+                                                return_annotation=Iterator[Dict[str, Any]])
+    connector.__doc__ = f"""Iterate over every result of a {name}, sending `{token_arg}` to fetch each
+        next page. Takes the same arguments as {name}.
+
+    Args:
+        prefetch (bool, optional): download the next page while the current one is being
+            consumed. Defaults to False.
+
+    Raises:
+        requests.HTTPError: this will raise if any page comes back with an error status
+
+    Yields:
+        Dict[str, Any]: each result, one at a time
+    """
+
+    return connector
@@ -0,0 +1,400 @@
+import codecs
+import itertools
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union, TYPE_CHECKING
+from requests import Response
+from . import registry
+from .broker import make_request
+from .helpers import json_loads
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class Record:
+    """A result record with its common fields held in slots, and every other field in
+        `extra`. Fields can be read as attributes or, with their JSON names, by key.
+    """
+
+    # The JSON keys stored in slots. A key's attribute drops any leading underscore.
+    FIELDS: Tuple[str, ...] = ()
+    _ATTRIBUTES: Tuple[Tuple[str, str], ...] = ()
+
+    __slots__ = ('extra',)
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        """
+        Args:
+            data (Dict[str, Any]): the decoded record
+        """
+
+        extra: Dict[str, Any] = dict(data)
+        for key, attribute in self._ATTRIBUTES:
+            setattr(self, attribute, extra.pop(key, None))
+        self.extra: Dict[str, Any] = extra
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._ATTRIBUTES = tuple((key, key.lstrip('_')) for key in cls.FIELDS)
+
+    def __getitem__(self, key: str) -> Any:
+        for field, attribute in self._ATTRIBUTES:
+            if field == key:
+                return getattr(self, attribute)
+        return self.extra[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            value: Any = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the record as the dict it was decoded from, less any missing common fields
+
+        Returns:
+            Dict[str, Any]: the record
+        """
+
+        data: Dict[str, Any] = {key: getattr(self, attribute) for key, attribute in self._ATTRIBUTES
+                                if getattr(self, attribute) is not None}
+        data.update(self.extra)
+        return data
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and other.to_dict() == self.to_dict()
+
+    def __repr__(self) -> str:
+        fields: str = ', '.join(f'{attribute}={getattr(self, attribute)!r}' for _, attribute in self._ATTRIBUTES[:3])
+        return f'{type(self).__name__}({fields}, ...)'
+
+
+class BreachRecord(Record):
+    """A SpyCloud breach record"""
+
+    FIELDS = ('document_id', 'source_id', 'email', 'email_domain', 'email_username', 'username',
+              'password', 'password_plaintext', 'password_type', 'salt', 'domain', 'target_domain',
+              'target_url', 'ip_addresses', 'infected_machine_id', 'full_name', 'phone', 'severity',
+              'spycloud_publish_date', 'sighting')
+
+    __slots__ = tuple(key.lstrip('_') for key in FIELDS)
+
+
+class UrlscanResult(Record):
+    """A urlscan search result. The scan's `task` and `page` are kept as dicts, with their
+        most used fields also available as properties.
+    """
+
+    FIELDS = ('_id', 'task', 'page', 'stats', 'result', 'screenshot', 'sort')
+
+    __slots__ = tuple(key.lstrip('_') for key in FIELDS)
+
+    @property
+    def uuid(self) -> Optional[str]:
+        return self.id or (self.task or {}).get('uuid')
+
+    @property
+    def url(self) -> Optional[str]:
+        return (self.task or {}).get('url')
+
+    @property
+    def time(self) -> Optional[str]:
+        return (self.task or {}).get('time')
+
+    @property
+    def domain(self) -> Optional[str]:
+        return (self.page or {}).get('domain')
+
+    @property
+    def ip(self) -> Optional[str]:
+        return (self.page or {}).get('ip')
+
+    @property
+    def country(self) -> Optional[str]:
+        return (self.page or {}).get('country')
+
+
+# The record type of each connector's results. Results of other connectors are dicts.
+RECORD_TYPES: Dict[str, Type[Record]] = {
+    'spycloud_sip_cookie_domains': BreachRecord,
+    'spycloud_ato_search': BreachRecord,
+    'spycloud_inv_search': BreachRecord,
+    'urlscan_search': UrlscanResult,
+}
+
+# Structural characters outside of strings, the characters that end or escape a string,
+# and what separates array items
+_STRUCTURAL: 're.Pattern[str]' = re.compile(r'[\[\]{}"]')
+_STRING: 're.Pattern[str]' = re.compile(r'["\\]')
+_SEPARATOR: 're.Pattern[str]' = re.compile(r'[\s,]*')
+# Characters that can continue a number, so a number followed by one was cut off by a chunk
+_NUMBER_CHARACTERS: str = '0123456789.eE+-'
+
+_decoder: json.JSONDecoder = json.JSONDecoder()
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str = 'results') -> Iterator[Any]:
+    """Decode the items of the array under a top-level key of a JSON document one at a
+        time, as the document arrives. Only the item being decoded is held in memory,
+        and nothing after the array is read.
+
+        The document is scanned up to the array, and each item is then decoded with the
+        json module's C scanner, which can stop at the end of a value.
+
+    Args:
+        chunks (Iterable[bytes]): the UTF-8 document, in pieces, e.g. response.iter_content()
+        key (str, optional): the top-level key of the array. Defaults to 'results'.
+
+    Raises:
+        ValueError: this will raise if the document ends inside the array, or an item is not valid JSON
+
+    Yields:
+        Any: each item of the array
+    """
+
+    text_decoder: codecs.IncrementalDecoder = codecs.getincrementaldecoder('utf-8')()
+    buffer: str = ''
+    position: int = 0
+    depth: int = 0
+    in_string: bool = False
+    string_start: int = 0
+    last_key: Optional[str] = None
+    in_array: bool = False
+    # After an item is cut off by the end of a chunk, wait for the buffer to double
+    # before trying again, so that a large item is not re-parsed for every chunk
+    needed: int = 0
+    finished: bool = False
+
+    for chunk in itertools.chain(chunks, (None,)):
+        if chunk is None:
+            finished = True
+            text: str = text_decoder.decode(b'', final=True)
+        else:
+            text = text_decoder.decode(chunk)
+            if not text:
+                continue
+
+        # Keep what the current item, or a top-level key being read, still needs
+        keep: int = string_start if in_string and depth == 1 else position
+        buffer = buffer[keep:] + text
+        position -= keep
+        string_start -= keep
+
+        while not in_array:
+            if in_string:
+                match = _STRING.search(buffer, position)
+                if match is None:
+                    position = len(buffer)
+                    break
+                if match.group() == '\\':
+                    if match.end() >= len(buffer):
+                        # The escaped character is in the next chunk
+                        position = match.start()
+                        break
+                    position = match.end() + 1
+                    continue
+                in_string = False
+                position = match.end()
+                if depth == 1:
+                    last_key = buffer[string_start + 1:match.start()]
+                continue
+
+            match = _STRUCTURAL.search(buffer, position)
+            if match is None:
+                position = len(buffer)
+                break
+
+            character: str = match.group()
+            position = match.end()
+            if character == '"':
+                in_string = True
+                string_start = match.start()
+            elif character == '[' and depth == 1 and last_key == key:
+                in_array = True
+            elif character in '[{':
+                depth += 1
+            else:
+                depth -= 1
+
+        if not in_array or (len(buffer) - position < needed and not finished):
+            continue
+
+        while True:
+            position = _SEPARATOR.match(buffer, position).end()
+            if position >= len(buffer):
+                break
+            if buffer[position] == ']':
+                return
+
+            try:
+                item, end = _decoder.raw_decode(buffer, position)
+            except ValueError:
+                if finished:
+                    raise
+                needed = 2 * (len(buffer) - position)
+                break
+
+            # A number running to the end of the buffer, or stopped at a character that can
+            # continue it, e.g. `1.` or `1e`, may carry on in the next chunk
+            if (not finished and not isinstance(item, (dict, list, str))
+                    and (end == len(buffer) or buffer[end] in _NUMBER_CHARACTERS)):
+                break
+
+            needed = 0
+            position = end
+            yield item
+
+    if in_array:
+        raise ValueError(f'The document ended inside the "{key}" array')
+
+
+class Result:
+    """A connector's response with its JSON decoded lazily, on first use, by the fastest
+        decoder installed. Attributes of the response, e.g. status_code, headers or
+        raise_for_status, can be used on the result directly, and the response itself
+        is `result.response`.
+    """
+
+    __slots__ = ('response', 'endpoint', 'record_type', '_data')
+
+    def __init__(self,
+                 response: Union[Response, 'httpx.Response'],
+                 endpoint: Optional[str] = None,
+                 record_type: Optional[Type[Record]] = None) -> None:
+        """
+        Args:
+            response (Union[Response, httpx.Response]): the connector's response
+            endpoint (Optional[str], optional): the connector that made the request, which
+                picks the record type from RECORD_TYPES. Defaults to None.
+            record_type (Optional[Type[Record]], optional): overrides the record type.
+                Defaults to None.
+        """
+
+        self.response: Union[Response, httpx.Response] = response
+        self.endpoint: Optional[str] = endpoint
+        self.record_type: Optional[Type[Record]] = record_type or RECORD_TYPES.get(endpoint)
+        self._data: Any = None
+
+    def __getattr__(self, name: str) -> Any:
+        if name == 'response':
+            raise AttributeError(name)
+        return getattr(self.response, name)
+
+    def __repr__(self) -> str:
+        return f'Result({self.endpoint or "response"}, status_code={self.response.status_code})'
+
+    @property
+    def data(self) -> Any:
+        """The decoded JSON body, decoded the first time it is read"""
+
+        if self._data is None:
+            self._data = json_loads(self.response.content)
+        return self._data
+
+    def json(self) -> Any:
+        """Return the decoded JSON body, like response.json() but faster
+
+        Returns:
+            Any: the decoded body
+        """
+
+        return self.data
+
+    def _record(self, item: Any) -> Any:
+        return self.record_type(item) if self.record_type is not None and isinstance(item, dict) else item
+
+    def records(self, key: str = 'results') -> List[Any]:
+        """Return the records under a key of the body, as record objects where the
+            connector has a record type
+
+        Args:
+            key (str, optional): the key of the records. Defaults to 'results'.
+
+        Returns:
+            List[Any]: the records
+        """
+
+        return [self._record(item) for item in self.data.get(key) or []]
+
+    def iter_records(self, key: str = 'results', chunk_size: int = 64 * 1024) -> Iterator[Any]:
+        """Yield the records under a top-level key of the body one at a time, decoding each
+            as it is reached rather than the whole document at once. A streamed response
+            is read from the network as the records are consumed.
+
+        Args:
+            key (str, optional): the key of the records. Defaults to 'results'.
+            chunk_size (int, optional): bytes read at a time from a streamed response.
+                Defaults to 64 KiB.
+
+        Yields:
+            Any: each record
+        """
+
+        if self._data is not None:
+            yield from self.records(key)
+            return
+
+        chunks: Iterable[bytes]
+        if getattr(self.response, '_content', None) is False:
+            # A streamed requests response whose body has not been read yet
+            chunks = self.response.iter_content(chunk_size)
+        else:
+            content: memoryview = memoryview(self.response.content)
+            chunks = (bytes(content[offset:offset + chunk_size]) for offset in range(0, len(content), chunk_size))
+
+        try:
+            for item in iter_json_array(chunks, key):
+                yield self._record(item)
+        finally:
+            self.response.close()
+
+
+def fetch(name: str, *args: Any, **kwargs: Any) -> Result:
+    """Call a connector by name and wrap its response in a Result, e.g.
+        fetch('spycloud_inv_search', 'email', 'someone@example.com').records()
+
+    Args:
+        name (str): the connector name
+
+    Returns:
+        Result: the response, with lazily decoded JSON and typed records
+    """
+
+    return Result(registry.call(name, *args, **kwargs), name)
+
+
+async def async_fetch(name: str, *args: Any, **kwargs: Any) -> Result:
+    """Asynchronous version of fetch, taking the same arguments
+
+    Returns:
+        Result: the response, with lazily decoded JSON and typed records
+    """
+
+    return Result(await registry.async_call(name, *args, **kwargs), name)
+
+
+def stream_records(name: str, *args: Any, key: str = 'results', chunk_size: int = 64 * 1024,
+                   **kwargs: Any) -> Iterator[Any]:
+    """Call a connector by name with a streamed response, and yield the records under
+        `key` as they arrive, so a large page is never held in memory whole
+
+    Args:
+        name (str): the connector name
+        key (str, optional): the key of the records. Defaults to 'results'.
+        chunk_size (int, optional): bytes read at a time. Defaults to 64 KiB.
+
+    Raises:
+        requests.HTTPError: this will raise if the response has an error status
+
+    Yields:
+        Any: each record
+    """
+
+    response: Response = make_request(**registry.get_endpoint(name).request(*args, **kwargs), stream=True)
+    if not response.ok:
+        response.close()
+        response.raise_for_status()
+
+    yield from Result(response, name).iter_records(key, chunk_size)
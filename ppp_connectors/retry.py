@@ -0,0 +1,134 @@
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Mapping, NamedTuple, Optional, Set
+from .helpers import Config, get_config
+
+
+env_config: Config = get_config()
+
+# Statuses that mean "try again later" rather than "this request is wrong"
+RETRY_STATUSES: Set[int] = {429, 502, 503, 504}
+
+# Methods that can be sent twice without changing the outcome. Other methods, such as
+# the POST behind urlscan_scan, are only retried when the server rejected them outright
+# with a 429, or when the caller marks the request as idempotent.
+IDEMPOTENT_METHODS: Set[str] = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# Response headers that tell us when we may try again, in order of preference
+RESET_HEADERS: tuple = ('Retry-After', 'X-Rate-Limit-Reset-After', 'X-RateLimit-Reset',
+                        'X-Rate-Limit-Reset')
+
+
+class RetryStats(NamedTuple):
+    """How much retrying a single call needed. Attached to responses as `retry_stats`.
+
+    Attributes:
+        retries (int): how many times the request was re-sent
+        backoff (float): the total number of seconds spent waiting between attempts
+    """
+
+    retries: int = 0
+    backoff: float = 0.0
+
+
+def max_retries_for(method: str) -> int:
+    """The retry budget for an HTTP method, from PPP_RETRY_MAX_<METHOD> or PPP_RETRY_MAX
+
+    Args:
+        method (str): the HTTP method
+
+    Returns:
+        int: the maximum number of times a request with this method may be re-sent
+    """
+
+    setting: str = env_config.get(f'PPP_RETRY_MAX_{method.upper()}') or env_config.get('PPP_RETRY_MAX') or '3'
+
+    return int(setting)
+
+
+def parse_reset_header(value: str, now: Optional[float] = None) -> Optional[float]:
+    """Turn a Retry-After or rate limit reset header into a number of seconds to wait.
+        Accepts a number of seconds, an epoch timestamp, an HTTP date, or an ISO 8601 date.
+
+    Args:
+        value (str): the header value
+        now (Optional[float], optional): the current epoch time. Defaults to time.time().
+
+    Returns:
+        Optional[float]: seconds until the reset, or None if the value can't be understood
+    """
+
+    now = time.time() if now is None else now
+    value = value.strip()
+
+    try:
+        number: float = float(value)
+        # Values this large are epoch timestamps rather than a number of seconds
+        return max(0.0, number - now if number > 1_000_000_000 else number)
+    except ValueError:
+        pass
+
+    for parse in (parsedate_to_datetime, lambda v: datetime.fromisoformat(v.replace('Z', '+00:00'))):
+        try:
+            moment: datetime = parse(value)
+        except (TypeError, ValueError):
+            continue
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return max(0.0, moment.timestamp() - now)
+
+    return None
+
+
+def retry_delay(method: str,
+                status_code: int,
+                headers: Mapping[str, str],
+                retries: int,
+                idempotent: Optional[bool] = None,
+                max_retries: Optional[int] = None) -> Optional[float]:
+    """Decide whether a response should be retried, and how long to wait first. The wait
+        is the server's Retry-After or rate limit reset when it sends one, otherwise a
+        jittered exponential backoff.
+
+    Args:
+        method (str): the HTTP method of the request
+        status_code (int): the status code of the response
+        headers (Mapping[str, str]): the response headers
+        retries (int): how many times the request has already been re-sent
+        idempotent (Optional[bool], optional): whether the request is safe to send twice.
+            Defaults to None, which decides from the HTTP method.
+        max_retries (Optional[int], optional): the retry budget for this call. Defaults to
+            None, which uses the budget for the HTTP method.
+
+    Returns:
+        Optional[float]: seconds to wait before retrying, or None if it should not be retried
+    """
+
+    if status_code not in RETRY_STATUSES:
+        return None
+
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+    # A 429 was refused before it was processed, so any method may be re-sent
+    if status_code != 429 and not idempotent:
+        return None
+
+    if max_retries is None:
+        max_retries = max_retries_for(method)
+    if retries >= max_retries:
+        return None
+
+    base: float = float(env_config.get('PPP_RETRY_BACKOFF') or 0.5)
+    cap: float = float(env_config.get('PPP_RETRY_MAX_BACKOFF') or 60)
+
+    for header in RESET_HEADERS:
+        if header in headers:
+            delay: Optional[float] = parse_reset_header(headers[header])
+            if delay is not None:
+                # Waiting longer than the cap would stall the caller, hand the response back instead
+                return delay + random.uniform(0, base) if delay <= cap else None
+
+    return random.uniform(0, min(cap, base * 2 ** retries))
@@ -0,0 +1,391 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .helpers import Config, get_config
+from .ratelimit import TokenBucket
+
+
+env_config: Config = get_config()
+
+# The priority of calls made outside any `with priority(...)` block, unless PPP_PRIORITY says otherwise
+DEFAULT_PRIORITY: str = 'normal'
+
+# Each priority class's share of a vendor's rate limit while several classes are waiting,
+# unless PPP_PRIORITY_WEIGHTS says otherwise. With every class busy, interactive calls get
+# 16 tokens for every 4 normal and 1 bulk, and a class alone gets the whole limit.
+DEFAULT_WEIGHTS: Dict[str, float] = {'interactive': 16.0, 'normal': 4.0, 'bulk': 1.0}
+
+# How long an idle dispatcher thread lingers for more waiters before exiting
+_IDLE_SECONDS: float = 1.0
+
+_priority: ContextVar[Optional[str]] = ContextVar('ppp_priority', default=None)
+
+_weights: Optional[Dict[str, float]] = None
+_queues: 'weakref.WeakKeyDictionary[TokenBucket, FairQueue]' = weakref.WeakKeyDictionary()
+_queues_lock: threading.Lock = threading.Lock()
+
+
+def priority_weights() -> Dict[str, float]:
+    """The priority classes and their weights, from PPP_PRIORITY_WEIGHTS, e.g.
+        `interactive=16,normal=4,bulk=1`, or DEFAULT_WEIGHTS
+
+    Raises:
+        ValueError: this will raise if the setting is not in the expected format
+
+    Returns:
+        Dict[str, float]: the weight of each priority class
+    """
+
+    global _weights
+
+    if _weights is None:
+        setting: str = env_config.get('PPP_PRIORITY_WEIGHTS') or ''
+        weights: Dict[str, float] = {}
+        for part in filter(None, (part.strip() for part in setting.split(','))):
+            name, _, value = part.partition('=')
+            try:
+                weight: float = float(value)
+            except ValueError:
+                weight = 0.0
+            if weight <= 0 or not name.strip():
+                raise ValueError(f'Invalid PPP_PRIORITY_WEIGHTS "{setting}". Expected <class>=<weight>,..., '
+                                 f'e.g. interactive=16,normal=4,bulk=1')
+            weights[name.strip().lower()] = weight
+        _weights = weights or dict(DEFAULT_WEIGHTS)
+
+    return _weights
+
+
+def current_priority() -> str:
+    """The priority class of calls made from here: the innermost `with priority(...)`,
+        then PPP_PRIORITY, then normal
+
+    Returns:
+        str: the priority class
+    """
+
+    return _priority.get() or (env_config.get('PPP_PRIORITY') or DEFAULT_PRIORITY).lower()
+
+
+@contextmanager
+def priority(name: str) -> Iterator[None]:
+    """Make every call inside the block wait for rate limits in a priority class, e.g.
+
+        with priority('bulk'):
+            for result in batch_lookup(spycloud_inv_search, emails, 'email'):
+                ...
+
+    The class follows the calls into batch_lookup's worker threads, prefetched pages
+    and async tasks started inside the block.
+
+    Args:
+        name (str): the priority class, one of priority_weights()
+
+    Raises:
+        ValueError: this will raise if the class is unknown
+    """
+
+    name = name.lower()
+    if name not in priority_weights():
+        raise ValueError(f'Invalid priority "{name}". Must be one of {", ".join(priority_weights())}')
+
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Waiter:
+    """A call waiting for a token, woken by the dispatcher"""
+
+    __slots__ = ('priority', 'queued', 'event', 'loop', 'future', 'granted', 'cancelled')
+
+    def __init__(self, priority: str, queued: float) -> None:
+        self.priority: str = priority
+        self.queued: float = queued
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.granted: bool = False
+        self.cancelled: bool = False
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+            return
+
+        try:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        except RuntimeError:
+            # The waiter's loop has closed, so there is nobody left to wake
+            pass
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class FairQueue:
+    """Weighted fair queueing in front of a vendor's token bucket, so calls are let
+        through by priority class rather than in arrival order. Every waiting call gets a
+        finish tag that grows by 1/weight for each call its class has queued, and tokens
+        go to the smallest tag as the bucket refills (self-clocked fair queueing). A busy
+        bulk class never holds up a class with a higher weight, and when other classes
+        are idle it gets the whole limit. Calls within a class are served in order.
+        Threads and coroutines wait in the same queue, and one dispatcher thread hands
+        out tokens while anyone is waiting.
+    """
+
+    def __init__(self, bucket: TokenBucket, vendor: str) -> None:
+        """
+        Args:
+            bucket (TokenBucket): the rate limit to share
+            vendor (str): the vendor the bucket belongs to, for the stats
+        """
+
+        self.bucket: TokenBucket = bucket
+        self.vendor: str = vendor
+        self._condition: threading.Condition = threading.Condition()
+        self._heap: List[Tuple[float, int, _Waiter]] = []
+        self._sequence: Iterator[int] = itertools.count()
+        # The tag of the call let through last, and of each class's last queued call
+        self._virtual: float = 0.0
+        self._finish: Dict[str, float] = {}
+        self._dispatcher: Optional[threading.Thread] = None
+        self.depth: Dict[str, int] = {}
+        self.granted: Dict[str, int] = {}
+        self.wait_seconds: Dict[str, float] = {}
+        self.max_wait: Dict[str, float] = {}
+
+    def __repr__(self) -> str:
+        return f'FairQueue({self.vendor}, {sum(self.depth.values())} waiting)'
+
+    def _grant(self, waiter_priority: str, waited: float) -> None:
+        """Count a call let through. The condition's lock must be held."""
+
+        self.granted[waiter_priority] = self.granted.get(waiter_priority, 0) + 1
+        self.wait_seconds[waiter_priority] = self.wait_seconds.get(waiter_priority, 0.0) + waited
+        self.max_wait[waiter_priority] = max(self.max_wait.get(waiter_priority, 0.0), waited)
+
+    def _take_now(self, waiter_priority: str) -> bool:
+        """Let a call straight through when nobody is waiting and a token is free"""
+
+        with self._condition:
+            if self._heap or self.bucket.try_acquire() > 0:
+                return False
+            self._grant(waiter_priority, 0.0)
+            return True
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        weight: float = priority_weights().get(waiter.priority) or min(priority_weights().values())
+
+        with self._condition:
+            tag: float = max(self._virtual, self._finish.get(waiter.priority, 0.0)) + 1.0 / weight
+            self._finish[waiter.priority] = tag
+            heapq.heappush(self._heap, (tag, next(self._sequence), waiter))
+            self.depth[waiter.priority] = self.depth.get(waiter.priority, 0) + 1
+
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name=f'ppp-scheduler-{self.vendor}',
+                                                    daemon=True)
+                self._dispatcher.start()
+            else:
+                self._condition.notify()
+
+    def _cancel(self, waiter: _Waiter) -> None:
+        """Take a cancelled coroutine, or an interrupted thread, out of the queue. It is
+            dropped when it reaches the front."""
+
+        with self._condition:
+            if not waiter.granted and not waiter.cancelled:
+                waiter.cancelled = True
+                self.depth[waiter.priority] -= 1
+
+    def _dispatch(self) -> None:
+        """Hand tokens to the waiters in tag order, for as long as there are any"""
+
+        while True:
+            with self._condition:
+                while True:
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+
+                    if not self._heap:
+                        self._condition.wait(_IDLE_SECONDS)
+                        if not self._heap:
+                            self._dispatcher = None
+                            return
+                        continue
+
+                    wait: float = self.bucket.try_acquire()
+                    if wait <= 0:
+                        tag, _, waiter = heapq.heappop(self._heap)
+                        self._virtual = tag
+                        waiter.granted = True
+                        self.depth[waiter.priority] -= 1
+                        self._grant(waiter.priority, time.monotonic() - waiter.queued)
+                        break
+
+                    # A call with a smaller tag may arrive meanwhile, so choose after the wait
+                    self._condition.wait(wait)
+
+            waiter.wake()
+
+    def acquire(self, waiter_priority: str) -> float:
+        """Block the current thread until the scheduler lets it through
+
+        Args:
+            waiter_priority (str): the call's priority class
+
+        Returns:
+            float: the number of seconds spent waiting
+        """
+
+        if self._take_now(waiter_priority):
+            return 0.0
+
+        waiter: _Waiter = _Waiter(waiter_priority, time.monotonic())
+        waiter.event = threading.Event()
+        self._enqueue(waiter)
+        try:
+            waiter.event.wait()
+        except BaseException:
+            # e.g. a KeyboardInterrupt, after which nobody is left to use the token
+            self._cancel(waiter)
+            raise
+
+        return time.monotonic() - waiter.queued
+
+    async def async_acquire(self, waiter_priority: str) -> float:
+        """Suspend the current coroutine until the scheduler lets it through
+
+        Args:
+            waiter_priority (str): the call's priority class
+
+        Returns:
+            float: the number of seconds spent waiting
+        """
+
+        if self._take_now(waiter_priority):
+            return 0.0
+
+        waiter: _Waiter = _Waiter(waiter_priority, time.monotonic())
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        self._enqueue(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._cancel(waiter)
+            raise
+
+        return time.monotonic() - waiter.queued
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Queue depth, calls let through, and time spent waiting, per priority class
+
+        Returns:
+            Dict[str, Dict[str, Any]]: the counters by priority class
+        """
+
+        with self._condition:
+            return {name: {'queued': self.depth.get(name, 0), 'granted': self.granted.get(name, 0),
+                           'wait_seconds': self.wait_seconds.get(name, 0.0),
+                           'max_wait_seconds': self.max_wait.get(name, 0.0)}
+                    for name in sorted({*self.depth, *self.granted})}
+
+
+def scheduling_enabled() -> bool:
+    """False when PPP_SCHEDULER is false, which leaves calls waiting in arrival order"""
+    return (env_config.get('PPP_SCHEDULER') or 'true').lower() != 'false'
+
+
+def get_queue(bucket: TokenBucket, vendor: str) -> FairQueue:
+    """Return the fair queue in front of a token bucket, creating it on first use
+
+    Args:
+        bucket (TokenBucket): the vendor's, or an API key's, rate limit
+        vendor (str): the vendor it belongs to
+
+    Returns:
+        FairQueue: the queue
+    """
+
+    queue: Optional[FairQueue] = _queues.get(bucket)
+    if queue is None:
+        with _queues_lock:
+            queue = _queues.get(bucket)
+            if queue is None:
+                queue = _queues[bucket] = FairQueue(bucket, vendor)
+
+    return queue
+
+
+def acquire(bucket: TokenBucket, vendor: str) -> float:
+    """Wait for a token from a rate limit, in the current priority class
+
+    Args:
+        bucket (TokenBucket): the rate limit
+        vendor (str): the vendor it belongs to
+
+    Returns:
+        float: the number of seconds spent waiting
+    """
+
+    if not scheduling_enabled():
+        return bucket.acquire()
+
+    return get_queue(bucket, vendor).acquire(current_priority())
+
+
+async def async_acquire(bucket: TokenBucket, vendor: str) -> float:
+    """Asynchronous version of acquire
+
+    Returns:
+        float: the number of seconds spent waiting
+    """
+
+    if not scheduling_enabled():
+        return await bucket.async_acquire()
+
+    return await get_queue(bucket, vendor).async_acquire(current_priority())
+
+
+def scheduler_stats() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Queue depth, calls let through, and time spent waiting, by vendor and priority
+        class. The queues of a vendor's API keys are added together.
+
+    Returns:
+        Dict[str, Dict[str, Dict[str, Any]]]: the counters by vendor, then priority class
+    """
+
+    with _queues_lock:
+        queues: List[FairQueue] = list(_queues.values())
+
+    totals: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for queue in queues:
+        for name, counters in queue.stats().items():
+            total: Dict[str, Any] = totals.setdefault(queue.vendor, {}).setdefault(
+                name, {'queued': 0, 'granted': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0})
+            total['queued'] += counters['queued']
+            total['granted'] += counters['granted']
+            total['wait_seconds'] += counters['wait_seconds']
+            total['max_wait_seconds'] = max(total['max_wait_seconds'], counters['max_wait_seconds'])
+
+    return totals
+
+
+def _reset_weights() -> None:
+    global _weights
+    _weights = None
+
+
+env_config.on_reload(_reset_weights)
@@ -1,11 +1,7 @@
-from typing import Dict, Any, List
+from typing import Dict, Any
 from requests import Response
-import sys
 from .broker import make_request
-from .helpers import check_required_env_vars, combine_env_configs
-
-
-env_config: Dict[str, Any] = combine_env_configs()
+from .registry import ENDPOINTS, async_connector, iter_connector
 
 
 def spycloud_sip_cookie_domains(cookie_domains: str, **kwargs: Dict[str, Any]) -> Response:
@@ -21,23 +17,7 @@ def spycloud_sip_cookie_domains(cookie_domains: str, **kwargs: Dict[str, Any]) -
         Response: requests.Response object from the request
     """
 
-    # Define required environment variables
-    required_vars: List[str] = [
-        'SPYCLOUD_API_SIP_KEY'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    method: str = 'get'
-    url: str = f'https://api.spycloud.io/sip-v1/breach/data/cookie-domains/{cookie_domains}'
-    headers: Dict = {
-        'accept': 'application/json',
-        'x-api-key': env_config['SPYCLOUD_API_SIP_KEY']
-    }
-    params: Dict = dict(kwargs)
-
-    result: Response = make_request(method=method, url=url, headers=headers, params=params)
+    result: Response = make_request(**ENDPOINTS['spycloud_sip_cookie_domains'].request(cookie_domains, **kwargs))
 
     return result
 
@@ -52,26 +32,7 @@ def spycloud_ato_breach_catalog(query:str, **kwargs: Dict[str, Any]) -> Response
         Response: requests.Response object from the request
     """
 
-    # Define required environment variables
-    required_vars: List[str] = [
-        'SPYCLOUD_API_ATO_KEY'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    method: str = 'get'
-    url: str = f'https://api.spycloud.io/sp-v2/breach/catalog'
-    headers: Dict = {
-        'accept': 'application/json',
-        'x-api-key': env_config['SPYCLOUD_API_ATO_KEY']
-    }
-    params: Dict = {
-        'query': query,
-        **kwargs
-    }
-
-    result: Response = make_request(method=method, url=url, headers=headers, params=params)
+    result: Response = make_request(**ENDPOINTS['spycloud_ato_breach_catalog'].request(query, **kwargs))
 
     return result
 
@@ -88,40 +49,7 @@ def spycloud_ato_search(search_type: str, query:str, **kwargs: Dict[str, Any]) -
         Response: requests.Response object from the request
     """
 
-    required_vars: List[str] = [
-        'SPYCLOUD_API_ATO_KEY'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    # These are valid endpoints and their corresponding full URLs. We'll use these
-    # to check that the user passed a valid 'search_type' parameter
-    base_url: str = f'https://api.spycloud.io/sp-v2/breach/data'
-    valid_endpoints: Dict[str, str] = {
-        'domain': f'{base_url}/domains',
-        'email': f'{base_url}/emails',
-        'ip': f'{base_url}/ips',
-        'username': f'{base_url}/usernames',
-        'phone-number': f'{base_url}/phone-numbers',
-    }
-
-    # Completely exit if they supply an invalid search_type
-    if search_type not in valid_endpoints:
-        print(f'[!] Error: "{search_type}" is not a valid search type. Must be one of '
-              f'{", ".join(valid_endpoints.keys())}', file=sys.stderr)
-        sys.exit(1)
-
-    method: str = 'get'
-    url: str = f'{valid_endpoints[search_type]}/{query}'
-
-    headers: Dict = {
-        'accept': 'application/json',
-        'x-api-key': env_config['SPYCLOUD_API_ATO_KEY']
-    }
-    params: Dict = dict(kwargs)
-
-    result: Response = make_request(method=method, url=url, headers=headers, params=params)
+    result: Response = make_request(**ENDPOINTS['spycloud_ato_search'].request(search_type, query, **kwargs))
 
     return result
 
@@ -140,51 +68,16 @@ def spycloud_inv_search(search_type: str, query:str, **kwargs: Dict[str, Any]) -
         Response: requests.Response object from the request
     """
 
-    # Define required environment variables
-    required_vars: List[str] = [
-        'SPYCLOUD_API_INV_KEY'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    # These are valid endpoints and their corresponding full URLs. We'll use these
-    # to check that the user passed a valid 'search_type' parameter
-    base_url: str = 'https://api.spycloud.io/investigations-v2/breach/data'
-    valid_endpoints: Dict[str, str] = {
-        'domain': f'{base_url}/domains',
-        'email': f'{base_url}/emails',
-        'ip': f'{base_url}/ips',
-        'infected-machine-id': f'{base_url}/infected-machine-ids',
-        'log-id': f'{base_url}/log-ids',
-        'password': f'{base_url}/passwords',
-        'username': f'{base_url}/usernames',
-        'email-username': f'{base_url}/email-usernames',
-        'phone-number': f'{base_url}/phone-numbers',
-        'social-handle': f'{base_url}/social-handles',
-        'bank-number': f'{base_url}/bank-numbers',
-        'cc-number': f'{base_url}/cc-numbers',
-        'drivers-license': f'{base_url}/drivers-licenses',
-        'national-id': f'{base_url}/national-ids',
-        'passport-number': f'{base_url}/passport-numbers',
-        'ssn': f'{base_url}/social-security-numbers',
-    }
-
-    # Completely exit if they supply an invalid search_type
-    if search_type not in valid_endpoints:
-        print(f'[!] Error: "{search_type}" is not a valid search type. Must be one of '
-              f'{", ".join(valid_endpoints.keys())}', file=sys.stderr)
-        sys.exit(1)
-
-    method: str = 'get'
-    url: str = f'{valid_endpoints[search_type]}/{query}'
-
-    headers: Dict = {
-        'accept': 'application/json',
-        'x-api-key': env_config['SPYCLOUD_API_INV_KEY']
-    }
-    params: Dict = dict(kwargs)
-
-    result: Response = make_request(method=method, url=url, headers=headers, params=params)
-
-    return result
\ No newline at end of file
+    result: Response = make_request(**ENDPOINTS['spycloud_inv_search'].request(search_type, query, **kwargs))
+
+    return result
+
+
+# The asynchronous and iter_ variants are generated from the endpoint table
+async_spycloud_sip_cookie_domains = async_connector(spycloud_sip_cookie_domains)
+async_spycloud_ato_breach_catalog = async_connector(spycloud_ato_breach_catalog)
+async_spycloud_ato_search = async_connector(spycloud_ato_search)
+async_spycloud_inv_search = async_connector(spycloud_inv_search)
+
+iter_spycloud_ato_search = iter_connector(spycloud_ato_search)
+iter_spycloud_inv_search = iter_connector(spycloud_inv_search)
@@ -0,0 +1,178 @@
+import hashlib
+import os
+from typing import Any, BinaryIO, NamedTuple, Optional, Union
+from requests import Response
+
+
+# Anything a download can be written to: a file path, a writable binary file object,
+# or a pre-allocated writable buffer such as a bytearray or memoryview
+Destination = Union[str, os.PathLike, BinaryIO, bytearray, memoryview]
+
+
+class DownloadResult(NamedTuple):
+    """What a streamed download wrote
+
+    Attributes:
+        status_code (int): the HTTP status code of the response
+        bytes_written (int): how many bytes were written by this call
+        size (int): the total size of the downloaded content at the destination
+        digest (Optional[str]): the hex digest of the whole content, if hashing was asked for
+        resumed (bool): True if the download carried on from content already at the destination
+    """
+
+    status_code: int
+    bytes_written: int
+    size: int
+    digest: Optional[str]
+    resumed: bool
+
+
+def _is_buffer(destination: Any) -> bool:
+    """True for writable buffers that content is copied into rather than written to"""
+
+    return isinstance(destination, (bytearray, memoryview))
+
+
+def resume_offset(destination: Destination) -> int:
+    """How many bytes of a download are already at the destination
+
+    Args:
+        destination (Destination): a file path or a file object positioned after existing content
+
+    Raises:
+        ValueError: this will raise for buffers, which can't be resumed
+
+    Returns:
+        int: the byte offset to resume from
+    """
+
+    if _is_buffer(destination):
+        raise ValueError('Downloads into a buffer cannot be resumed')
+
+    if isinstance(destination, (str, os.PathLike)):
+        return os.path.getsize(destination) if os.path.exists(destination) else 0
+
+    return destination.tell()
+
+
+def _hash_existing(destination: Destination, offset: int, hasher: Any) -> None:
+    """Feed the first `offset` bytes already at the destination into a hasher"""
+
+    if isinstance(destination, (str, os.PathLike)):
+        with open(destination, 'rb') as f:
+            _hash_file(f, offset, hasher)
+        return
+
+    if not (destination.readable() and destination.seekable()):
+        raise ValueError('Hashing a resumed download needs a readable, seekable file object')
+
+    position: int = destination.tell()
+    destination.seek(0)
+    _hash_file(destination, offset, hasher)
+    destination.seek(position)
+
+
+def _hash_file(f: BinaryIO, length: int, hasher: Any, chunk_size: int = 1024 * 1024) -> None:
+    """Feed `length` bytes from the current position of a file into a hasher"""
+
+    while length > 0:
+        chunk: bytes = f.read(min(chunk_size, length))
+        if not chunk:
+            break
+        hasher.update(chunk)
+        length -= len(chunk)
+
+
+def completed_download(destination: Destination,
+                       size: int,
+                       hash_algorithm: Optional[str],
+                       status_code: int) -> DownloadResult:
+    """Describe a resumed download that had nothing left to fetch
+
+    Args:
+        destination (Destination): the file path or file object holding the content
+        size (int): the size of the content already at the destination
+        hash_algorithm (Optional[str]): a hashlib algorithm to hash the content with, or None
+        status_code (int): the HTTP status code of the response
+
+    Returns:
+        DownloadResult: a result with nothing written by this call
+    """
+
+    hasher: Any = hashlib.new(hash_algorithm) if hash_algorithm else None
+    if hasher is not None:
+        _hash_existing(destination, size, hasher)
+
+    return DownloadResult(status_code, 0, size, hasher.hexdigest() if hasher is not None else None, True)
+
+
+def stream_to(response: Response,
+              destination: Destination,
+              chunk_size: int = 64 * 1024,
+              hash_algorithm: Optional[str] = 'sha256',
+              offset: int = 0) -> DownloadResult:
+    """Write a streamed response to a destination chunk by chunk, so memory use stays at
+        one chunk however large the content is. When `offset` is set and the server
+        answered a Range request with 206, the content is appended after it. Otherwise
+        the destination is written from the start.
+
+    Args:
+        response (Response): a response from a request made with stream=True
+        destination (Destination): a file path, writable binary file object, or writable buffer
+        chunk_size (int, optional): bytes read per chunk. Defaults to 64 KiB.
+        hash_algorithm (Optional[str], optional): a hashlib algorithm to hash the content
+            with while it streams, or None to skip hashing. Defaults to 'sha256'.
+        offset (int, optional): bytes of the content already at the destination. Defaults to 0.
+
+    Raises:
+        ValueError: this will raise if the content does not fit in a buffer destination
+
+    Returns:
+        DownloadResult: what was written
+    """
+
+    resumed: bool = offset > 0 and response.status_code == 206
+    # When the server ignored the Range request, the partial content has to be replaced
+    discard: int = offset if not resumed else 0
+    if not resumed:
+        offset = 0
+
+    hasher: Any = hashlib.new(hash_algorithm) if hash_algorithm else None
+    if hasher is not None and resumed:
+        _hash_existing(destination, offset, hasher)
+
+    written: int = 0
+    opened: Optional[BinaryIO] = None
+
+    if isinstance(destination, (str, os.PathLike)):
+        opened = open(destination, 'ab' if resumed else 'wb')
+        sink: Any = opened
+    elif _is_buffer(destination):
+        sink = memoryview(destination).cast('B')
+    else:
+        if discard:
+            destination.seek(destination.tell() - discard)
+            destination.truncate()
+        sink = destination
+
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            if isinstance(sink, memoryview):
+                end: int = written + len(chunk)
+                if end > len(sink):
+                    raise ValueError(f'The content does not fit in the {len(sink)} byte buffer')
+                sink[written:end] = chunk
+            else:
+                sink.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            written += len(chunk)
+    finally:
+        response.close()
+        if opened is not None:
+            opened.close()
+
+    return DownloadResult(response.status_code, written, offset + written,
+                          hasher.hexdigest() if hasher is not None else None, resumed)
@@ -0,0 +1,315 @@
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterator, Optional, Tuple, TYPE_CHECKING
+import requests
+from requests.auth import HTTPBasicAuth
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from .helpers import Config, get_config
+
+if TYPE_CHECKING:
+    import httpx
+
+
+env_config: Config = get_config()
+
+# The HTTP clients the synchronous broker can send requests with, set with PPP_HTTP_TRANSPORT.
+# requests speaks HTTP/1.1 and needs a connection per request in flight. http2 uses httpx
+# with h2, which multiplexes every request to a host over one connection, and also turns
+# HTTP/2 on for the asynchronous connectors.
+TRANSPORTS: Tuple[str, ...] = ('requests', 'httpx', 'http2')
+
+_transport: Optional['HttpxTransport'] = None
+_transport_loaded: bool = False
+_transport_lock: threading.Lock = threading.Lock()
+
+
+def import_httpx() -> Any:
+    """Import httpx on first use, so that importing a connector never pays for it
+
+    Raises:
+        ImportError: this will raise if httpx is not installed
+
+    Returns:
+        Any: the httpx module
+    """
+
+    try:
+        import httpx
+    except ImportError:
+        raise ImportError('The asynchronous connectors and the httpx transport require httpx. '
+                          'Install it with `pip install ppp-connectors[async]`') from None
+
+    return httpx
+
+
+def transport_name() -> str:
+    """The transport chosen with PPP_HTTP_TRANSPORT
+
+    Raises:
+        ValueError: this will raise if the setting is not one of TRANSPORTS
+
+    Returns:
+        str: requests, httpx or http2
+    """
+
+    name: str = (env_config.get('PPP_HTTP_TRANSPORT') or 'requests').lower()
+    if name not in TRANSPORTS:
+        raise ValueError(f'Invalid PPP_HTTP_TRANSPORT "{name}". Must be one of {", ".join(TRANSPORTS)}')
+
+    return name
+
+
+def request_timeout() -> Optional[float]:
+    """The timeout every broker gives a request, from PPP_TIMEOUT in seconds. It applies to
+        connecting and to each read, as with requests.
+
+    Returns:
+        Optional[float]: the timeout, or None to wait as long as the vendor takes, the default
+    """
+
+    setting: Optional[str] = env_config.get('PPP_TIMEOUT')
+    return float(setting) if setting else None
+
+
+def build_client(asynchronous: bool, max_connections: int) -> Any:
+    """Create an httpx client with a sized connection pool, connection-level retries, the
+        proxy and SSL settings from the environment, and HTTP/2 when it is turned on. Like
+        the requests sessions, it follows redirects and waits as long as PPP_TIMEOUT allows,
+        rather than httpx's default of 5 seconds.
+
+    Args:
+        asynchronous (bool): build an httpx.AsyncClient rather than an httpx.Client
+        max_connections (int): the size of the connection pool
+
+    Raises:
+        ImportError: this will raise if httpx, or h2 for HTTP/2, is not installed
+
+    Returns:
+        Any: the new client
+    """
+
+    httpx = import_httpx()
+
+    connect_retries: int = int(env_config.get('PPP_CONNECT_RETRIES') or 3)
+    verify: bool = False if 'VERIFY_SSL' in env_config and env_config['VERIFY_SSL'].lower() == 'false' else True
+    http2: bool = transport_name() == 'http2'
+
+    limits: httpx.Limits = httpx.Limits(max_connections=max_connections,
+                                        max_keepalive_connections=max_connections)
+    transport_class: Any = httpx.AsyncHTTPTransport if asynchronous else httpx.HTTPTransport
+    client_class: Any = httpx.AsyncClient if asynchronous else httpx.Client
+
+    mounts: Dict[str, Any] = {}
+    for scheme, var in (('http', 'PPP_HTTP_PROXY'), ('https', 'PPP_HTTPS_PROXY')):
+        mounts[f'{scheme}://'] = transport_class(proxy=env_config.get(var) or None,
+                                                 verify=verify,
+                                                 limits=limits,
+                                                 retries=connect_retries,
+                                                 http2=http2)
+
+    return client_class(mounts=mounts, verify=verify, limits=limits, trust_env=False, http2=http2,
+                        timeout=httpx.Timeout(request_timeout()), follow_redirects=True)
+
+
+class _HttpxRaw:
+    """Stands in for the urllib3 response behind a streamed requests.Response, so that
+        iter_content, content and close read from the httpx response instead
+    """
+
+    def __init__(self, response: 'httpx.Response') -> None:
+        self._response: httpx.Response = response
+        self._chunks: Optional[Iterator[bytes]] = None
+        self._buffer: bytes = b''
+
+    def stream(self, chunk_size: Optional[int] = None, decode_content: bool = True) -> Iterator[bytes]:
+        yield from self._response.iter_bytes(chunk_size)
+
+    def read(self, amt: Optional[int] = None, decode_content: bool = True) -> bytes:
+        if self._chunks is None:
+            self._chunks = self._response.iter_bytes()
+        while amt is None or len(self._buffer) < amt:
+            chunk: Optional[bytes] = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data, self._buffer = (self._buffer, b'') if amt is None else (self._buffer[:amt], self._buffer[amt:])
+        return data
+
+    def close(self) -> None:
+        self._response.close()
+
+    def release_conn(self) -> None:
+        self._response.close()
+
+
+def _requests_error(error: 'httpx.HTTPError') -> requests.RequestException:
+    """The requests exception matching an httpx one, so callers' except clauses still apply"""
+
+    httpx = import_httpx()
+
+    for httpx_type, requests_type in ((httpx.ConnectTimeout, requests.ConnectTimeout),
+                                      (httpx.ReadTimeout, requests.ReadTimeout),
+                                      (httpx.TimeoutException, requests.Timeout),
+                                      (httpx.ProxyError, requests.exceptions.ProxyError),
+                                      (httpx.NetworkError, requests.ConnectionError),
+                                      (httpx.TooManyRedirects, requests.TooManyRedirects)):
+        if isinstance(error, httpx_type):
+            return requests_type(str(error))
+
+    return requests.RequestException(str(error))
+
+
+class HttpxTransport:
+    """Sends the synchronous broker's requests with a shared httpx.Client, over HTTP/2 when
+        it is turned on, and hands back requests.Response objects, so callers see the
+        same responses and exceptions as with requests. The client is thread-safe, and
+        with HTTP/2 concurrent requests to a host share one connection.
+
+        Connect and TLS times are not reported to hooks, and count as time waiting for
+        the response.
+    """
+
+    def __init__(self, http2: bool = False) -> None:
+        """
+        Args:
+            http2 (bool, optional): whether HTTP/2 is turned on. Defaults to False.
+        """
+
+        self.http2: bool = http2
+        # Every host shares the client, so give it the room of a session per host
+        pool_connections: int = int(env_config.get('PPP_POOL_CONNECTIONS') or 4)
+        pool_maxsize: int = int(env_config.get('PPP_POOL_MAXSIZE') or 10)
+        self.client: httpx.Client = build_client(asynchronous=False, max_connections=pool_connections * pool_maxsize)
+
+    def request(self,
+                method: str,
+                url: str,
+                headers: Optional[Dict[str, str]] = None,
+                auth: Optional[HTTPBasicAuth] = None,
+                params: Optional[Dict[str, Any]] = None,
+                data: Optional[Any] = None,
+                json: Optional[Any] = None,
+                stream: bool = False) -> requests.Response:
+        """Send one request
+
+        Args:
+            method (str): the HTTP method
+            url (str): the URL to request
+            headers (Optional[Dict[str, str]], optional): the request headers. Defaults to None.
+            auth (Optional[HTTPBasicAuth], optional): basic auth credentials. Defaults to None.
+            params (Optional[Dict[str, Any]], optional): the query parameters. Defaults to None.
+            data (Optional[Any], optional): the form data. Defaults to None.
+            json (Optional[Any], optional): the json body. Defaults to None.
+            stream (bool, optional): leave the body unread. Defaults to False.
+
+        Raises:
+            requests.RequestException: this will raise if the request could not be completed
+
+        Returns:
+            requests.Response: the response
+        """
+
+        httpx = import_httpx()
+
+        # requests silently drops None-valued query parameters, httpx does not
+        if params is not None:
+            params = {key: value for key, value in params.items() if value is not None}
+
+        started: float = time.perf_counter()
+        try:
+            request: httpx.Request = self.client.build_request(method, url, headers=headers, params=params,
+                                                               data=data, json=json)
+            response: httpx.Response = self.client.send(
+                request, auth=httpx.BasicAuth(auth.username, auth.password) if auth else None, stream=True)
+            elapsed: float = time.perf_counter() - started
+            if not stream:
+                response.read()
+                response.close()
+        except httpx.HTTPError as e:
+            raise _requests_error(e) from e
+
+        return to_requests_response(response, elapsed, stream)
+
+    def close(self) -> None:
+        """Close the client and its connections"""
+
+        self.client.close()
+
+
+def to_requests_response(response: 'httpx.Response', elapsed: float, stream: bool = False) -> requests.Response:
+    """Turn an httpx response into a requests.Response
+
+    Args:
+        response (httpx.Response): the httpx response, read unless it is streamed
+        elapsed (float): seconds from sending the request to receiving the response headers
+        stream (bool, optional): whether the body is still unread. Defaults to False.
+
+    Returns:
+        requests.Response: the response, with the HTTP version used as `http_version`
+    """
+
+    prepared: requests.PreparedRequest = requests.PreparedRequest()
+    prepared.method = response.request.method
+    prepared.url = str(response.request.url)
+    prepared.headers = CaseInsensitiveDict(response.request.headers.items())
+    # A request built by following a redirect still holds its body as an unread stream
+    prepared.body = response.request.read() or None
+
+    result: requests.Response = requests.Response()
+    result.status_code = response.status_code
+    result.headers = CaseInsensitiveDict(response.headers.items())
+    result.url = str(response.url)
+    result.reason = response.reason_phrase
+    result.encoding = get_encoding_from_headers(result.headers)
+    result.elapsed = timedelta(seconds=elapsed)
+    result.request = prepared
+    result.http_version = response.http_version
+
+    if stream:
+        result.raw = _HttpxRaw(response)
+    else:
+        result._content = response.content
+        result._content_consumed = True
+
+    return result
+
+
+def get_transport() -> Optional[HttpxTransport]:
+    """Return the shared httpx transport, building it on first use
+
+    Returns:
+        Optional[HttpxTransport]: the transport, or None when PPP_HTTP_TRANSPORT leaves
+            requests to the pooled requests sessions
+    """
+
+    global _transport, _transport_loaded
+
+    if not _transport_loaded:
+        with _transport_lock:
+            if not _transport_loaded:
+                name: str = transport_name()
+                _transport = HttpxTransport(http2=name == 'http2') if name != 'requests' else None
+                _transport_loaded = True
+
+    return _transport
+
+
+def close_transport() -> None:
+    """Close the shared httpx transport, if there is one. The next request builds a new
+        one from the config.
+    """
+
+    global _transport, _transport_loaded
+
+    with _transport_lock:
+        transport: Optional[HttpxTransport] = _transport
+        _transport = None
+        _transport_loaded = False
+
+    if transport is not None:
+        transport.close()
+
+
+env_config.on_reload(close_transport)
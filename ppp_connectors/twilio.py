@@ -1,14 +1,10 @@
-from datetime import date, datetime
-from typing import Dict, Any, List, Set, Union, Optional
+from datetime import date
+from typing import Dict, Any, Union, Optional
 from requests import Response
-from requests.auth import HTTPBasicAuth
-import sys
 from .broker import make_request
-from .helpers import check_required_env_vars, combine_env_configs, validate_date_string
+from .registry import ENDPOINTS, async_connector, iter_connector
 
 
-env_config: Dict[str, Any] = combine_env_configs()
-
 def twilio_lookup(phone_number: str, data_packages: list=[], **kwargs: Dict[str, Any]) -> Response:
     """query information on a phone number so that you can make a trusted interaction with your user.
         With this endpoint, you can format and validate phone numbers with the free Basic Lookup request
@@ -24,38 +20,7 @@ def twilio_lookup(phone_number: str, data_packages: list=[], **kwargs: Dict[str,
         Response: requests.Response json response from the request
     """
 
-    # Define required environment variables
-    required_vars: List[str] = [
-        'TWILIO_API_SID',
-        'TWILIO_API_SECRET'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    # Valid set of data packages for Twilio. Compare the ones that the user passed in
-    # to ensure that they've passed valid ones. Exit immediately if they didn't.
-    valid_data_packages: Set = {'caller_name', 'sim_swap', 'call_forwarding', 'line_status',
-                                'line_type_intelligence', 'identity_match', 'reassigned_number',
-                                'sms_pumping_risk', 'phone_number_quality_score', 'pre_fill'}
-    data_packages_set: Set = set(data_packages)
-    invalid_packages =  data_packages_set - valid_data_packages
-    if len(invalid_packages) != 0:
-        print(f'[!] Error: "{", ".join(invalid_packages)}" are not valid data packages. Valid '
-              f'packages include {", ".join(valid_data_packages)}', file=sys.stderr)
-        sys.exit(1)
-
-    method: str = 'get'
-    url: str = f'https://lookups.twilio.com/v2/PhoneNumbers/{phone_number}'
-
-    auth = HTTPBasicAuth(env_config['TWILIO_API_SID'], env_config['TWILIO_API_SECRET'])
-
-    params: Dict = {
-        'Fields': ','.join(data_packages),
-        **kwargs
-    }
-
-    result: Response = make_request(method=method, url=url, auth=auth, params=params)
+    result: Response = make_request(**ENDPOINTS['twilio_lookup'].request(phone_number, data_packages, **kwargs))
 
     return result
 
@@ -73,35 +38,34 @@ def twilio_usage_report(start_date: Union[str, date],
         Response: requests.Response json response from the request
     """
 
-    # Define required environment variables
-    required_vars: List[str] = [
-        'TWILIO_ACCOUNT_SID',
-        'TWILIO_API_SID',
-        'TWILIO_API_SECRET'
-    ]
+    result: Response = make_request(**ENDPOINTS['twilio_usage_report'].request(start_date, end_date))
 
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    if end_date is None:
-        end_date: str = datetime.now().strftime("%Y-%m-%d")
+    return result
 
-    if not validate_date_string(start_date) or not validate_date_string(end_date):
-        print(f'[!] Error: One of your start date {start_date} or end date {end_date} '
-              'does not match the format YYYY-MM-DD')
-        sys.exit()
+def twilio_usage_daily(start_date: Union[str, date],
+                       end_date: Optional[Union[str, date]]=None) -> Response:
+    """Return usage for each day and category between the start_date and end_date. Each
+        record covers one category on one day.
 
+    Args:
+        start_date (Union[str, date]): Only include usage that has occurred on or after this
+            date. Specify the date in GMT and format as YYYY-MM-DD
+        end_date (Optional[Union[str, date]], optional): Only include usage that occurred on
+            or before this date. Specify the date in GMT and format as YYYY-MM-DD. Defaults to None.
 
-    method: str = 'get'
-    url: str = f'https://api.twilio.com/2010-04-01/Accounts/{env_config["TWILIO_ACCOUNT_SID"]}/Usage/Records.json'
+    Returns:
+        Response: requests.Response json response from the request
+    """
 
-    auth = HTTPBasicAuth(env_config['TWILIO_API_SID'], env_config['TWILIO_API_SECRET'])
+    result: Response = make_request(**ENDPOINTS['twilio_usage_daily'].request(start_date, end_date))
 
-    params: Dict = {
-        'StartDate': start_date,
-        'EndDate': end_date
-    }
+    return result
 
-    result: Response = make_request(method=method, url=url, auth=auth, params=params)
+# The asynchronous variants are generated from the endpoint table
+async_twilio_lookup = async_connector(twilio_lookup)
+async_twilio_usage_report = async_connector(twilio_usage_report)
+async_twilio_usage_daily = async_connector(twilio_usage_daily)
 
-    return result
\ No newline at end of file
+# Usage pages link to the next one with next_page_uri, which the iter_ variants follow
+iter_twilio_usage_report = iter_connector(twilio_usage_report)
+iter_twilio_usage_daily = iter_connector(twilio_usage_daily)
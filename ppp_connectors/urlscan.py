@@ -1,9 +1,8 @@
-from typing import Dict, Any, List
+from typing import Dict, Any
 from requests import Response
 from .broker import make_request
-from .helpers import check_required_env_vars, combine_env_configs
+from .registry import ENDPOINTS, async_connector, iter_connector
 
-env_config: Dict[str, Any] = combine_env_configs()
 
 def urlscan_search(query: str, **kwargs: Dict[str, Any]) -> Response:
     """Find archived scans of URLs on urlscan.io. Search query syntax can
@@ -16,26 +15,7 @@ def urlscan_search(query: str, **kwargs: Dict[str, Any]) -> Response:
         Response: requests.Response json response from the request
     """
 
-    # Define required environment variables
-    required_vars: List[str] = [
-        'URLSCAN_API_KEY'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    method: str = 'get'
-    url: str = f'https://urlscan.io/api/v1/search/'
-    headers: Dict = {
-        'accept': 'application/json',
-        'API-Key': env_config['URLSCAN_API_KEY']
-    }
-    params: Dict = {
-        'q': query,
-        **kwargs
-    }
-
-    result: Response = make_request(method=method, url=url, headers=headers, params=params)
+    result: Response = make_request(**ENDPOINTS['urlscan_search'].request(query, **kwargs))
 
     return result
 
@@ -49,25 +29,7 @@ def urlscan_scan(query: str, **kwargs: Dict[str, Any]) -> Response:
         Response: requests.Response json response from the request
     """
 
-    required_vars: List[str] = [
-        'URLSCAN_API_KEY'
-    ]
-
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    method: str = 'post'
-    url: str = 'https://urlscan.io/api/v1/scan'
-    headers: Dict = {
-        'accept': 'application/json',
-        'API-Key': env_config['URLSCAN_API_KEY']
-    }
-    payload: Dict = {
-        'url': query,
-        **kwargs
-    }
-
-    result: Response = make_request(method=method, url=url, headers=headers, json=payload)
+    result: Response = make_request(**ENDPOINTS['urlscan_scan'].request(query, **kwargs))
 
     return result
 
@@ -81,22 +43,13 @@ def urlscan_results(uuid: str, **kwargs: Dict[str, Any]) -> Response:
         Response: requests.Response json response from the request
     """
 
-    # Define required environment variables
-    required_vars: List[str] = [
-        'URLSCAN_API_KEY'
-    ]
+    result: Response = make_request(**ENDPOINTS['urlscan_results'].request(uuid, **kwargs))
 
-    # Check and ensure that required variables are present, exits if not
-    check_required_env_vars(env_config, required_vars)
-
-    method: str = 'get'
-    url: str = f'https://urlscan.io/api/v1/result/{uuid}'
-    headers: Dict = {
-        'accept': 'application/json',
-        'API-Key': env_config['URLSCAN_API_KEY']
-    }
-    params: Dict = dict(kwargs)
+    return result
 
-    result: Response = make_request(method=method, url=url, headers=headers, params=params)
+# The asynchronous and iter_ variants are generated from the endpoint table
+async_urlscan_search = async_connector(urlscan_search)
+async_urlscan_scan = async_connector(urlscan_scan)
+async_urlscan_results = async_connector(urlscan_results)
 
-    return result
\ No newline at end of file
+iter_urlscan_search = iter_connector(urlscan_search)
@@ -0,0 +1,262 @@
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+from .helpers import Config, get_config
+from .registry import iterate
+
+
+env_config: Config = get_config()
+
+# The periods rollups can be grouped by, as the SQL that extracts them from a YYYY-MM-DD date
+ROLLUP_PERIODS: Dict[str, str] = {
+    'day': 'date',
+    'month': 'substr(date, 1, 7)',
+    'year': 'substr(date, 1, 4)',
+}
+
+_SCHEMA: Tuple[str, ...] = (
+    'CREATE TABLE IF NOT EXISTS usage_records (date TEXT, category TEXT, description TEXT, '
+    'count REAL, count_unit TEXT, usage REAL, usage_unit TEXT, price REAL, price_unit TEXT, '
+    'PRIMARY KEY (date, category))',
+    'CREATE TABLE IF NOT EXISTS synced_days (date TEXT PRIMARY KEY, synced_at REAL)',
+)
+
+
+class SyncReport(NamedTuple):
+    """What one sync did
+
+    Attributes:
+        days_fetched (int): days downloaded, new ones and those re-checked
+        days_skipped (int): days already synced, answered from the store
+        records (int): usage records stored
+        seconds (float): how long the sync took
+    """
+
+    days_fetched: int
+    days_skipped: int
+    records: int
+    seconds: float
+
+
+def _to_date(value: Union[str, date]) -> date:
+    """Parse a YYYY-MM-DD string, or pass a date through"""
+
+    if isinstance(value, date):
+        return value
+
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'Date {value} does not match the format YYYY-MM-DD') from None
+
+
+def _today() -> date:
+    """Today's date in GMT, which Twilio reports usage by"""
+    return datetime.now(timezone.utc).date()
+
+
+def _number(value: Any) -> Optional[float]:
+    """Twilio sends counts, usage and prices as strings"""
+
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def day_ranges(days: Sequence[date]) -> Iterator[Tuple[date, date]]:
+    """Group days into runs of consecutive days, so each run is fetched with one request
+
+    Args:
+        days (Sequence[date]): the days, in order
+
+    Yields:
+        Tuple[date, date]: the first and last day of each run
+    """
+
+    start: Optional[date] = None
+    previous: Optional[date] = None
+    for day in days:
+        if start is None:
+            start = day
+        elif day != previous + timedelta(days=1):
+            yield start, previous
+            start = day
+        previous = day
+
+    if start is not None:
+        yield start, previous
+
+
+class UsageStore:
+    """A local copy of an account's daily Twilio usage in a SQLite database, one row per
+        day and category. A sync only downloads the days not held yet, plus a re-check
+        window of recent days that Twilio may still revise, so refreshing a dashboard
+        costs a request or two however long the history is. Rollups are answered from
+        the database without calling the API.
+    """
+
+    def __init__(self, path: str, recheck_days: Optional[int] = None) -> None:
+        """
+        Args:
+            path (str): the database file, created if it does not exist
+            recheck_days (Optional[int], optional): how many days back from today are
+                downloaded again on every sync. Defaults to None, which uses
+                PPP_TWILIO_USAGE_RECHECK_DAYS or 3.
+        """
+
+        self.path: str = path
+        if recheck_days is None:
+            recheck_days = int(env_config.get('PPP_TWILIO_USAGE_RECHECK_DAYS') or 3)
+        self.recheck_days: int = recheck_days
+        self._lock: threading.Lock = threading.Lock()
+        self._conn: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def close(self) -> None:
+        """Close the database"""
+
+        self._conn.close()
+
+    def synced_days(self) -> List[str]:
+        """The days held in the store
+
+        Returns:
+            List[str]: each synced day as YYYY-MM-DD, in order
+        """
+
+        with self._lock:
+            return [row[0] for row in self._conn.execute('SELECT date FROM synced_days ORDER BY date')]
+
+    def sync(self, start_date: Union[str, date], end_date: Optional[Union[str, date]] = None,
+             prefetch: bool = False) -> SyncReport:
+        """Bring the store up to date for a date range, downloading only the days it is
+            missing and the days in the re-check window. Each run of consecutive days is
+            fetched with twilio_usage_daily, following every page, and a run is only
+            marked synced once all of it is stored. Days after today have no usage yet, so
+            the range stops at today, and today is never marked synced as it isn't over.
+
+        Args:
+            start_date (Union[str, date]): the first day, as YYYY-MM-DD or a date
+            end_date (Optional[Union[str, date]], optional): the last day. Defaults to None, for today.
+            prefetch (bool, optional): download the next page while the current one is
+                being stored. Defaults to False.
+
+        Raises:
+            ValueError: this will raise if a date is not valid, or the range is backwards
+            requests.HTTPError: this will raise if a page comes back with an error status
+
+        Returns:
+            SyncReport: how many days were fetched and skipped, and how many records were stored
+        """
+
+        started: float = time.perf_counter()
+        first: date = _to_date(start_date)
+        today: date = _today()
+        last: date = _to_date(end_date) if end_date is not None else today
+        if last < first:
+            raise ValueError(f'The end date {last} is before the start date {first}')
+        last = min(last, today)
+
+        synced: Set[str] = set(self.synced_days())
+        recheck_from: date = today - timedelta(days=self.recheck_days)
+        days: List[date] = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+        needed: List[date] = [day for day in days if day.isoformat() not in synced or day >= recheck_from]
+
+        records: int = 0
+        for run_start, run_end in day_ranges(needed):
+            records += self._sync_range(run_start, run_end, prefetch, today)
+
+        return SyncReport(len(needed), len(days) - len(needed), records, time.perf_counter() - started)
+
+    def _sync_range(self, start: date, end: date, prefetch: bool, today: date) -> int:
+        """Download a run of days and replace what the store holds for them. Only days
+            before today are marked synced.
+        """
+
+        rows: List[Tuple[Any, ...]] = []
+        for record in iterate('twilio_usage_daily', start.isoformat(), end.isoformat(), prefetch=prefetch):
+            rows.append((record.get('start_date'), record.get('category'), record.get('description'),
+                         _number(record.get('count')), record.get('count_unit'), _number(record.get('usage')),
+                         record.get('usage_unit'), _number(record.get('price')), record.get('price_unit')))
+
+        synced_at: float = time.time()
+        # Today isn't over yet, so it stays due for another download
+        complete: date = min(end, today - timedelta(days=1))
+        days: List[Tuple[str, float]] = [((start + timedelta(days=offset)).isoformat(), synced_at)
+                                         for offset in range((complete - start).days + 1)]
+
+        # Replace the run in one transaction, so a failed sync leaves the previous copy intact
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM usage_records WHERE date BETWEEN ? AND ?',
+                               (start.isoformat(), end.isoformat()))
+            self._conn.executemany('INSERT OR REPLACE INTO usage_records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._conn.executemany('INSERT OR REPLACE INTO synced_days VALUES (?, ?)', days)
+
+        return len(rows)
+
+    def rollup(self,
+               by: Union[str, Sequence[str]] = 'category',
+               start_date: Optional[Union[str, date]] = None,
+               end_date: Optional[Union[str, date]] = None,
+               categories: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Total the stored usage, e.g. per category, per month, or per month and category.
+            Nothing is downloaded, so sync the range first. Twilio's categories overlap,
+            e.g. `sms` includes `sms-outbound` and `totalprice` covers everything, so pass
+            `categories` when summing across them.
+
+        Args:
+            by (Union[str, Sequence[str]], optional): what to group by: `category`, and any
+                of the ROLLUP_PERIODS. Defaults to category.
+            start_date (Optional[Union[str, date]], optional): the first day to include. Defaults to None.
+            end_date (Optional[Union[str, date]], optional): the last day to include. Defaults to None.
+            categories (Optional[Sequence[str]], optional): only include these categories. Defaults to None.
+
+        Raises:
+            ValueError: this will raise if a grouping or date is not valid
+
+        Returns:
+            List[Dict[str, Any]]: a row per group, with the group's values and its total
+                count, usage and price, ordered by group
+        """
+
+        groups: List[str] = [by] if isinstance(by, str) else list(by)
+        columns: List[str] = []
+        for group in groups:
+            if group == 'category':
+                columns.append('category')
+            elif group in ROLLUP_PERIODS:
+                columns.append(ROLLUP_PERIODS[group])
+            else:
+                raise ValueError(f'Invalid rollup "{group}". Must be category or one of {", ".join(ROLLUP_PERIODS)}')
+
+        conditions: List[str] = []
+        values: List[Any] = []
+        if start_date is not None:
+            conditions.append('date >= ?')
+            values.append(_to_date(start_date).isoformat())
+        if end_date is not None:
+            conditions.append('date <= ?')
+            values.append(_to_date(end_date).isoformat())
+        if categories:
+            conditions.append(f'category IN ({", ".join("?" * len(categories))})')
+            values.extend(categories)
+
+        selected: str = ', '.join(f'{column} AS "{group}"' for column, group in zip(columns, groups))
+        query: str = (f'SELECT {selected + ", " if selected else ""}SUM(count), SUM(usage), SUM(price), '
+                      f'MAX(price_unit) FROM usage_records')
+        if conditions:
+            query += f' WHERE {" AND ".join(conditions)}'
+        if columns:
+            query += f' GROUP BY {", ".join(columns)} ORDER BY {", ".join(columns)}'
+
+        with self._lock:
+            rows: List[Tuple[Any, ...]] = self._conn.execute(query, values).fetchall()
+
+        return [{**dict(zip(groups, row)), 'count': row[-4] or 0.0, 'usage': row[-3] or 0.0,
+                 'price': row[-2] or 0.0, 'price_unit': row[-1]}
+                for row in rows]
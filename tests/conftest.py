@@ -0,0 +1,61 @@
+"""Shared fixtures: a clean environment for every test, and the mock vendor server"""
+import os
+import threading
+from typing import Any, Callable, Iterator, List
+import pytest
+from benchmarks.mock_server import MockSettings, MockVendorServer
+from benchmarks.throughput import CREDENTIALS
+from ppp_connectors.helpers import reload_config
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    """Start every test with no PPP_ settings and placeholder credentials, and reload the
+        config afterwards so nothing a test set leaks into the next one
+    """
+
+    for name in list(os.environ):
+        if name.startswith('PPP_'):
+            monkeypatch.delenv(name)
+    for name, value in CREDENTIALS.items():
+        monkeypatch.setenv(name, value)
+    reload_config()
+
+    yield
+
+    monkeypatch.undo()
+    reload_config()
+
+
+@pytest.fixture
+def set_env(monkeypatch: pytest.MonkeyPatch) -> Callable[..., None]:
+    """Set environment variables and reload the config"""
+
+    def set_env(**values: str) -> None:
+        for name, value in values.items():
+            monkeypatch.setenv(name, value)
+        reload_config()
+
+    return set_env
+
+
+@pytest.fixture
+def mock_server(set_env: Callable[..., None]) -> Iterator[Callable[..., MockVendorServer]]:
+    """Start the mock vendor server with the given MockSettings, in a background thread,
+        and point the connectors at it
+    """
+
+    servers: List[MockVendorServer] = []
+
+    def start(**settings: Any) -> MockVendorServer:
+        server: MockVendorServer = MockVendorServer(('127.0.0.1', 0), MockSettings(**settings))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        set_env(PPP_API_BASE_URL=server.base_url)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,45 @@
+import asyncio
+import sys
+from typing import Any, Dict, List
+import pytest
+from ppp_connectors.batch import BatchResult, async_batch_lookup, batch_lookup
+
+
+def _lookup(kind: str, query: int) -> Dict[str, Any]:
+    if query == 3:
+        sys.exit(1)
+    if query == 5:
+        raise ValueError('bad query')
+    return {'kind': kind, 'query': query}
+
+
+async def _async_lookup(kind: str, query: int) -> Dict[str, Any]:
+    await asyncio.sleep(0)
+    return _lookup(kind, query)
+
+
+def _check(results: List[BatchResult]) -> None:
+    by_query: Dict[int, BatchResult] = {result.query: result for result in results}
+    assert sorted(by_query) == list(range(1, 9))
+    assert isinstance(by_query[3].error, SystemExit) and not by_query[3].ok
+    assert isinstance(by_query[5].error, ValueError)
+    assert all(by_query[query].result == {'kind': 'email', 'query': query} for query in (1, 2, 4, 6, 7, 8))
+
+
+def test_exits_and_errors_become_failed_results() -> None:
+    _check(list(batch_lookup(_lookup, range(1, 9), 'email', concurrency=3)))
+
+
+def test_async_exits_and_errors_become_failed_results() -> None:
+    async def run() -> List[BatchResult]:
+        return [result async for result in async_batch_lookup(_async_lookup, range(1, 9), 'email', concurrency=3)]
+
+    _check(asyncio.run(run()))
+
+
+def test_keyboard_interrupt_still_propagates() -> None:
+    def interrupted(query: int) -> None:
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        list(batch_lookup(interrupted, [1]))
@@ -0,0 +1,27 @@
+import asyncio
+from typing import Any, Callable
+import pytest
+from ppp_connectors.retry import RetryStats
+from ppp_connectors.spycloud import async_spycloud_ato_search, spycloud_ato_search
+
+
+@pytest.mark.parametrize('mode', ['sync', 'async'])
+def test_cache_hits_carry_retry_stats(mode: str, mock_server: Callable[..., Any],
+                                      set_env: Callable[..., None]) -> None:
+    server = mock_server()
+    set_env(PPP_CACHE='memory')
+
+    def search() -> Any:
+        if mode == 'sync':
+            return spycloud_ato_search('email', 'user@example.com')
+
+        async def lookup() -> Any:
+            return await async_spycloud_ato_search('email', 'user@example.com')
+
+        return asyncio.run(lookup())
+
+    first, second = search(), search()
+
+    assert server.stats['requests'] == 1
+    assert second.from_cache and second.json() == first.json()
+    assert second.retry_stats == RetryStats(0, 0.0)
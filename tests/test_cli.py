@@ -0,0 +1,94 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List
+import pytest
+from ppp_connectors.cli import Checkpoint, main
+
+COMMAND: List[str] = [sys.executable, '-c', 'import sys; from ppp_connectors.cli import main; sys.exit(main())']
+
+
+def _write_input(path: Any, count: int) -> None:
+    path.write_text(''.join(f'user{number}@example.com\n' for number in range(1, count + 1)))
+
+
+def _read_output(path: Any) -> List[Dict[str, Any]]:
+    return [json.loads(line) for line in path.read_bytes().splitlines()]
+
+
+def _run(arguments: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([*COMMAND, *arguments], capture_output=True, env=os.environ.copy(), timeout=120)
+
+
+@pytest.mark.parametrize('interrupt_after', [0.0, 0.2, 0.5])
+def test_interrupted_job_resumes_without_duplicates(tmp_path: Any, mock_server: Callable[..., Any],
+                                                    interrupt_after: float) -> None:
+    mock_server(latency_ms=1)
+    source, output, checkpoint = tmp_path / 'emails.txt', tmp_path / 'out.ndjson', tmp_path / 'job.ckpt'
+    _write_input(source, 600)
+    arguments: List[str] = ['spycloud_ato_search', 'email', '-i', str(source), '-o', str(output), '-c', '8',
+                            '--rate-limit', '400/s', '--checkpoint', str(checkpoint), '--checkpoint-every', '7']
+
+    job: subprocess.Popen = subprocess.Popen([*COMMAND, *arguments], stderr=subprocess.PIPE, env=os.environ.copy())
+    # Interrupt the job once it is writing results, rather than while Python is starting
+    deadline: float = time.monotonic() + 30
+    while not (output.exists() and output.stat().st_size) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(interrupt_after)
+    job.send_signal(signal.SIGINT)
+    job.wait(timeout=60)
+
+    # The job may have finished before the signal arrived
+    assert job.returncode in (0, 130), job.stderr.read()
+    if job.returncode == 130:
+        assert checkpoint.exists()
+        resumed: subprocess.CompletedProcess = _run(arguments)
+        assert resumed.returncode == 0, resumed.stderr
+
+    assert not checkpoint.exists()
+    lines: List[int] = [record['line'] for record in _read_output(output)]
+    assert sorted(lines) == list(range(1, 601))
+    assert all(record['status'] == 200 for record in _read_output(output))
+
+
+def test_resume_starts_over_when_the_output_is_gone(tmp_path: Any, mock_server: Callable[..., Any]) -> None:
+    mock_server()
+    source, output, checkpoint_path = tmp_path / 'emails.txt', tmp_path / 'out.ndjson', tmp_path / 'job.ckpt'
+    _write_input(source, 20)
+    arguments: List[str] = ['spycloud_ato_search', 'email', '-i', str(source), '-o', str(output),
+                            '--checkpoint', str(checkpoint_path)]
+
+    # A checkpoint claiming the first ten results, with no output file to hold them
+    job: Dict[str, Any] = {'connector': 'spycloud_ato_search', 'args': ['email'], 'params': {},
+                           'input': str(source), 'field': None}
+    checkpoint: Checkpoint = Checkpoint(str(checkpoint_path), job)
+    for number in range(1, 11):
+        checkpoint.mark(number)
+    checkpoint.save(1000)
+
+    assert main(arguments) == 0
+    assert sorted(record['line'] for record in _read_output(output)) == list(range(1, 21))
+
+
+def test_checkpoint_tracks_out_of_order_results(tmp_path: Any) -> None:
+    checkpoint: Checkpoint = Checkpoint(str(tmp_path / 'job.ckpt'), {'connector': 'x'})
+    for number in (1, 2, 4, 5):
+        checkpoint.mark(number)
+
+    assert checkpoint.watermark == 2
+    assert checkpoint.done == {4, 5}
+    assert not checkpoint.finished(3)
+
+    checkpoint.mark(3)
+    assert checkpoint.watermark == 5
+    assert checkpoint.done == set()
+
+    checkpoint.save(123)
+    resumed: Checkpoint = Checkpoint(str(tmp_path / 'job.ckpt'), {'connector': 'x'})
+    assert resumed.resumed and resumed.watermark == 5 and resumed.output_offset == 123
+
+    with pytest.raises(ValueError):
+        Checkpoint(str(tmp_path / 'job.ckpt'), {'connector': 'y'})
@@ -0,0 +1,54 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List
+import requests
+from ppp_connectors.async_broker import async_make_request
+from ppp_connectors.broker import close_sessions, make_request
+from ppp_connectors.coalesce import coalescing_enabled
+
+CATALOG: str = 'https://api.spycloud.io/sp-v2/breach/catalog'
+
+
+def test_coalescing_is_opt_in(set_env: Callable[..., None]) -> None:
+    assert not coalescing_enabled()
+    set_env(PPP_COALESCE='true')
+    assert coalescing_enabled()
+
+
+def test_followers_get_their_own_response(mock_server: Callable[..., Any], set_env: Callable[..., None]) -> None:
+    server = mock_server(latency_ms=200)
+    set_env(PPP_COALESCE='true')
+
+    with ThreadPoolExecutor(4) as pool:
+        responses: List[requests.Response] = list(pool.map(lambda _: make_request('get', CATALOG), range(4)))
+    close_sessions()
+
+    assert server.stats['requests'] == 1
+    assert len({id(response) for response in responses}) == 4
+    assert len({id(response.headers) for response in responses}) == 4
+    assert all(response.json() == responses[0].json() for response in responses)
+
+
+def test_coalesced_coroutines_get_their_own_response(mock_server: Callable[..., Any],
+                                                     set_env: Callable[..., None]) -> None:
+    server = mock_server(latency_ms=200)
+    set_env(PPP_COALESCE='true')
+
+    async def lookups() -> List[Any]:
+        return await asyncio.gather(*(async_make_request('get', CATALOG) for _ in range(4)))
+
+    responses: List[Any] = asyncio.run(lookups())
+
+    assert server.stats['requests'] == 1
+    assert len({id(response) for response in responses}) == 4
+    assert all(response.json() == responses[0].json() for response in responses)
+
+
+def test_without_coalescing_every_call_is_sent(mock_server: Callable[..., Any]) -> None:
+    server = mock_server(latency_ms=50)
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: make_request('get', CATALOG), range(4)))
+    close_sessions()
+
+    assert server.stats['requests'] == 4
@@ -0,0 +1,94 @@
+import asyncio
+from typing import Any, Callable, List
+import pytest
+from ppp_connectors.keys import KeyPool, key_pools, mask_key, quota_exhausted, split_keys
+from ppp_connectors.spycloud import async_spycloud_ato_search, spycloud_ato_search
+
+KEYS: List[str] = ['key-one', 'key-two', 'key-three']
+
+
+def _search(mode: str, count: int) -> List[int]:
+    if mode == 'sync':
+        return [spycloud_ato_search('email', f'user{number}@example.com').status_code for number in range(count)]
+
+    async def searches() -> List[int]:
+        return [(await async_spycloud_ato_search('email', f'user{number}@example.com')).status_code
+                for number in range(count)]
+
+    return asyncio.run(searches())
+
+
+def test_split_and_mask() -> None:
+    assert split_keys(' a, b,,a ,c ') == ['a', 'b', 'c']
+    assert mask_key('abcdefghijklmnop') == 'abcd...mnop'
+    assert mask_key('short') == '...'
+
+
+def test_quota_exhausted() -> None:
+    assert quota_exhausted(429)
+    assert quota_exhausted(403, '{"error": "Monthly quota exceeded"}')
+    assert not quota_exhausted(403, '{"error": "Invalid API key"}')
+    assert not quota_exhausted(200)
+
+
+@pytest.mark.parametrize('mode', ['sync', 'async'])
+def test_keys_are_used_in_turn(mode: str, mock_server: Callable[..., Any], set_env: Callable[..., None]) -> None:
+    server = mock_server(key_quota=100)
+    set_env(SPYCLOUD_API_ATO_KEY=','.join(KEYS))
+
+    assert _search(mode, 9) == [200] * 9
+    assert server.keys == {key: 3 for key in KEYS}
+    assert [stats['uses'] for stats in key_pools()['SPYCLOUD_API_ATO_KEY'].stats()] == [3, 3, 3]
+
+
+@pytest.mark.parametrize('mode', ['sync', 'async'])
+def test_spent_key_is_benched_and_the_call_moves_on(mode: str, mock_server: Callable[..., Any],
+                                                    set_env: Callable[..., None]) -> None:
+    server = mock_server(key_quota=2, retry_after=30)
+    set_env(SPYCLOUD_API_ATO_KEY=','.join(KEYS))
+    # The first key has already used up its quota elsewhere
+    server.count_key('key-one')
+    server.count_key('key-one')
+
+    assert _search(mode, 4) == [200] * 4
+    # Its one 429 sent the first call straight on to the next key, and it sat out the rest
+    assert server.keys == {'key-one': 3, 'key-two': 2, 'key-three': 2}
+    assert server.stats['rate_limited'] == 1
+
+    pool: KeyPool = key_pools()['SPYCLOUD_API_ATO_KEY']
+    assert pool.available() == 2
+    benched_for: List[float] = [stats['benched_for'] for stats in pool.stats()]
+    assert 25 < benched_for[0] <= 30 and benched_for[1:] == [0.0, 0.0]
+
+
+def test_cancelled_calls_give_their_keys_back(mock_server: Callable[..., Any], set_env: Callable[..., None]) -> None:
+    mock_server()
+    set_env(SPYCLOUD_API_ATO_KEY='key-one,key-two', PPP_RATELIMIT_SPYCLOUD='1/s:1', PPP_KEY_STRATEGY='least_used')
+
+    async def searches() -> int:
+        timeouts: int = 0
+        for number in range(5):
+            try:
+                await asyncio.wait_for(async_spycloud_ato_search('email', f'user{number}@example.com'), 0.05)
+            except asyncio.TimeoutError:
+                timeouts += 1
+        return timeouts
+
+    # Each key has one token to start with, so at least three calls time out waiting for one
+    assert asyncio.run(searches()) >= 3
+    assert [stats['in_flight'] for stats in key_pools()['SPYCLOUD_API_ATO_KEY'].stats()] == [0, 0]
+
+
+def test_single_key_has_no_pool(mock_server: Callable[..., Any]) -> None:
+    mock_server()
+    assert _search('sync', 1) == [200]
+    assert 'SPYCLOUD_API_ATO_KEY' not in key_pools()
+
+
+def test_pool_rejects_bad_settings() -> None:
+    with pytest.raises(ValueError):
+        KeyPool('X_KEY', [], 'header', 'x-api-key')
+    with pytest.raises(ValueError):
+        KeyPool('X_KEY', KEYS, 'basic')
+    with pytest.raises(ValueError):
+        KeyPool('X_KEY', KEYS, 'header', 'x-api-key', strategy='random')
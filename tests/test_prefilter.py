@@ -0,0 +1,38 @@
+import pytest
+from ppp_connectors.prefilter import Prefilter, async_skipped_response, normalize_indicator, skipped_response
+from ppp_connectors.retry import RetryStats
+
+
+@pytest.mark.parametrize('indicator, host', [
+    ('https://WWW.Example.com:8443/path', 'www.example.com'),
+    ('example.com:443/login', 'example.com'),
+    ('*.example.com', 'example.com'),
+    ('.example.com', 'example.com'),
+    ('10.0.0.1:8080', '10.0.0.1'),
+    ('::1', '::1'),
+    ('[::1]', '::1'),
+    ('[::1]:443', '::1'),
+    ('[2001:DB8::1]/path', '2001:db8::1'),
+    ('http://[::1]/', '::1'),
+    ('https://[2001:db8::1]:8443/x', '2001:db8::1'),
+])
+def test_normalize_indicator(indicator: str, host: str) -> None:
+    assert normalize_indicator(indicator) == host
+
+
+@pytest.mark.parametrize('bloom', [False, True])
+def test_bracketed_ipv6_entries_match_every_form(bloom: bool) -> None:
+    prefilter: Prefilter = Prefilter(['[::1]', '[2001:db8::1]:443', 'example.com'], bloom=bloom)
+
+    for indicator in ('::1', '[::1]', 'http://[::1]/', 'https://[2001:db8::1]/a', '2001:db8::1',
+                      'sub.example.com'):
+        assert prefilter.matches(indicator), indicator
+    assert not prefilter.matches('::2')
+
+
+def test_skipped_responses_carry_retry_stats() -> None:
+    url: str = 'https://urlscan.io/api/v1/search/'
+    for response in (skipped_response(url, 'example.com'), async_skipped_response('get', url, 'example.com')):
+        assert response.skipped and not response.from_cache
+        assert response.json() == {'skipped': True, 'reason': 'prefilter', 'indicator': 'example.com'}
+        assert response.retry_stats == RetryStats(0, 0.0)
@@ -0,0 +1,68 @@
+import json
+import random
+from typing import Any, Iterator, List
+import pytest
+from ppp_connectors.results import iter_json_array
+
+
+def _chunks(data: bytes, sizes: List[int]) -> Iterator[bytes]:
+    position: int = 0
+    for size in sizes:
+        yield data[position:position + size]
+        position += size
+    yield data[position:]
+
+
+def _random_value(rng: random.Random, depth: int = 0) -> Any:
+    kind: int = rng.randrange(8 if depth < 2 else 5)
+    if kind == 0:
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rng.choice([1.5, -0.25, 1e-7, 3.25e10, -2.5E+3, 0.0])
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind == 3:
+        return rng.choice(['', 'plain', 'quote " and \\ slash', 'brackets ] [ } {', 'ünïcödé ✓', '\n\t'])
+    if kind == 4:
+        return rng.randint(0, 9)
+    if kind == 5:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f'k{index}': _random_value(rng, depth + 1) for index in range(rng.randrange(4))}
+
+
+def test_fuzzed_chunk_boundaries() -> None:
+    rng: random.Random = random.Random(1234)
+    for _ in range(3000):
+        items: List[Any] = [_random_value(rng) for _ in range(rng.randrange(6))]
+        document: Any = {'total': rng.randint(0, 99), 'meta': {'results': [1]}, 'results': items, 'after': [2]}
+        separators = (', ', ': ') if rng.random() < 0.5 else (',', ':')
+        data: bytes = json.dumps(document, ensure_ascii=rng.random() < 0.5, separators=separators).encode()
+        sizes: List[int] = [rng.randint(1, 8) for _ in range(len(data))]
+
+        assert list(iter_json_array(_chunks(data, sizes))) == items, data
+
+
+@pytest.mark.parametrize('text', ['1.5', '-12', '1e5', '-2.5E-3', '12345', '0.125'])
+def test_numbers_split_at_every_offset(text: str) -> None:
+    data: bytes = f'{{"results": [{text}, {text}]}}'.encode()
+    expected: List[Any] = [json.loads(text)] * 2
+    for cut in range(1, len(data)):
+        assert list(iter_json_array([data[:cut], data[cut:]])) == expected, cut
+
+
+def test_one_byte_chunks() -> None:
+    data: bytes = json.dumps({'results': [{'a': '✓ "x"'}, [1, 2.5], None, -7, 'y']}).encode()
+    assert list(iter_json_array(data[index:index + 1] for index in range(len(data)))) == \
+        [{'a': '✓ "x"'}, [1, 2.5], None, -7, 'y']
+
+
+def test_other_key_and_stopping_early() -> None:
+    data: bytes = b'{"results": [0], "hits": [{"n": 1}, {"n": 2}], "tail": '
+    assert list(iter_json_array([data], key='hits')) == [{'n': 1}, {'n': 2}]
+
+
+def test_truncated_document_raises() -> None:
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"results": [1, 2']))
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"results": [1, 2.']))
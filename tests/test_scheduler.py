@@ -0,0 +1,142 @@
+import asyncio
+import signal
+import threading
+import time
+from typing import Any, Callable, List
+import pytest
+from ppp_connectors import scheduler
+from ppp_connectors.batch import batch_lookup
+from ppp_connectors.ratelimit import TokenBucket
+from ppp_connectors.scheduler import FairQueue, current_priority, get_queue, priority, priority_weights, \
+    scheduler_stats
+from ppp_connectors.spycloud import spycloud_ato_search
+
+
+def _drained(rate: float) -> TokenBucket:
+    bucket: TokenBucket = TokenBucket(rate, 1)
+    bucket.try_acquire()
+    return bucket
+
+
+def _wait_for_depth(queue: FairQueue, name: str, depth: int) -> None:
+    deadline: float = time.monotonic() + 5
+    while queue.stats().get(name, {}).get('queued', 0) < depth and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_priority_classes(set_env: Callable[..., None]) -> None:
+    assert current_priority() == 'normal'
+    with priority('Interactive'):
+        assert current_priority() == 'interactive'
+        with priority('bulk'):
+            assert current_priority() == 'bulk'
+        assert current_priority() == 'interactive'
+
+    set_env(PPP_PRIORITY='bulk')
+    assert current_priority() == 'bulk'
+
+    with pytest.raises(ValueError):
+        with priority('urgent'):
+            pass
+
+
+def test_priority_weights(set_env: Callable[..., None]) -> None:
+    assert priority_weights() == {'interactive': 16.0, 'normal': 4.0, 'bulk': 1.0}
+
+    set_env(PPP_PRIORITY_WEIGHTS='urgent=8, batch=0.5')
+    assert priority_weights() == {'urgent': 8.0, 'batch': 0.5}
+
+    set_env(PPP_PRIORITY_WEIGHTS='urgent=0')
+    with pytest.raises(ValueError):
+        priority_weights()
+
+
+def test_interactive_calls_overtake_queued_bulk_calls() -> None:
+    bucket: TokenBucket = _drained(40)
+    queue: FairQueue = get_queue(bucket, 'TEST')
+    order: List[str] = []
+    order_lock: threading.Lock = threading.Lock()
+
+    def call(name: str) -> None:
+        with priority(name):
+            scheduler.acquire(bucket, 'TEST')
+        with order_lock:
+            order.append(name)
+
+    threads: List[threading.Thread] = []
+    for name, count in (('bulk', 12), ('interactive', 4)):
+        for _ in range(count):
+            threads.append(threading.Thread(target=call, args=(name,)))
+            threads[-1].start()
+        _wait_for_depth(queue, name, count)
+    for thread in threads:
+        thread.join(10)
+
+    assert sorted(order) == ['bulk'] * 12 + ['interactive'] * 4
+    # The interactive calls queued last, but only a bulk call or two goes ahead of them
+    assert max(index for index, name in enumerate(order) if name == 'interactive') < 7
+
+    stats = queue.stats()
+    assert (stats['bulk']['granted'], stats['interactive']['granted']) == (12, 4)
+    assert stats['interactive']['max_wait_seconds'] < stats['bulk']['max_wait_seconds']
+
+
+def test_cancelled_coroutine_gives_up_its_place() -> None:
+    bucket: TokenBucket = _drained(10)
+    queue: FairQueue = get_queue(bucket, 'TEST')
+
+    async def run() -> float:
+        with priority('bulk'):
+            cancelled: asyncio.Task = asyncio.ensure_future(scheduler.async_acquire(bucket, 'TEST'))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            started: float = time.monotonic()
+            await scheduler.async_acquire(bucket, 'TEST')
+            return time.monotonic() - started
+
+    waited: float = asyncio.run(run())
+
+    # The cancelled call's token went to the next one, one refill later rather than two
+    assert waited < 0.18
+    assert queue.stats()['bulk'] == {'queued': 0, 'granted': 1, 'wait_seconds': pytest.approx(waited, abs=0.05),
+                                     'max_wait_seconds': pytest.approx(waited, abs=0.05)}
+
+
+def test_interrupted_thread_gives_up_its_place() -> None:
+    bucket: TokenBucket = _drained(10)
+    queue: FairQueue = get_queue(bucket, 'TEST')
+
+    threading.Timer(0.02, signal.pthread_kill, (threading.main_thread().ident, signal.SIGINT)).start()
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.acquire(bucket, 'TEST')
+    assert queue.stats()['normal']['queued'] == 0
+
+    scheduler.acquire(bucket, 'TEST')
+    assert queue.stats()['normal']['granted'] == 1
+
+
+def test_scheduler_can_be_turned_off(set_env: Callable[..., None]) -> None:
+    set_env(PPP_SCHEDULER='false')
+    bucket: TokenBucket = TokenBucket(1000)
+
+    scheduler.acquire(bucket, 'UNSCHEDULED')
+    assert 'UNSCHEDULED' not in scheduler_stats()
+
+
+def test_brokers_report_calls_by_class(mock_server: Callable[..., Any], set_env: Callable[..., None]) -> None:
+    mock_server()
+    set_env(PPP_RATELIMIT_SPYCLOUD='200/s:1')
+    emails: List[str] = [f'user{number}@example.com' for number in range(20)]
+    # Queues from earlier tests may still be alive, so count from here
+    before = scheduler_stats().get('SPYCLOUD', {})
+
+    with priority('bulk'):
+        results = list(batch_lookup(spycloud_ato_search, emails, 'email', concurrency=8))
+    spycloud_ato_search('email', 'one@example.com')
+
+    assert all(result.ok for result in results)
+    stats = scheduler_stats()['SPYCLOUD']
+    granted: List[int] = [stats[name]['granted'] - before.get(name, {}).get('granted', 0)
+                          for name in ('bulk', 'normal')]
+    assert granted == [20, 1]
+    assert stats['bulk']['queued'] == 0
@@ -0,0 +1,61 @@
+import asyncio
+from typing import Any, Callable
+import httpx
+import pytest
+import requests
+from ppp_connectors.async_broker import async_make_request, get_client
+from ppp_connectors.broker import close_sessions, make_request
+
+CATALOG: str = 'https://api.spycloud.io/sp-v2/breach/catalog'
+REDIRECT: str = 'https://api.spycloud.io/__redirect?to=/sp-v2/breach/catalog'
+SYNC_TRANSPORTS = ['requests', 'httpx', 'http2']
+
+
+@pytest.fixture(autouse=True)
+def close_pools() -> None:
+    yield
+    close_sessions()
+
+
+def test_async_client_matches_the_sync_defaults() -> None:
+    async def settings() -> Any:
+        client: httpx.AsyncClient = get_client()
+        return client.timeout, client.follow_redirects
+
+    timeout, follow_redirects = asyncio.run(settings())
+    assert timeout == httpx.Timeout(None)
+    assert follow_redirects
+
+
+@pytest.mark.parametrize('transport', SYNC_TRANSPORTS)
+def test_slow_responses_are_waited_for(mock_server: Callable[..., Any], set_env: Callable[..., None],
+                                       transport: str) -> None:
+    mock_server(latency_ms=300)
+    set_env(PPP_HTTP_TRANSPORT=transport)
+
+    assert make_request('get', CATALOG).status_code == 200
+    assert asyncio.run(async_make_request('get', CATALOG)).status_code == 200
+
+
+@pytest.mark.parametrize('transport', SYNC_TRANSPORTS)
+def test_timeout_setting_applies_to_every_broker(mock_server: Callable[..., Any], set_env: Callable[..., None],
+                                                 transport: str) -> None:
+    mock_server(latency_ms=500)
+    set_env(PPP_HTTP_TRANSPORT=transport, PPP_TIMEOUT='0.1')
+
+    with pytest.raises(requests.Timeout):
+        make_request('get', CATALOG)
+    with pytest.raises(httpx.TimeoutException):
+        asyncio.run(async_make_request('get', CATALOG))
+
+
+@pytest.mark.parametrize('transport', SYNC_TRANSPORTS)
+def test_redirects_are_followed_by_every_broker(mock_server: Callable[..., Any], set_env: Callable[..., None],
+                                                transport: str) -> None:
+    mock_server()
+    set_env(PPP_HTTP_TRANSPORT=transport)
+
+    sync_response = make_request('get', REDIRECT)
+    async_response = asyncio.run(async_make_request('get', REDIRECT))
+    assert sync_response.status_code == async_response.status_code == 200
+    assert sync_response.json() == async_response.json()
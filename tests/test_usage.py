@@ -0,0 +1,83 @@
+from datetime import date, timedelta
+from typing import Any, Callable, List
+import pytest
+from ppp_connectors import usage
+from ppp_connectors.usage import SyncReport, UsageStore, day_ranges
+
+TODAY: date = date(2026, 3, 15)
+
+
+@pytest.fixture
+def store(tmp_path: Any, mock_server: Callable[..., Any], monkeypatch: pytest.MonkeyPatch) -> UsageStore:
+    monkeypatch.setattr(usage, '_today', lambda: TODAY)
+    store = UsageStore(str(tmp_path / 'usage.db'), recheck_days=3)
+    yield store
+    store.close()
+
+
+def _requests(server: Any) -> int:
+    return server.stats['requests']
+
+
+def test_day_ranges() -> None:
+    days: List[date] = [date(2026, 1, 1), date(2026, 1, 2), date(2026, 1, 4), date(2026, 1, 6), date(2026, 1, 7)]
+    assert list(day_ranges(days)) == [(date(2026, 1, 1), date(2026, 1, 2)), (date(2026, 1, 4), date(2026, 1, 4)),
+                                      (date(2026, 1, 6), date(2026, 1, 7))]
+
+
+def test_sync_only_downloads_missing_and_recent_days(store: UsageStore, mock_server: Callable[..., Any]) -> None:
+    server = mock_server(page_size=50)
+
+    first: SyncReport = store.sync(TODAY - timedelta(days=99))
+    assert (first.days_fetched, first.days_skipped, first.records) == (100, 0, 300)
+    # 300 records at the endpoint's 1000 a page
+    assert _requests(server) == 1
+
+    again: SyncReport = store.sync(TODAY - timedelta(days=99))
+    assert (again.days_fetched, again.days_skipped) == (4, 96)
+    assert _requests(server) == 2
+
+    # A gap in the middle is fetched on its own
+    store.sync(TODAY - timedelta(days=200), TODAY - timedelta(days=150))
+    wider: SyncReport = store.sync(TODAY - timedelta(days=200))
+    assert (wider.days_fetched, wider.days_skipped) == (50 + 4, 201 - 54)
+
+
+def test_future_days_are_not_marked_synced(store: UsageStore, mock_server: Callable[..., Any],
+                                           monkeypatch: pytest.MonkeyPatch) -> None:
+    mock_server()
+
+    report: SyncReport = store.sync(TODAY - timedelta(days=2), TODAY + timedelta(days=10))
+    assert report.days_fetched == 3
+    # Today isn't over, so only the two days before it are done
+    assert store.synced_days() == [(TODAY - timedelta(days=offset)).isoformat() for offset in (2, 1)]
+
+    later: date = TODAY + timedelta(days=8)
+    monkeypatch.setattr(usage, '_today', lambda: later)
+    report = store.sync(TODAY - timedelta(days=2), TODAY + timedelta(days=10))
+    # Everything from the first sync's today up to the new today is downloaded
+    assert (report.days_fetched, report.days_skipped) == (9, 2)
+
+
+def test_backwards_range_raises(store: UsageStore) -> None:
+    with pytest.raises(ValueError):
+        store.sync('2026-02-02', '2026-02-01')
+
+
+def test_rollups(store: UsageStore, mock_server: Callable[..., Any]) -> None:
+    mock_server()
+    store.sync('2026-01-30', '2026-02-02')
+
+    by_category = store.rollup()
+    assert [row['category'] for row in by_category] == ['calls', 'phonenumbers', 'sms']
+    # The stub counts a day's calls as its day of the month
+    assert by_category[0]['count'] == 30 + 31 + 1 + 2
+
+    by_month = store.rollup('month', categories=['calls'])
+    assert [(row['month'], row['count']) for row in by_month] == [('2026-01', 61), ('2026-02', 3)]
+
+    total = store.rollup((), start_date='2026-02-01')
+    assert total[0]['price'] == pytest.approx(sum((day + offset) * 0.01 for day in (1, 2) for offset in range(3)))
+
+    with pytest.raises(ValueError):
+        store.rollup('week')